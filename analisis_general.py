@@ -1,64 +1,186 @@
 import os
+import re
+import csv
+import time
+import logging
+from collections import deque
+from itertools import islice
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
 
+from cache_extraccion import abrir_cache, cerrar_cache, buscar_en_cache, actualizar_cache, podar_cache
+from extractores import BACKEND_POR_DEFECTO, backend_configurado, backend_disponible, extraer_texto
+from indice_resultado import construir_indice, leer_bloque
+from metricas import cronometro, incrementar, observar
+from escaneo import es_pdf, listar_pdfs
+from clave_factura import CAMPOS_CLAVE, extraer_clave, clave_de_fila, completar_clave, desde_nombre
 
-def leer_pdfs_y_guardar_txt(prueba_path: str = 'Facturas', salida_nombre: str = 'resultado.txt') -> str:
-	"""Recorre la carpeta `prueba_path`, extrae texto de cada archivo PDF y guarda
-	la salida concatenada en `<prueba_path>/<salida_nombre>`.
 
-	Retorna la ruta del archivo generado.
+log = logging.getLogger(__name__)
+
+# PDFs en vuelo entre el pool de extracción y el consumidor (por proceso del pool)
+PDFS_EN_VUELO_POR_WORKER = 2
+
+
+def _extraer_seguro(path: str, backend: str = BACKEND_POR_DEFECTO) -> tuple:
+	"""Ejecuta el extractor sin propagar excepciones (apto para procesos worker).
+
+	Retorna `(texto, None, segundos)` si tuvo éxito o `(None, mensaje_error,
+	segundos)` si falló, donde `segundos` es la duración de la extracción.
+	"""
+	t0 = time.perf_counter()
+	try:
+		return extraer_texto(path, backend), None, time.perf_counter() - t0
+	except Exception as e:
+		return None, str(e), time.perf_counter() - t0
+
+
+def contenido_bloque(pdf_file: str, texto: Optional[str], error: Optional[str] = None) -> str:
+	"""Texto que sigue al separador `----- pdf_file -----` en `resultado.txt`:
+	el texto extraído, o el mensaje de error / vacío correspondiente.
+	"""
+	if error is not None:
+		return f"ERROR al procesar {pdf_file}: {error}\n"
+	if not texto:
+		return "(No se extrajo texto o está vacío)\n"
+	return texto if texto.endswith('\n') else texto + '\n'
+
+
+def escribir_bloque(out_f, pdf_file: str, texto: Optional[str], error: Optional[str] = None) -> None:
+	"""Escribe en `out_f` el bloque `----- pdf_file -----` con su texto o mensaje de error."""
+	out_f.write(f"\n----- {pdf_file} -----\n")
+	out_f.write(contenido_bloque(pdf_file, texto, error))
+
+
+def iterar_textos_pdf(prueba_path: str = 'Facturas', usar_cache: bool = True, workers: int = 1, backend: Optional[str] = None, solo_archivos: Optional[list] = None):
+	"""Generador que extrae los PDFs de `prueba_path` y produce `(pdf_file, contenido)`
+	en orden alfabético, donde `contenido` es exactamente lo que se escribe en
+	`resultado.txt` tras el separador del archivo (ver `contenido_bloque`).
+
+	Con `usar_cache` (por defecto) solo se extraen los PDFs nuevos o modificados;
+	el resto se toma de la caché de `cache_extraccion`.
+
+	Con `workers > 1` la extracción se reparte en un pool de procesos; el orden
+	de salida es el mismo que en modo secuencial y un PDF que falla produce su
+	mensaje `ERROR al procesar` sin detener el resto. Solo hay
+	`PDFS_EN_VUELO_POR_WORKER * workers` PDFs enviados por delante del que se
+	está consumiendo, así que la memoria no crece con la carpeta.
+
+	`backend` elige la librería de extracción (ver `extractores`); por defecto
+	se usa la configurada en `EXTRACTOR_PDF` o `pypdf`.
+
+	Si se indica `solo_archivos`, solo se procesan esos PDFs de la carpeta
+	(los que no existan se ignoran). En ese caso no se lista la carpeta ni se
+	poda la caché: el costo depende solo de esos PDFs.
+
+	Se recorren también las subcarpetas (ver `escaneo`); cada PDF se
+	identifica por su ruta relativa, p.ej. `2024/11/<archivo>.pdf`.
 	"""
 	# Buscar archivos PDF (extensiones .pdf, mayúsc/minúsc)
 	if not os.path.isdir(prueba_path):
 		raise FileNotFoundError(f"La carpeta especificada no existe: {prueba_path}")
 
-	pdf_files = [f for f in os.listdir(prueba_path) if f.lower().endswith('.pdf')]
-	salida_path = os.path.join(prueba_path, salida_nombre)
-	# Usaremos únicamente `pypdf` (PdfReader) de forma minimalista
+	if solo_archivos is not None:
+		# Como al listar la carpeta: solo PDFs que existen dentro de ella
+		pdf_files = sorted({f for f in solo_archivos
+		                    if es_pdf(f) and not os.path.isabs(f) and '..' not in f.split('/')
+		                    and os.path.isfile(os.path.join(prueba_path, f))})
+	else:
+		pdf_files = listar_pdfs(prueba_path)
+	backend = backend or backend_configurado()
+	# Si la librería del backend no está instalada, se producirá un mensaje de error por archivo
+	hay_extractor = backend_disponible(backend)
+
+	cache = abrir_cache(prueba_path) if usar_cache else None
+	pool = None
 	try:
-		from pypdf import PdfReader
+		if cache is not None and solo_archivos is None:
+			podar_cache(cache, pdf_files)
+
+		usar_pool = workers > 1 and len(pdf_files) > 1 and hay_extractor
+
+		def preparar(pdf_file):
+			"""`(texto_cacheado, futuro)` de `pdf_file`. Sin pool el futuro es None
+			y el PDF se extrae recién al consumirlo."""
+			nonlocal pool
+			ruta = os.path.join(prueba_path, pdf_file)
+			texto = buscar_en_cache(cache, ruta, pdf_file, backend) if cache is not None else None
+			if texto is not None or not usar_pool:
+				return texto, None
+			if pool is None:
+				# Solo si hay algo que extraer
+				pool = ProcessPoolExecutor(max_workers=workers)
+			return None, pool.submit(_extraer_seguro, ruta, backend)
+
+		# Con pool, hasta `PDFS_EN_VUELO_POR_WORKER * workers` PDFs por delante del
+		# consumidor: el pool no se queda sin trabajo y los textos extraídos que
+		# esperan en memoria quedan acotados
+		limite = PDFS_EN_VUELO_POR_WORKER * workers if usar_pool else 1
+		ventana = deque()
+		siguientes = iter(pdf_files)
+		while True:
+			for pdf_file in islice(siguientes, limite - len(ventana)):
+				ventana.append((pdf_file, *preparar(pdf_file)))
+			if not ventana:
+				break
+			# Los resultados se consumen en el mismo orden alfabético en que se encolaron
+			pdf_file, texto, futuro = ventana.popleft()
+			ruta = os.path.join(prueba_path, pdf_file)
 
-		def extractor(path: str) -> str:
-			texts = []
-			reader = PdfReader(path)
-			for page in reader.pages:
+			if texto is not None:
+				error = None
+				incrementar('etl_pdfs_total', resultado='cache')
+			elif not hay_extractor:
+				incrementar('etl_pdfs_total', resultado='error')
+				yield pdf_file, "ERROR: No hay librería disponible para extraer texto de PDFs.\n"
+				continue
+			else:
 				try:
-					t = page.extract_text() or ''
-				except Exception:
-					t = ''
-				texts.append(t)
-			return "\n".join(texts)
-	except Exception as e:
-		# Si no está instalada, dejar extractor como None y se escribirá un error en el archivo
-		extractor = None
+					texto, error, segundos = futuro.result() if futuro is not None else _extraer_seguro(ruta, backend)
+					observar('etl_pdf_extraccion_segundos', segundos)
+				except Exception as e:
+					# p.ej. el proceso worker murió (BrokenProcessPool)
+					texto, error = None, str(e)
+				incrementar('etl_pdfs_total', resultado='ok' if error is None else 'error')
+				if error is None and cache is not None:
+					actualizar_cache(cache, ruta, pdf_file, texto, backend)
+
+			yield pdf_file, contenido_bloque(pdf_file, texto, error)
+	finally:
+		if pool is not None:
+			pool.shutdown(cancel_futures=True)
+		if cache is not None:
+			cerrar_cache(cache)
+
+
+def leer_pdfs_y_guardar_txt(prueba_path: str = 'Facturas', salida_nombre: str = 'resultado.txt', usar_cache: bool = True, workers: int = 1, backend: Optional[str] = None) -> str:
+	"""Recorre la carpeta `prueba_path`, extrae texto de cada archivo PDF y guarda
+	la salida concatenada en `<prueba_path>/<salida_nombre>`.
 
-	# Abrir archivo de salida y escribir resultados
-	with open(salida_path, 'w', encoding='utf-8') as out_f:
-		if not pdf_files:
-			out_f.write(f"No se encontraron archivos PDF en '{prueba_path}'.\n")
-			return salida_path
+	Los parámetros `usar_cache`, `workers` y `backend` se describen en
+	`iterar_textos_pdf`. El archivo generado es idéntico con cualquier
+	cantidad de workers.
 
-		for pdf_file in sorted(pdf_files):
-			ruta = os.path.join(prueba_path, pdf_file)
+	Retorna la ruta del archivo generado.
+	"""
+	textos = iterar_textos_pdf(prueba_path, usar_cache=usar_cache, workers=workers, backend=backend)
+	salida_path = os.path.join(prueba_path, salida_nombre)
+
+	# Abrir archivo de salida y escribir resultados
+	with cronometro('extraccion'), open(salida_path, 'w', encoding='utf-8') as out_f:
+		vacio = True
+		for pdf_file, contenido in textos:
+			vacio = False
 			out_f.write(f"\n----- {pdf_file} -----\n")
-			if extractor is None:
-				out_f.write("ERROR: No hay librería disponible para extraer texto de PDFs.\n")
-				continue
+			out_f.write(contenido)
+		if vacio:
+			out_f.write(f"No se encontraron archivos PDF en '{prueba_path}'.\n")
 
-			try:
-				texto = extractor(ruta)
-				if not texto:
-					out_f.write("(No se extrajo texto o está vacío)\n")
-				else:
-					out_f.write(texto)
-					if not texto.endswith('\n'):
-						out_f.write('\n')
-			except Exception as e:
-				out_f.write(f"ERROR al procesar {pdf_file}: {e}\n")
+	# Índice sidecar (filename -> offset/longitud) para releer una sola factura
+	construir_indice(salida_path)
 
 	return salida_path
 
-
 if __name__ == '__main__':
 	try:
 		ruta = leer_pdfs_y_guardar_txt('Facturas')
@@ -67,309 +189,362 @@ if __name__ == '__main__':
 		print(f"Error: {ex}")
 
 
-def parse_resultado_y_guardar_csv(prueba_path: str = 'Facturas', txt_nombre: str = 'resultado.txt', csv_nombre: str = 'datos_generales.csv') -> str:
-	"""Lee `prueba_path/txt_nombre`, extrae campos claves por factura y escribe un CSV
-
-	Campos: `filename, Nombre, Fecha, Gas, credito, Total, Consumo_m3`.
-	La función es heurística y trata de ser robusta ante pequeñas variaciones.
-	Retorna la ruta del CSV generado.
-	"""
-	import re
-	import csv
-
-	txt_path = os.path.join(prueba_path, txt_nombre)
-	csv_path = os.path.join(prueba_path, csv_nombre)
+# Separador de bloques en resultado.txt: ----- filename.pdf -----
+separador_re = re.compile(r'^-----\s*(.+?)\s*-----\s*$', flags=re.MULTILINE)
 
-	if not os.path.isfile(txt_path):
-		raise FileNotFoundError(f"No existe el archivo de texto: {txt_path}")
 
-	with open(txt_path, 'r', encoding='utf-8') as f:
-		full = f.read()
-
-	# Buscar secciones delimitadas por: ----- filename.pdf -----
-	matches = list(re.finditer(r'^-----\s*(.+?)\s*-----\s*$', full, flags=re.MULTILINE))
-	entries = []
+def dividir_bloques(full: str) -> list:
+	"""Divide el texto consolidado en una lista de `(filename, bloque)`.
 
+	Si no hay separadores, todo el texto se trata como una sola factura
+	(`filename` None).
+	"""
+	matches = list(separador_re.finditer(full))
 	if not matches:
-		# Si no hay separadores, tratar todo como una sola factura
-		blocks = [(None, full)]
-	else:
-		blocks = []
-		for i, m in enumerate(matches):
-			name = m.group(1).strip()
-			start = m.end()
-			end = matches[i+1].start() if i+1 < len(matches) else len(full)
-			block = full[start:end].strip()
-			blocks.append((name, block))
-	
-	print(f"DEBUG: Encontrados {len(matches)} matches y {len(blocks)} bloques.")
-
-
-
-	# Helpers
-	def clean_amount(a: str) -> str:
-		# normaliza '$ 26,815' -> '26815' (solo dígitos)
-		s = re.sub(r'[^0-9]', '', a)
-		return s
-
-	# detecta montos como $26,815 o $ 26.815
-	amount_re = re.compile(r'\$\s*[\d\.,]+')
-	date_re = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
-	standalone_int_re = re.compile(r'^\s*(\d{1,5})\s*$')
-	total_keywords_re = re.compile(r'\b(total|valor a pagar|a pagar|valor a pagar:|importe)\b', re.IGNORECASE)
-	# nombre: línea con mayúsculas, varias palabras, sin números, sin símbolos, sin palabras genéricas
-	nombre_re = re.compile(r'^[A-ZÁÉÍÓÚÑ ]{8,}$')
-	avoid_words = {'AL DÍA', 'FECHA', 'PAGO', 'SUSPENCIÓN', 'INMEDIATO', 'NO HAY NADA', 'IMPORTE', 'VALOR', 'DIRECCI', 'LOCALIDAD', 'ASUNTO', 'CARTAGENA', 'ESTIMADO', 'CONEXION', 'RESIDENCIAL', 'ESTRATO', 'KR', 'CL', 'BOTERO', 'SAN ROQUE', 'SINCELEJO', 'CREDITO', 'OTROS', 'CONSUMO', 'RECUPERADO', 'FACTURADO', 'MES', 'PRO', 'SEGURIDAD', 'VIDA', 'SUBSIDIO', 'INTERES', 'BRILLA', 'PLUS', 'UNIDAD', 'CLIENTE', 'ESTRATO', 'DIRECCIYN', 'LOCALIDAD', 'ASUNTO', 'RECUPERACI', 'CONSUMO', 'PERIODOS', 'ANTERIORES', 'USUARIO', 'FACTURA', 'ANEXA', 'COMUNICACI', 'INVESTIGACI', 'FACTURACIYN', 'KIT', 'NOMBRE', 'CONTRATO', 'DIRECCION', 'LOCALIDAD', 'ASUNTO', 'RECUPERACION', 'CONSUMO', 'PERIODOS', 'ANTERIORES', 'USUARIO', 'FACTURA', 'ANEXA', 'COMUNICACION', 'INVESTIGACION', 'FACTURACION', 'KIT'}
-	# para separar nombre de fecha si están juntos
-	fecha_re = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
-
-	for filename, block in blocks:
-		print(f"DEBUG: Procesando {filename}")
-		# normalizar espacios no-break y limpiar bloque
-
-		block = block.replace('\xa0', ' ') if isinstance(block, str) else block
-		lines = [ln.strip() for ln in block.splitlines() if ln.strip()!='']
-		# Busca Nombre: primera línea con letras (mínimo dos palabras) en las primeras 10 líneas
-		nombre = ''
-		fecha = ''
-		gas = ''
-		credito = ''
-		total = ''
-		consumo = ''
-
-
-		# Nombre heurístico mejorado
-		nombre = ''
-		# 1. Buscar línea con mayúsculas, varias palabras, sin números ni símbolos, sin palabras genéricas
-		for ln in lines[:16]:
-			ln_clean = ln.strip().replace('  ', ' ')
-			ln_upper = ln_clean.upper()
-			if (
-				len(ln_clean.split()) >= 2
-				and not any(ch.isdigit() for ch in ln_clean)
-				and not any(sym in ln_clean for sym in '"$%/.:,;')
-				and nombre_re.match(ln_upper)
-				and not any(w in ln_upper for w in avoid_words)
-			):
-				nombre = ln_clean
-				break
-
-		# 2. Si no se encontró, buscar línea con mínimo dos palabras, sin números, sin símbolos, y sin palabras genéricas
-		if not nombre:
-			for ln in lines[:16]:
-				ln_clean = ln.strip().replace('  ', ' ')
-				ln_upper = ln_clean.upper()
-				if (
-					len(ln_clean.split()) >= 2
-					and not any(ch.isdigit() for ch in ln_clean)
-					and not any(sym in ln_clean for sym in '"$%/.:,;')
-					and not any(w in ln_upper for w in avoid_words)
-				):
-					nombre = ln_clean
-					break
-
-		# 3. Si el nombre contiene una fecha al final, separarla
-		if nombre:
-			m = fecha_re.search(nombre)
-			if m:
-				nombre = nombre[:m.start()].strip()
-
-		# 4. Si sigue sin nombre, buscar línea con mínimo dos palabras, sin números, aunque tenga símbolos
-		if not nombre:
-			for ln in lines[:20]:
-				ln_clean = ln.strip().replace('  ', ' ')
-				ln_upper = ln_clean.upper()
-				if (
-					len(ln_clean.split()) >= 2
-					and not any(ch.isdigit() for ch in ln_clean)
-					and not any(w in ln_upper for w in avoid_words)
-				):
-					nombre = ln_clean
-					break
-
-		# 5. Si sigue sin nombre, fallback: primera línea con mínimo dos palabras
-		if not nombre:
-			for ln in lines[:20]:
-				ln_clean = ln.strip().replace('  ', ' ')
-				if len(ln_clean.split()) >= 2:
-					nombre = ln_clean
-					break
+		return [(None, full)]
+
+	blocks = []
+	for i, m in enumerate(matches):
+		name = m.group(1).strip()
+		start = m.end()
+		end = matches[i+1].start() if i+1 < len(matches) else len(full)
+		block = full[start:end].strip()
+		blocks.append((name, block))
+	return blocks
+
+
+# Helpers
+def clean_amount(a: str) -> str:
+	# normaliza '$ 26,815' -> '26815' (solo dígitos)
+	s = re.sub(r'[^0-9]', '', a)
+	return s
+
+# detecta montos como $26,815 o $ 26.815
+amount_re = re.compile(r'\$\s*[\d\.,]+')
+date_re = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
+standalone_int_re = re.compile(r'^\s*(\d{1,5})\s*$')
+total_keywords_re = re.compile(r'\b(total|valor a pagar|a pagar|valor a pagar:|importe)\b', re.IGNORECASE)
+# nombre: línea con mayúsculas, varias palabras, sin números, sin símbolos, sin palabras genéricas
+nombre_re = re.compile(r'^[A-ZÁÉÍÓÚÑ ]{8,}$')
+avoid_words = {'AL DÍA', 'FECHA', 'PAGO', 'SUSPENCIÓN', 'INMEDIATO', 'NO HAY NADA', 'IMPORTE', 'VALOR', 'DIRECCI', 'LOCALIDAD', 'ASUNTO', 'CARTAGENA', 'ESTIMADO', 'CONEXION', 'RESIDENCIAL', 'ESTRATO', 'KR', 'CL', 'BOTERO', 'SAN ROQUE', 'SINCELEJO', 'CREDITO', 'OTROS', 'CONSUMO', 'RECUPERADO', 'FACTURADO', 'MES', 'PRO', 'SEGURIDAD', 'VIDA', 'SUBSIDIO', 'INTERES', 'BRILLA', 'PLUS', 'UNIDAD', 'CLIENTE', 'ESTRATO', 'DIRECCIYN', 'LOCALIDAD', 'ASUNTO', 'RECUPERACI', 'CONSUMO', 'PERIODOS', 'ANTERIORES', 'USUARIO', 'FACTURA', 'ANEXA', 'COMUNICACI', 'INVESTIGACI', 'FACTURACIYN', 'KIT', 'NOMBRE', 'CONTRATO', 'DIRECCION', 'LOCALIDAD', 'ASUNTO', 'RECUPERACION', 'CONSUMO', 'PERIODOS', 'ANTERIORES', 'USUARIO', 'FACTURA', 'ANEXA', 'COMUNICACION', 'INVESTIGACION', 'FACTURACION', 'KIT'}
+# para separar nombre de fecha si están juntos
+fecha_re = re.compile(r'(\d{1,2}/\d{1,2}/\d{4})')
+
+
+# `any(w in s for w in avoid_words)` en una sola búsqueda compilada
+avoid_re = re.compile('|'.join(re.escape(w) for w in sorted(avoid_words, key=len, reverse=True)))
+simbolos_re = re.compile(r'["$%/.:,;]')
+no_digitos_re = re.compile(r'[^0-9]')
+
+
+def _rasgos_nombre(ln: str) -> tuple:
+	"""Clasifica una línea del encabezado para la heurística del nombre.
+
+	Retorna `(ln_clean, dos_palabras, sin_digitos, sin_simbolos, mayusculas, sin_evitar)`.
+	"""
+	ln_clean = ln.strip().replace('  ', ' ')
+	ln_upper = ln_clean.upper()
+	return (
+		ln_clean,
+		len(ln_clean.split()) >= 2,
+		not any(ch.isdigit() for ch in ln_clean),
+		simbolos_re.search(ln_clean) is None,
+		nombre_re.match(ln_upper) is not None,
+		avoid_re.search(ln_upper) is None,
+	)
+
+
+def _entero_consumo(ln: str) -> Optional[tuple]:
+	"""`(valor_int, texto)` si la línea es un entero suelto plausible como consumo (1..5000)."""
+	m = standalone_int_re.match(ln)
+	if m:
+		val = m.group(1)
+		try:
+			iv = int(val)
+		except Exception:
+			return None
+		if 1 <= iv <= 5000:
+			return iv, val
+	return None
+
+
+def extraer_campos_generales(filename: Optional[str], block: str) -> dict:
+	"""Extrae los campos generales (`Nombre, Fecha, Gas, credito, Total, Consumo_m3`)
+	del bloque de texto de una factura. Retorna un dict listo para el CSV.
+
+	Las líneas del encabezado se recorren una sola vez: cada una se clasifica
+	con sus rasgos (palabras, dígitos, símbolos, palabras a evitar, montos) y
+	las heurísticas eligen, en su orden de prioridad, la primera línea que
+	cumple cada criterio.
+	"""
+	log.debug("Procesando %s", filename)
+	# normalizar espacios no-break y limpiar bloque
+
+	block = block.replace('\xa0', ' ') if isinstance(block, str) else block
+	lines = [ln.strip() for ln in block.splitlines() if ln.strip()!='']
+	nombre = ''
+	fecha = ''
+	gas = ''
+	credito = ''
+	total = ''
+	consumo = ''
+
+	# Pasada única por el encabezado. Criterios del nombre, en orden de prioridad:
+	# 1. mayúsculas, varias palabras, sin números ni símbolos, sin palabras genéricas
+	# 2. mínimo dos palabras, sin números, sin símbolos, sin palabras genéricas
+	# 4. (hasta 20 líneas) mínimo dos palabras, sin números, aunque tenga símbolos
+	# 5. (hasta 20 líneas) fallback: primera línea con mínimo dos palabras
+	# 6. (hasta 20 líneas) mínimo dos palabras y que no empiece con '$'
+	candidatos = [''] * 7
+	montos_linea = []          # montos ($...) de cada una de las primeras 40 líneas
+	charges_line = None
+	total_found = False
+	for i, ln in enumerate(lines[:40]):
+		ams = amount_re.findall(ln)
+		montos_linea.append(ams)
+
+		if i < 20:
+			ln_clean, dos, sin_dig, sin_sim, mayus, sin_evitar = _rasgos_nombre(ln)
+			if dos:
+				if i < 16 and sin_dig and sin_sim and sin_evitar:
+					if mayus and not candidatos[1]:
+						candidatos[1] = ln_clean
+					if not candidatos[2]:
+						candidatos[2] = ln_clean
+				if sin_dig and sin_evitar and not candidatos[4]:
+					candidatos[4] = ln_clean
+				if not candidatos[5]:
+					candidatos[5] = ln_clean
+				if not ln.startswith('$') and not candidatos[6]:
+					candidatos[6] = ln
 
 		# Fecha
-		for ln in lines[:12]:
+		if i < 12 and not fecha:
 			m = date_re.search(ln)
 			if m:
 				fecha = m.group(1)
-				break
 
-		# Cantidades: preferimos encontrar la línea de cargos (varios montos juntos)
-		header_lines = lines[:16]
-		gas = credito = total = ''
-
-		charges_line = None
-		for ln in header_lines:
-			ams = amount_re.findall(ln)
-			if len(ams) >= 2:
+		if i < 16:
+			# Cantidades: preferimos la línea de cargos (varios montos juntos)
+			if charges_line is None and len(ams) >= 2:
 				charges_line = ln
 				ams_clean = [clean_amount(a) for a in ams]
 				gas = ams_clean[0]
-				credito = ams_clean[1] if len(ams_clean) >= 2 else ''
+				credito = ams_clean[1]
+			# Total: preferir línea que contenga palabra 'total'
+			if not total_found and ams and total_keywords_re.search(ln):
+				total = clean_amount(ams[-1])
+				total_found = True
+
+	nombre = candidatos[1] or candidatos[2]
+	# 3. Si el nombre contiene una fecha al final, separarla
+	if nombre:
+		m = fecha_re.search(nombre)
+		if m:
+			nombre = nombre[:m.start()].strip()
+	if not nombre:
+		nombre = candidatos[4] or candidatos[5]
+
+	# Si no se encontró línea con varios montos, extraer montos del header en orden
+	# (sobre el texto unido: un '$' al final de una línea toma el monto de la siguiente)
+	amounts = []
+	if not charges_line:
+		amounts = [clean_amount(a) for a in amount_re.findall('\n'.join(lines[:16]))]
+		if amounts:
+			gas = amounts[0]
+			credito = amounts[1] if len(amounts) >= 2 else ''
+
+	if not total_found:
+		# buscar línea independiente con único monto (hasta 40 líneas)
+		for ln, am in zip(lines, montos_linea):
+			if len(am) == 1 and ln.startswith('$'):
+				total = clean_amount(am[0])
+				total_found = True
 				break
 
-		# Si no se encontró línea con varios montos, extraer montos del header en orden
-		if not charges_line:
-			header_text = '\n'.join(header_lines)
-			amounts = amount_re.findall(header_text)
-			amounts = [clean_amount(a) for a in amounts]
-			if amounts:
-				gas = amounts[0] if len(amounts) >= 1 else ''
-				credito = amounts[1] if len(amounts) >= 2 else ''
-
-		# Buscar Total: preferir línea que contenga palabra 'total' o línea independiente con un solo monto
-		total_found = False
-		for ln in header_lines:
-			if total_keywords_re.search(ln):
-				am = amount_re.findall(ln)
-				if am:
-					total = clean_amount(am[-1])
-					total_found = True
-					break
-
-		if not total_found:
-			# buscar línea independiente con único monto en todo bloque (desde header hasta 40 líneas)
-			search_scope = lines[:40] if len(lines) > 40 else lines
-			for ln in search_scope:
-				am = amount_re.findall(ln)
-				if len(am) == 1 and ln.strip().startswith('$'):
-					total = clean_amount(am[0])
-					total_found = True
-					break
-
-		if not total_found:
-			# fallback: último monto del header
-			if 'amounts' in locals() and amounts:
-				total = amounts[-1]
-
-		# Consumo_m3 heurístico: buscar el primer entero standalone plausible después del Total
-		consumo = ''
-		total_idx = None
-		if total:
-			for i, ln in enumerate(lines):
-				# comparar montos encontrados en la línea con la forma normalizada del total
-				ams = amount_re.findall(ln)
-				matched = False
-				for a in ams:
-					if clean_amount(a) == total:
-						total_idx = i
-						matched = True
-						break
-				if matched:
-					break
-				# fallback: comparar con dígitos presentes en la línea
-				if total in re.sub(r'[^0-9]', '', ln):
-					total_idx = i
-					break
-
-		# buscar en un rango de líneas después del total (preferible) o desde el inicio
-		if total_idx is not None:
-			start = total_idx + 1
-		else:
-			start = 0
-
-		end = min(len(lines), start + 80)
-		print(f"DEBUG: Checkpoint 1 - Start consumption logic for {filename}")
-
-		# Mejorada heurística: preferir valores >= 10 para evitar capturar códigos/estratos
-		# que a veces aparecen cerca del total
-		consumo_candidates = []
-		for i in range(start, end):
-			ln = lines[i]
-			m = standalone_int_re.match(ln)
-			if m:
-				val = m.group(1)
-				try:
-					iv = int(val)
-					if 1 <= iv <=5000:
-						consumo_candidates.append((iv, val, i))
-				except Exception:
-					continue
-		
-		# Filtrar candidatos: prefirir valores >= 10 primero
-		if consumo_candidates:
-			# Separar candidatos por prioridad
-			good_candidates = [(iv, val, i) for iv, val, i in consumo_candidates if iv >= 10]
-			small_candidates = [(iv, val, i) for iv, val, i in consumo_candidates if iv < 10]
-			
-			if good_candidates:
-				# Usar el primer valor >= 10
-				consumo = good_candidates[0][1]
-			elif small_candidates:
-				# Solo usarvalores < 10 si no hay nada mejor
-				consumo = small_candidates[0][1]
-
-		# fallback: buscar desde el final hacia atrás cualquier standalone plausible
-		if not consumo:
-			for ln in reversed(lines[-120:]):
-				m = standalone_int_re.match(ln)
-				if m:
-					val = m.group(1)
-					try:
-						iv = int(val)
-						if 1 <= iv <= 5000:
-							consumo = val
-							break
-					except Exception:
-						continue
-
-		# Fallbacks: si no hay nombre, intentar una línea más arriba
-		if not nombre:
-			for ln in lines[:20]:
-				if ln.strip() and not ln.strip().startswith('$') and len(ln.split())>=2:
-					nombre = ln.strip()
-					break
-
-		entries.append({
-			'filename': filename or '',
-			'Nombre': nombre,
-			'Fecha': fecha,
-			'Gas': gas,
-			'credito': credito,
-			'Total': total,
-			'Consumo_m3': consumo,
-		})
-
-	# Filtrar duplicados por filename normalizado - últimos 7 caracteres antes de .pdf
+	if not total_found:
+		# fallback: último monto del header
+		if amounts:
+			total = amounts[-1]
+
+	# Consumo_m3 heurístico: buscar el primer entero standalone plausible después del Total.
+	# La línea del total es la primera cuyos dígitos contienen el total (un monto
+	# igual al total también cumple esta condición).
+	total_idx = None
+	if total:
+		for i, ln in enumerate(lines):
+			if total[0] in ln and total in no_digitos_re.sub('', ln):
+				total_idx = i
+				break
+
+	# buscar en un rango de líneas después del total (preferible) o desde el inicio
+	start = total_idx + 1 if total_idx is not None else 0
+	end = min(len(lines), start + 80)
+	log.debug("Buscando el consumo de %s", filename)
+
+	# Mejorada heurística: preferir valores >= 10 para evitar capturar códigos/estratos
+	# que a veces aparecen cerca del total; valores < 10 solo si no hay nada mejor
+	primero_chico = ''
+	for i in range(start, end):
+		entero = _entero_consumo(lines[i])
+		if entero:
+			iv, val = entero
+			if iv >= 10:
+				consumo = val
+				break
+			if not primero_chico:
+				primero_chico = val
+	if not consumo:
+		consumo = primero_chico
+
+	# fallback: buscar desde el final hacia atrás cualquier standalone plausible
+	if not consumo:
+		for ln in reversed(lines[-120:]):
+			entero = _entero_consumo(ln)
+			if entero:
+				consumo = entero[1]
+				break
+
+	# Fallbacks: si no hay nombre, intentar una línea más arriba
+	if not nombre:
+		nombre = candidatos[6]
+
+	return {
+		'filename': filename or '',
+		'Nombre': nombre,
+		'Fecha': fecha,
+		'Gas': gas,
+		'credito': credito,
+		'Total': total,
+		'Consumo_m3': consumo,
+		# Contrato, Periodo y NumeroFactura (ver `clave_factura`)
+		**extraer_clave(filename, block),
+	}
+
+
+def deduplicar_generales(entries: list) -> list:
+	"""Filtra duplicados por clave (contrato, período) (ver `clave_factura`).
+
+	Si dos facturas comparten clave, se conserva la que indica
+	`preferir_entrada`.
+	"""
 	unique_entries = {}
 	for e in entries:
-		# Normalizar filename: obtener últimos 7 caracteres antes de .pdf
-		# Ejemplo: "2110376038_1025335_NOV2024.pdf" -> "NOV2024"
-		# Ejemplo: "335_NOV2024.pdf" -> "NOV2024"
-		original_filename = e['filename']
-		base_name = original_filename.rsplit('.', 1)[0]  # Quita extensión
-		normalized_key = base_name[-7:]  # Últimos 7 caracteres
-		
-		# Solo agregar si no existe este filename normalizado
-		if normalized_key not in unique_entries:
+		normalized_key = clave_de_fila(e)
+		if normalized_key not in unique_entries or preferir_entrada(unique_entries[normalized_key], e):
 			unique_entries[normalized_key] = e
-		# Si ya existe, preferir el nombre más largo (más descriptivo)
-		elif len(original_filename) > len(unique_entries[normalized_key]['filename']):
-			unique_entries[normalized_key] = e
-	
-	entries = list(unique_entries.values())
 
-	# Escribir CSV
-	fieldnames = ['filename', 'Nombre', 'Fecha', 'Gas', 'credito', 'Total', 'Consumo_m3']
-	with open(csv_path, 'w', encoding='utf-8', newline='') as cf:
+	return list(unique_entries.values())
+
+
+def preferir_entrada(actual: dict, candidata: dict) -> bool:
+	"""Indica si `candidata` debe reemplazar a `actual` (misma clave de factura).
+
+	Gana la factura cuyo período se lee del nombre del archivo (p.ej.
+	`SEP2025.pdf` sobre `FEP2025.pdf`, un nombre mal escrito cuyo período
+	salió del texto); luego el nombre más largo (más descriptivo) y, ante empate, el menor en
+	orden alfabético. Si es el mismo archivo (vuelto a parsear), gana la
+	versión nueva.
+	"""
+	if candidata['filename'] == actual['filename']:
+		return True
+	nombre_valido = [desde_nombre(e['filename'])['periodo'] is not None for e in (actual, candidata)]
+	if nombre_valido[0] != nombre_valido[1]:
+		return nombre_valido[1]
+	if len(candidata['filename']) != len(actual['filename']):
+		return len(candidata['filename']) > len(actual['filename'])
+	return candidata['filename'] < actual['filename']
+
+
+CAMPOS_GENERALES = ['filename', 'Nombre', 'Fecha', 'Gas', 'credito', 'Total', 'Consumo_m3'] + CAMPOS_CLAVE
+
+
+def escribir_csv_atomico(csv_path: str, fieldnames: list, rows) -> str:
+	"""Escribe `rows` en un archivo temporal y lo renombra sobre `csv_path`, de modo
+	que un lector nunca ve el CSV a medio escribir. Retorna la ruta."""
+	tmp_path = csv_path + '.tmp'
+	with open(tmp_path, 'w', encoding='utf-8', newline='') as cf:
 		writer = csv.DictWriter(cf, fieldnames=fieldnames)
 		writer.writeheader()
+		for r in rows:
+			writer.writerow(r)
+	os.replace(tmp_path, csv_path)
+	return csv_path
+
+
+def escribir_csv_generales(entries: list, csv_path: str) -> str:
+	"""Escribe (sobrescribe) `csv_path` con las filas de datos generales. Retorna la ruta."""
+	with open(csv_path, 'w', encoding='utf-8', newline='') as cf:
+		writer = csv.DictWriter(cf, fieldnames=CAMPOS_GENERALES)
+		writer.writeheader()
 		for e in entries:
 			writer.writerow(e)
-
 	return csv_path
 
 
+def fusionar_csv_generales(csv_path: str, nuevas_entradas: list) -> list:
+	"""Incorpora `nuevas_entradas` al CSV de datos generales existente sin regenerarlo
+	desde los PDFs. Respeta la deduplicación por clave de factura (ver
+	`preferir_entrada`) y escribe el resultado de forma atómica. Las filas de
+	un CSV anterior sin las columnas de la clave se completan.
+
+	Retorna las entradas nuevas que quedaron en el CSV (las que hay que cargar).
+	"""
+	unique_entries = {}
+	if os.path.isfile(csv_path):
+		with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+			for r in csv.DictReader(f):
+				unique_entries[clave_de_fila(r)] = completar_clave(r)
 
+	incorporadas = []
+	for e in deduplicar_generales(nuevas_entradas):
+		key = clave_de_fila(e)
+		if key not in unique_entries or preferir_entrada(unique_entries[key], e):
+			unique_entries[key] = e
+			incorporadas.append(e)
 
-# parse_resultado_y_guardar_csv('Facturas', 'resultado.txt', 'datos_generales.csv')  # Llama a la función para generar CSV
+	escribir_csv_atomico(csv_path, CAMPOS_GENERALES, unique_entries.values())
+	return incorporadas
+
+
+def parse_resultado_y_guardar_csv(prueba_path: str = 'Facturas', txt_nombre: str = 'resultado.txt', csv_nombre: str = 'datos_generales.csv') -> str:
+	"""Lee `prueba_path/txt_nombre`, extrae campos claves por factura y escribe un CSV
+
+	Campos: `filename, Nombre, Fecha, Gas, credito, Total, Consumo_m3` y la
+	clave de la factura (`Contrato, Periodo, NumeroFactura`).
+	La función es heurística y trata de ser robusta ante pequeñas variaciones.
+	Retorna la ruta del CSV generado.
+	"""
+	txt_path = os.path.join(prueba_path, txt_nombre)
+	csv_path = os.path.join(prueba_path, csv_nombre)
+
+	if not os.path.isfile(txt_path):
+		raise FileNotFoundError(f"No existe el archivo de texto: {txt_path}")
+
+	with cronometro('parseo_general'):
+		with open(txt_path, 'r', encoding='utf-8') as f:
+			full = f.read()
+
+		# Buscar secciones delimitadas por: ----- filename.pdf -----
+		blocks = dividir_bloques(full)
+		log.debug("Encontrados %d bloques.", len(blocks))
+
+		entries = [extraer_campos_generales(filename, block) for filename, block in blocks]
+		entries = deduplicar_generales(entries)
+
+		return escribir_csv_generales(entries, csv_path)
+
+
+def parse_factura_general(prueba_path: str, filename: str, txt_nombre: str = 'resultado.txt') -> Optional[dict]:
+	"""Vuelve a parsear una sola factura de `resultado.txt` usando su índice de
+	offsets (ver `indice_resultado`), sin leer el resto del archivo.
+
+	Retorna el dict de campos generales, o None si la factura no está.
+	"""
+	block = leer_bloque(prueba_path, filename, txt_nombre)
+	if block is None:
+		return None
+	return extraer_campos_generales(filename, block)
 
 
+# parse_resultado_y_guardar_csv('Facturas', 'resultado.txt', 'datos_generales.csv')  # Llama a la función para generar CSV
\ No newline at end of file
@@ -0,0 +1,374 @@
+"""benchmark_etl.py
+
+Mide el rendimiento de cada etapa del ETL sobre un corpus sintético:
+
+1. `leer_pdfs_y_guardar_txt`            PDFs -> resultado.txt (PDFs/s)
+2. `parse_resultado_y_guardar_csv`      resultado.txt -> datos_generales.csv (facturas/s)
+3. `parse_resultado_y_guardar_especifico` resultado.txt -> datos_especificos.csv (ítems/s)
+4. `process_generales`                  datos_generales.csv -> BD (filas/s)
+5. `process_especificos`                datos_especificos.csv -> BD (filas/s)
+
+El texto sintético imita el formato que esperan los parsers (encabezado con
+nombre y fechas, línea de montos `$`, total, ítems indexados y el consumo como
+entero suelto). Las etapas 2-5 usan `--escala` facturas (1k, 100k, 1m o un
+número). Generar y extraer un millón de PDFs no es práctico, así que la etapa
+1 usa `--pdfs` PDFs reales (por defecto hasta 1000) generados con el mismo
+texto.
+
+La BD es un SQLite temporal (backend `conexion_sqlite`) con el mismo esquema
+e índices que en producción, así que no se toca la base de datos configurada
+en `.env`.
+
+Cada etapa corre en un proceso hijo (fork) para medir su pico de memoria
+(RSS). Los resultados se agregan a `benchmark_resultados.jsonl` junto con el
+commit actual, para comparar regresiones entre commits (`--comparar`).
+
+Uso:
+    python benchmark_etl.py                       # 1k facturas
+    python benchmark_etl.py --escala 100k --comparar
+    python benchmark_etl.py --escala 1m --pdfs 200 --etapas generales especificos
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+from analisis_general import escribir_bloque, leer_pdfs_y_guardar_txt, parse_resultado_y_guardar_csv
+from analisis_especifico import parse_resultado_y_guardar_especifico
+from conexion_sqlite import conectar_sqlite
+from escaneo import listar_pdfs
+import corregir_cargar
+
+
+RESULTADO_NOMBRE = 'resultado.txt'
+CSV_GENERAL = 'datos_generales.csv'
+CSV_ESPECIFICO = 'datos_especificos.csv'
+RESULTADOS_POR_DEFECTO = 'benchmark_resultados.jsonl'
+ESCALAS = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+ETAPAS = ['pdf_a_txt', 'generales', 'especificos', 'bd_generales', 'bd_especificos']
+
+
+# ---------------------------------------------------------------------------
+# Corpus sintético
+# ---------------------------------------------------------------------------
+
+NOMBRES = ['FRANCISCO', 'MARIA', 'JOSE', 'ANA', 'LUIS', 'CARMEN', 'PEDRO', 'LAURA', 'JORGE', 'SOFIA']
+APELLIDOS = ['LEON', 'ACOSTA', 'GOMEZ', 'PEREZ', 'RODRIGUEZ', 'MARTINEZ', 'HERRERA', 'TORRES', 'DIAZ', 'RUIZ']
+MESES = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SEP', 'OCT', 'NOV', 'DIC']
+CONCEPTOS = [
+    ('0031', 'CONSUMO DE GAS NATURAL'), ('0177', 'SEGURO FNB'), ('0196', 'SUBSIDIO AL CONSUMO'),
+    ('0793', 'SEGURO DE VIDA'), ('0884', 'CREDITO MOTO'), ('0897', 'INTERES FINANCIACION BRILLA'),
+    ('0120', 'CARGO FIJO'), ('0455', 'REVISION PERIODICA'),
+]
+
+
+def _monto(valor: int) -> str:
+    return f"{valor:,}"
+
+
+def clave_sintetica(i: int) -> tuple:
+    """(contrato, mes, año) de la factura `i`: 24 períodos consecutivos por contrato,
+    así la clave (contrato, período) de la BD es única."""
+    contrato, periodo = 1000000 + i // 24, i % 24
+    return contrato, periodo % 12 + 1, 2024 + periodo // 12
+
+
+def nombre_archivo(i: int) -> str:
+    """Nombre con el formato real `<numero>_<contrato>_<MES><AÑO>.pdf`."""
+    contrato, mes, anio = clave_sintetica(i)
+    return f"{2100000000 + i}_{contrato}_{MESES[mes - 1]}{anio}.pdf"
+
+
+def texto_factura(i: int, rng: random.Random) -> str:
+    """Texto de una factura con el formato que producen los PDFs reales."""
+    contrato, mes, anio = clave_sintetica(i)
+    dia = rng.randint(1, 28)
+    consumo = rng.randint(10, 200)
+    items = rng.sample(CONCEPTOS, rng.randint(3, len(CONCEPTOS)))
+
+    lineas_items = []
+    total = 0
+    for n, (codigo, concepto) in enumerate(items, 1):
+        valor = rng.randint(1_000, 400_000)
+        if codigo == '0196':
+            lineas_items.append(f"{n} {codigo} {concepto} -{_monto(valor)} 0      Unidad 1.00")
+        else:
+            lineas_items.append(f"{n} {codigo} {concepto} {_monto(valor)} {_monto(valor)} 0      Unidad 1.00")
+            total += valor
+    gas, credito = rng.randint(1_000, 99_999), rng.randint(0, 999_999)
+
+    return '\n'.join([
+        str(12168500000 + i),
+        'Kit34',
+        str(contrato),
+        f"{rng.choice(NOMBRES)} {rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+        f"{rng.choice(APELLIDOS)} {dia:02d}/{mes:02d}/{anio} {dia:02d}/{MESES[mes - 1]}/{anio}",
+        f"${_monto(gas)} ${_monto(credito)}  $0  $0",
+        f"${_monto(total)}",
+        *lineas_items,
+        f"2005 - 2005{i:012d} -  RIB S - ACT        CARTAGENA - AV. PEDRO DE HEREDIA",
+        f"{len(items)} {_monto(total)} {_monto(total)} 0",
+        f"1980 {dia:02d}/{mes:02d}/{anio}",
+        f"$ {_monto(rng.randint(100_000, 300_000))}",
+        str(consumo),
+        '0.67',
+        'Al día',
+        'Crédito',
+        'Otros',
+    ]) + '\n'
+
+
+def escribir_resultado_sintetico(destino: str, n: int, semilla: int = 0) -> str:
+    """Escribe `resultado.txt` con `n` facturas sintéticas (sin pasar por PDFs)."""
+    rng = random.Random(semilla)
+    ruta = os.path.join(destino, RESULTADO_NOMBRE)
+    with open(ruta, 'w', encoding='utf-8') as out_f:
+        for i in range(n):
+            escribir_bloque(out_f, nombre_archivo(i), texto_factura(i, rng), None)
+    return ruta
+
+
+def _escapar_pdf(texto: str) -> bytes:
+    texto = texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return texto.encode('latin-1', 'replace')
+
+
+def pdf_minimo(texto: str) -> bytes:
+    """PDF de una página con `texto` (una línea por renglón, Helvetica)."""
+    contenido = b"BT /F1 9 Tf 11 TL 40 980 Td\n" + b"".join(
+        b"(" + _escapar_pdf(ln) + b") Tj T*\n" for ln in texto.splitlines()) + b"ET"
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 1008] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream",
+    ]
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objetos, 1):
+        offsets.append(len(salida))
+        salida += b"%d 0 obj\n" % n + obj + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(salida)
+
+
+def escribir_pdfs_sinteticos(destino: str, n: int, semilla: int = 0) -> None:
+    rng = random.Random(semilla)
+    for i in range(n):
+        with open(os.path.join(destino, nombre_archivo(i)), 'wb') as f:
+            f.write(pdf_minimo(texto_factura(i, rng)))
+
+
+# ---------------------------------------------------------------------------
+# BD de prueba
+# ---------------------------------------------------------------------------
+
+def crear_bd_prueba(ruta: str) -> None:
+    """Crea en `ruta` una base SQLite con el esquema y las migraciones de producción."""
+    conn = conectar_sqlite(ruta)
+    try:
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            corregir_cargar.init_tables(conn)
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+
+def contar_filas_csv(ruta: str) -> int:
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def ejecutar_etapa(nombre: str, carpeta: str, carpeta_pdfs: str, db_path: str, args) -> int:
+    """Ejecuta una etapa y retorna la cantidad de filas (o PDFs) procesadas."""
+    if nombre == 'pdf_a_txt':
+        leer_pdfs_y_guardar_txt(carpeta_pdfs, salida_nombre=RESULTADO_NOMBRE, usar_cache=False,
+                                workers=args.workers, backend=args.backend)
+        return len(listar_pdfs(carpeta_pdfs))
+    if nombre == 'generales':
+        return contar_filas_csv(parse_resultado_y_guardar_csv(carpeta, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_GENERAL))
+    if nombre == 'especificos':
+        return contar_filas_csv(parse_resultado_y_guardar_especifico(carpeta, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_ESPECIFICO))
+
+    conn = conectar_sqlite(db_path)
+    try:
+        csv_path = os.path.join(carpeta, CSV_GENERAL if nombre == 'bd_generales' else CSV_ESPECIFICO)
+        if nombre == 'bd_generales':
+            if args.batch_size > 0:
+                corregir_cargar.cargar_generales_por_lotes(conn, corregir_cargar.leer_csv(csv_path), args.batch_size)
+            else:
+                corregir_cargar.process_generales(conn, csv_path)
+        else:
+            if args.batch_size > 0:
+                corregir_cargar.cargar_especificos_por_lotes(conn, corregir_cargar.leer_csv(csv_path), args.batch_size)
+            else:
+                corregir_cargar.process_especificos(conn, csv_path)
+        return contar_filas_csv(csv_path)
+    finally:
+        conn.close()
+
+
+def medir_etapa(nombre: str, carpeta: str, carpeta_pdfs: str, db_path: str, args) -> dict:
+    """Mide una etapa en un proceso hijo: segundos, filas/s y pico de RSS (KB)."""
+    def correr():
+        # Las cargas imprimen su resumen; no interesa aquí
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            t0 = time.perf_counter()
+            filas = ejecutar_etapa(nombre, carpeta, carpeta_pdfs, db_path, args)
+            return filas, time.perf_counter() - t0
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(lectura)
+        codigo = 0
+        try:
+            filas, segundos = correr()
+            datos = {'filas': filas, 'segundos': segundos}
+        except Exception as e:
+            datos = {'error': f"{type(e).__name__}: {e}"}
+            codigo = 1
+        with os.fdopen(escritura, 'w') as f:
+            json.dump(datos, f)
+        os._exit(codigo)
+
+    os.close(escritura)
+    with os.fdopen(lectura, 'r') as f:
+        datos = json.loads(f.read() or '{}')
+    _, _, uso = os.wait4(pid, 0)
+    if 'error' in datos:
+        raise RuntimeError(f"Etapa '{nombre}' falló: {datos['error']}")
+
+    segundos = datos['segundos']
+    return {
+        'filas': datos['filas'],
+        'segundos': round(segundos, 4),
+        'filas_por_seg': round(datos['filas'] / segundos, 1) if segundos > 0 else 0.0,
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        'rss_pico_kb': uso.ru_maxrss // 1024 if sys.platform == 'darwin' else uso.ru_maxrss,
+    }
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def ultimo_resultado(ruta: str, escala: int, pdfs: int):
+    """Último registro guardado con la misma escala y cantidad de PDFs."""
+    if not os.path.isfile(ruta):
+        return None
+    ultimo = None
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                r = json.loads(linea)
+            except ValueError:
+                continue
+            if r.get('escala') == escala and r.get('pdfs') == pdfs:
+                ultimo = r
+    return ultimo
+
+
+def parsear_escala(valor: str) -> int:
+    valor = valor.lower()
+    if valor in ESCALAS:
+        return ESCALAS[valor]
+    if not re.fullmatch(r'\d+', valor):
+        raise argparse.ArgumentTypeError(f"Escala inválida: {valor} (use 1k, 100k, 1m o un número)")
+    return int(valor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark por etapas del ETL sobre facturas sintéticas')
+    parser.add_argument('--escala', type=parsear_escala, default=ESCALAS['1k'],
+                        help='Facturas sintéticas para las etapas de texto y BD: 1k, 100k, 1m o un número')
+    parser.add_argument('--pdfs', type=int, default=None,
+                        help='PDFs sintéticos para la etapa de extracción (por defecto min(escala, 1000))')
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=ETAPAS, help='Etapas a medir')
+    parser.add_argument('--workers', type=int, default=1, help='Procesos para la extracción de PDFs')
+    parser.add_argument('--backend', default=None, help='Backend de extracción (ver extractores.py)')
+    parser.add_argument('--batch-size', type=int, default=0, help='Carga a la BD por lotes (0 = fila por fila)')
+    parser.add_argument('--resultados', default=RESULTADOS_POR_DEFECTO, help='Archivo JSONL donde se agregan los resultados')
+    parser.add_argument('--comparar', action='store_true', help='Comparar con la última corrida de la misma escala')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("Este benchmark necesita os.fork (Linux/macOS) para medir la memoria de cada etapa.")
+        return
+    pdfs = args.pdfs if args.pdfs is not None else min(args.escala, 1000)
+    anterior = ultimo_resultado(args.resultados, args.escala, pdfs) if args.comparar else None
+
+    with tempfile.TemporaryDirectory(prefix='bench_etl_') as tmp:
+        carpeta = os.path.join(tmp, 'texto')
+        carpeta_pdfs = os.path.join(tmp, 'pdfs')
+        os.makedirs(carpeta)
+        os.makedirs(carpeta_pdfs)
+        db_path = os.path.join(tmp, 'facturas.sqlite3')
+        crear_bd_prueba(db_path)
+
+        print(f"Generando corpus sintético: {args.escala} facturas, {pdfs} PDFs...")
+        t0 = time.perf_counter()
+        escribir_resultado_sintetico(carpeta, args.escala)
+        if 'pdf_a_txt' in args.etapas:
+            escribir_pdfs_sinteticos(carpeta_pdfs, pdfs)
+        print(f"Corpus listo en {time.perf_counter() - t0:.1f}s "
+              f"({os.path.getsize(os.path.join(carpeta, RESULTADO_NOMBRE)) / 1e6:.1f} MB de texto)\n")
+
+        etapas = {}
+        # Las etapas de BD necesitan los CSVs de las etapas de parseo
+        requeridas = set(args.etapas)
+        if 'bd_generales' in requeridas or 'bd_especificos' in requeridas:
+            requeridas |= {'generales', 'especificos'}
+        for nombre in ETAPAS:
+            if nombre not in requeridas:
+                continue
+            etapas[nombre] = medir_etapa(nombre, carpeta, carpeta_pdfs, db_path, args)
+            m = etapas[nombre]
+            print(f"{nombre:<15} {m['filas']:>10} filas {m['segundos']:>10.2f}s "
+                  f"{m['filas_por_seg']:>12.1f} filas/s {m['rss_pico_kb'] / 1024:>9.1f} MB RSS")
+
+    registro = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit_actual(),
+        'escala': args.escala,
+        'pdfs': pdfs,
+        'workers': args.workers,
+        'batch_size': args.batch_size,
+        'python': sys.version.split()[0],
+        'etapas': etapas,
+    }
+    with open(args.resultados, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+    print(f"\nResultados agregados a {args.resultados} (commit {registro['commit']})")
+
+    if anterior:
+        print(f"\nComparación con el commit {anterior['commit']} ({anterior['fecha']}):")
+        for nombre, m in etapas.items():
+            previo = anterior.get('etapas', {}).get(nombre)
+            if not previo or not previo.get('filas_por_seg'):
+                continue
+            cambio = (m['filas_por_seg'] / previo['filas_por_seg'] - 1) * 100
+            print(f"  {nombre:<15} {previo['filas_por_seg']:>12.1f} -> {m['filas_por_seg']:>12.1f} filas/s ({cambio:+.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
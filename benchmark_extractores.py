@@ -0,0 +1,150 @@
+"""benchmark_extractores.py
+
+Compara los backends de extracción de `extractores.py` sobre los PDFs de la
+carpeta `Facturas`:
+
+- Velocidad: páginas por segundo y tiempo total de extracción por backend.
+- Calidad: si los campos de `datos_generales.csv` y `datos_especificos.csv`
+  que se obtienen con cada backend coinciden con los del backend de referencia.
+
+Así se puede elegir el backend más rápido que todavía se parsea correctamente
+(y configurarlo con `EXTRACTOR_PDF` o `python main.py --backend ...`).
+
+Los archivos intermedios se generan en carpetas temporales; la carpeta
+`Facturas` no se modifica.
+
+Uso:
+    python benchmark_extractores.py
+    python benchmark_extractores.py --backends pypdf pymupdf --referencia pypdf
+"""
+
+import os
+import csv
+import time
+import argparse
+import tempfile
+from collections import Counter
+
+from escaneo import listar_pdfs
+from extractores import BACKENDS, BACKEND_POR_DEFECTO, backend_disponible, extraer_paginas
+from analisis_general import escribir_bloque, parse_resultado_y_guardar_csv
+from analisis_especifico import parse_resultado_y_guardar_especifico
+
+
+CARPETA_FACTURAS = 'Facturas'
+RESULTADO_NOMBRE = 'resultado.txt'
+CSV_GENERAL = 'datos_generales.csv'
+CSV_ESPECIFICO = 'datos_especificos.csv'
+
+
+def medir_backend(carpeta: str, pdf_files: list, backend: str, destino: str) -> dict:
+    """Extrae todos los PDFs con `backend`, escribe `resultado.txt` y los CSVs en
+    `destino` y retorna las métricas de la extracción."""
+    paginas = 0
+    errores = 0
+    segundos = 0.0
+
+    with open(os.path.join(destino, RESULTADO_NOMBRE), 'w', encoding='utf-8') as out_f:
+        for pdf_file in pdf_files:
+            ruta = os.path.join(carpeta, pdf_file)
+            t0 = time.perf_counter()
+            try:
+                pags = extraer_paginas(ruta, backend)
+                texto, error = "\n".join(pags), None
+                paginas += len(pags)
+            except Exception as e:
+                texto, error = None, str(e)
+                errores += 1
+            segundos += time.perf_counter() - t0
+            escribir_bloque(out_f, pdf_file, texto, error)
+
+    parse_resultado_y_guardar_csv(destino, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_GENERAL)
+    parse_resultado_y_guardar_especifico(destino, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_ESPECIFICO)
+
+    return {
+        'backend': backend,
+        'pdfs': len(pdf_files),
+        'paginas': paginas,
+        'errores': errores,
+        'segundos': segundos,
+        'paginas_por_seg': paginas / segundos if segundos > 0 else 0.0,
+    }
+
+
+def leer_generales(path: str) -> dict:
+    """Retorna `{filename: (campos...)}` desde un `datos_generales.csv`."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {
+            r['filename']: (r['Nombre'], r['Fecha'], r['Gas'], r['credito'], r['Total'], r['Consumo_m3'])
+            for r in csv.DictReader(f)
+        }
+
+
+def leer_especificos(path: str) -> dict:
+    """Retorna `{filename: Counter((ID, Concepto, ValorPagar))}` desde un `datos_especificos.csv`."""
+    por_factura = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            por_factura.setdefault(r['filename'], Counter())[(r['ID'], r['Concepto'], r['ValorPagar'])] += 1
+    return por_factura
+
+
+def comparar(referencia: dict, candidato: dict) -> tuple:
+    """Cuenta cuántas facturas de `referencia` tienen exactamente los mismos datos en `candidato`."""
+    iguales = sum(1 for k, v in referencia.items() if candidato.get(k) == v)
+    return iguales, len(referencia)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara velocidad y calidad de los backends de extracción de PDFs')
+    parser.add_argument('--carpeta', default=CARPETA_FACTURAS, help='Carpeta con los PDFs a procesar')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS), help='Backends a medir')
+    parser.add_argument('--referencia', choices=list(BACKENDS), default=BACKEND_POR_DEFECTO, help='Backend cuyos CSVs se toman como correctos')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.carpeta):
+        print(f"Carpeta no encontrada: {args.carpeta}")
+        return
+
+    # Incluye las subcarpetas (ver `escaneo`)
+    pdf_files = listar_pdfs(args.carpeta)
+    if not pdf_files:
+        print(f"No se encontraron archivos PDF en '{args.carpeta}'.")
+        return
+
+    backends = list(dict.fromkeys(args.backends + [args.referencia]))
+    disponibles = [b for b in backends if backend_disponible(b)]
+    for b in backends:
+        if b not in disponibles:
+            print(f"⚠️  Backend '{b}' no instalado, se omite")
+
+    if args.referencia not in disponibles:
+        print(f"El backend de referencia '{args.referencia}' no está instalado")
+        return
+
+    print(f"Midiendo {len(disponibles)} backends sobre {len(pdf_files)} PDFs de '{args.carpeta}'...\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resultados = []
+        for b in disponibles:
+            destino = os.path.join(tmp, b)
+            os.makedirs(destino)
+            resultados.append((medir_backend(args.carpeta, pdf_files, b, destino), destino))
+
+        ref_dir = os.path.join(tmp, args.referencia)
+        ref_gen = leer_generales(os.path.join(ref_dir, CSV_GENERAL))
+        ref_esp = leer_especificos(os.path.join(ref_dir, CSV_ESPECIFICO))
+
+        print(f"{'Backend':<12} {'Páginas':>8} {'Seg':>8} {'Pág/s':>9} {'Errores':>8} {'Generales':>11} {'Específicos':>12}")
+        print('-' * 74)
+        for m, destino in sorted(resultados, key=lambda x: -x[0]['paginas_por_seg']):
+            g_ok, g_tot = comparar(ref_gen, leer_generales(os.path.join(destino, CSV_GENERAL)))
+            e_ok, e_tot = comparar(ref_esp, leer_especificos(os.path.join(destino, CSV_ESPECIFICO)))
+            print(f"{m['backend']:<12} {m['paginas']:>8} {m['segundos']:>8.2f} {m['paginas_por_seg']:>9.1f} {m['errores']:>8} "
+                  f"{f'{g_ok}/{g_tot}':>11} {f'{e_ok}/{e_tot}':>12}")
+
+    print(f"\nReferencia de calidad: {args.referencia}. Un backend es apto si coincide en todas las facturas.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Caché persistente del texto extraído de cada PDF.
+
+Base SQLite en `<carpeta>/.cache_extraccion.sqlite3` con dos tablas:
+
+- `textos`: una fila por contenido, `(sha256, backend) -> texto`. Dos PDFs
+  con el mismo contenido (p.ej. una copia o un archivo renombrado)
+  comparten la entrada y no se vuelven a extraer.
+- `archivos`: índice `filename -> (tamaño, mtime, sha256)` para no leer el
+  PDF cuando no cambió.
+
+Cada consulta o actualización toca solo las filas del PDF en cuestión: el
+costo de una corrida crece con los PDFs que se procesan y no con el total
+de la carpeta (antes la caché era un único JSON que se leía y reescribía
+completo).
+
+Validación de un PDF:
+- Si tamaño y `mtime` coinciden con el índice, se usa el texto de su hash
+  sin leer el PDF.
+- Si no (o si el PDF no está en el índice), se calcula el hash y se busca
+  su texto; si existe, solo se actualiza el índice.
+- En cualquier otro caso el PDF se vuelve a extraer.
+"""
+
+import os
+import hashlib
+import sqlite3
+from typing import Optional
+
+
+CACHE_NOMBRE = '.cache_extraccion.sqlite3'
+
+
+def hash_archivo(ruta: str, tam_bloque: int = 1 << 20) -> str:
+    """Calcula el SHA-256 del contenido de `ruta` leyendo por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def abrir_cache(prueba_path: str, nombre: str = CACHE_NOMBRE) -> sqlite3.Connection:
+    """Abre (y crea si hace falta) la caché de `prueba_path`.
+
+    Los cambios se confirman con `cerrar_cache` (o `conn.commit()`).
+    """
+    conn = sqlite3.connect(os.path.join(prueba_path, nombre), timeout=30)
+    # WAL: el monitor, los workers y la aplicación web pueden usarla a la vez
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS textos (
+        sha256 TEXT NOT NULL,
+        backend TEXT NOT NULL,
+        texto TEXT NOT NULL,
+        PRIMARY KEY (sha256, backend)
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS archivos (
+        filename TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL
+    )""")
+    conn.commit()
+    return conn
+
+
+def cerrar_cache(conn: sqlite3.Connection) -> None:
+    """Confirma los cambios pendientes y cierra la caché."""
+    try:
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _texto(conn, sha256, backend):
+    fila = conn.execute("SELECT texto FROM textos WHERE sha256 = ? AND backend = ?", (sha256, backend)).fetchone()
+    return fila[0] if fila else None
+
+
+def buscar_en_cache(conn: sqlite3.Connection, ruta: str, pdf_file: str, backend: str) -> Optional[str]:
+    """Texto cacheado de `pdf_file` extraído con `backend`, o None si hay que extraerlo
+    (también si el PDF se eliminó después de listarse)."""
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    fila = conn.execute("SELECT size, mtime_ns, sha256 FROM archivos WHERE filename = ?", (pdf_file,)).fetchone()
+    if fila and fila[0] == st.st_size and fila[1] == st.st_mtime_ns:
+        return _texto(conn, fila[2], backend)
+
+    # Nuevo en el índice o con otro mtime (p.ej. copiado de nuevo): buscar por contenido
+    try:
+        sha256 = hash_archivo(ruta)
+    except FileNotFoundError:
+        return None
+    texto = _texto(conn, sha256, backend)
+    if texto is not None:
+        conn.execute("INSERT OR REPLACE INTO archivos (filename, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                     (pdf_file, st.st_size, st.st_mtime_ns, sha256))
+    return texto
+
+
+def actualizar_cache(conn: sqlite3.Connection, ruta: str, pdf_file: str, texto: str, backend: str) -> None:
+    """Registra en la caché el texto recién extraído de `pdf_file`."""
+    try:
+        st = os.stat(ruta)
+        sha256 = hash_archivo(ruta)
+    except FileNotFoundError:
+        return
+    conn.execute("INSERT OR REPLACE INTO textos (sha256, backend, texto) VALUES (?, ?, ?)",
+                 (sha256, backend, texto))
+    conn.execute("INSERT OR REPLACE INTO archivos (filename, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                 (pdf_file, st.st_size, st.st_mtime_ns, sha256))
+
+
+def podar_cache(conn: sqlite3.Connection, pdf_files) -> int:
+    """Elimina las entradas de archivos que ya no existen y los textos que
+    ninguno usa. Recorre toda la caché: solo para las corridas completas.
+
+    Retorna la cantidad de archivos eliminados.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS vigentes (filename TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM vigentes")
+    conn.executemany("INSERT OR IGNORE INTO vigentes VALUES (?)", ((f,) for f in pdf_files))
+    eliminados = conn.execute("DELETE FROM archivos WHERE filename NOT IN (SELECT filename FROM vigentes)").rowcount
+    conn.execute("DELETE FROM textos WHERE sha256 NOT IN (SELECT sha256 FROM archivos)")
+    conn.execute("DELETE FROM vigentes")
+    return eliminados
@@ -1,8 +1,9 @@
-import os
 import csv
+from escaneo import listar_pdfs
+from clave_factura import clave_de_fila, formatear_clave
 
 # PDFs en carpeta
-pdfs = sorted([f for f in os.listdir('Facturas') if f.lower().endswith('.pdf')])
+pdfs = listar_pdfs('Facturas')
 print(f"PDFs en carpeta Facturas: {len(pdfs)}")
 for p in pdfs:
     print(f"  {p}")
@@ -12,7 +13,8 @@ print("\n" + "="*60)
 # Facturas en CSV
 with open('Facturas/datos_generales.csv', 'r', encoding='utf-8') as f:
     reader = csv.DictReader(f)
-    csv_files = [row['filename'] for row in reader if row['filename']]
+    filas = [row for row in reader if row['filename']]
+    csv_files = [row['filename'] for row in filas]
 
 print(f"\nFacturas en datos_generales.csv: {len(csv_files)}")
 for f in csv_files:
@@ -20,18 +22,17 @@ for f in csv_files:
 
 print("\n" + "="*60)
 
-# Analizar normalización
-print("\nAnálisis de normalización (últimos 7 caracteres):")
+# Analizar claves (contrato, período)
+print("\nAnálisis de claves de factura (contrato/período):")
 normalized_map = {}
-for filename in csv_files:
-    base_name = filename.rsplit('.', 1)[0]
-    norm_key = base_name[-7:]
+for row in filas:
+    norm_key = formatear_clave(clave_de_fila(row))
     
     if norm_key not in normalized_map:
         normalized_map[norm_key] = []
-    normalized_map[norm_key].append(filename)
+    normalized_map[norm_key].append(row['filename'])
 
-print(f"\nFilenames únicos normalizados: {len(normalized_map)}")
+print(f"\nClaves de factura únicas: {len(normalized_map)}")
 for norm, files in sorted(normalized_map.items()):
     if len(files) > 1:
         print(f"\n⚠️  '{norm}' -> {len(files)} archivos (DUPLICADOS):")
@@ -45,5 +46,5 @@ print(f"\n{'='*60}")
 print(f"Resumen:")
 print(f"  PDFs en carpeta: {len(pdfs)}")
 print(f"  Facturas en CSV: {len(csv_files)}")
-print(f"  Claves normalizadas únicas: {len(normalized_map)}")
+print(f"  Claves de factura únicas: {len(normalized_map)}")
 print(f"  Grupos con duplicados: {dup_count}")
@@ -0,0 +1,131 @@
+"""Clave de identidad de una factura: (contrato, período).
+
+Hasta ahora una factura se identificaba por los últimos 7 caracteres del
+nombre del archivo (p.ej. `NOV2024`), lo que hace colisionar las facturas
+del mismo mes de contratos distintos. Aquí se extraen del nombre completo
+`<numero_factura>_<contrato>_<MES><AÑO>.pdf` (p.ej.
+`2110376038_1025335_NOV2024.pdf`):
+
+- `contrato`: '1025335'
+- `periodo`:  '2024-11' (AAAA-MM)
+- `numero`:   '2110376038' (informativo; no forma parte de la clave)
+
+Si el nombre está truncado (`335_NOV2024.pdf`, `AGO2025.pdf`) o el mes no es
+válido (`KUL2025.pdf`), los datos que faltan se toman del texto de la factura:
+el contrato es la primera línea de 6 a 8 dígitos del encabezado, el período la
+etiqueta `DD/MES/AAAA` del encabezado (p.ej. `15/NOV/2024`) y el número de
+factura una línea de 10 dígitos. Sin etiqueta, el período se toma de las
+fechas `DD/MM/AAAA` del encabezado solo si todas caen en el mismo mes: la de
+expedición o la de vencimiento pueden ser de otro.
+Si aun así no hay período, se usa el nombre normalizado anterior (últimos 7
+caracteres) para no mezclar facturas distintas.
+
+Las filas de los CSV guardan la clave en las columnas `Contrato`, `Periodo` y
+`NumeroFactura`; `clave_de_fila` la recupera (o la recalcula desde el nombre
+para CSVs generados antes de existir esas columnas).
+"""
+
+import re
+from typing import Optional
+
+
+MESES = ['ENE', 'FEB', 'MAR', 'ABR', 'MAY', 'JUN', 'JUL', 'AGO', 'SEP', 'OCT', 'NOV', 'DIC']
+_NUMERO_MES = {m: i for i, m in enumerate(MESES, 1)}
+
+CAMPOS_CLAVE = ['Contrato', 'Periodo', 'NumeroFactura']
+
+nombre_completo_re = re.compile(r'^(\d+)_(\d+)_([A-Za-z]{3})(\d{4})$')
+periodo_nombre_re = re.compile(r'([A-Za-z]{3})(\d{4})$')
+contrato_texto_re = re.compile(r'^\d{6,8}$')
+numero_texto_re = re.compile(r'^\s*(\d{10})\s*$', re.MULTILINE)
+fecha_texto_re = re.compile(r'\b\d{1,2}/(\d{1,2})/(\d{4})\b')
+periodo_texto_re = re.compile(r'\b\d{1,2}/([A-Za-z]{3})/(\d{4})\b')
+
+# Líneas del encabezado donde se buscan el contrato y la fecha
+LINEAS_ENCABEZADO = 12
+
+
+def _base(filename: str) -> str:
+    """Nombre sin subcarpetas (`2024/11/x.pdf` -> `x`) ni extensión."""
+    return filename.rpartition('/')[2].rsplit('.', 1)[0]
+
+
+def clave_legada(filename: str) -> str:
+    """Nombre normalizado anterior: últimos 7 caracteres antes de la extensión."""
+    return _base(filename)[-7:]
+
+
+def _periodo(mes: str, anio: str) -> Optional[str]:
+    numero = _NUMERO_MES.get(mes.upper())
+    return f"{anio}-{numero:02d}" if numero else None
+
+
+def desde_nombre(filename: str) -> dict:
+    """Datos de la clave que se pueden leer del nombre del archivo (None si faltan)."""
+    base = _base(filename)
+    m = nombre_completo_re.match(base)
+    if m:
+        return {'contrato': m.group(2), 'periodo': _periodo(m.group(3), m.group(4)), 'numero': m.group(1)}
+    m = periodo_nombre_re.search(base)
+    return {'contrato': None, 'periodo': _periodo(*m.groups()) if m else None, 'numero': None}
+
+
+def desde_texto(block: str) -> dict:
+    """Datos de la clave que se pueden leer del texto de la factura (None si faltan)."""
+    encabezado = [ln.strip() for ln in block.splitlines() if ln.strip()][:LINEAS_ENCABEZADO]
+    contrato = next((ln for ln in encabezado if contrato_texto_re.match(ln)), None)
+    periodo = None
+    for ln in encabezado:
+        m = periodo_texto_re.search(ln)
+        if m and _periodo(*m.groups()):
+            periodo = _periodo(*m.groups())
+            break
+    else:
+        meses = {f"{anio}-{int(mes):02d}" for ln in encabezado for mes, anio in fecha_texto_re.findall(ln)
+                 if 1 <= int(mes) <= 12}
+        if len(meses) == 1:
+            periodo = meses.pop()
+    m = numero_texto_re.search(block)
+    return {'contrato': contrato, 'periodo': periodo, 'numero': m.group(1) if m else None}
+
+
+def extraer_clave(filename: Optional[str], block: str = '') -> dict:
+    """Campos `Contrato`, `Periodo` y `NumeroFactura` de una factura.
+
+    Prioriza el nombre del archivo y completa con el texto lo que falte.
+    """
+    filename = filename or ''
+    datos = desde_nombre(filename)
+    if not all(datos.values()) and block:
+        texto = desde_texto(block)
+        datos = {k: v or texto[k] for k, v in datos.items()}
+    return {
+        'Contrato': datos['contrato'] or '',
+        'Periodo': datos['periodo'] or clave_legada(filename),
+        'NumeroFactura': datos['numero'] or '',
+    }
+
+
+def clave_de_fila(row: dict) -> tuple:
+    """Clave `(contrato, periodo)` de una fila de CSV (general o específica).
+
+    Las filas sin las columnas de la clave (CSVs anteriores) la obtienen solo
+    del nombre del archivo, igual en ambos CSVs.
+    """
+    if row.get('Periodo'):
+        return row.get('Contrato') or '', row['Periodo']
+    datos = extraer_clave(row.get('filename'))
+    return datos['Contrato'], datos['Periodo']
+
+
+def completar_clave(row: dict) -> dict:
+    """Agrega a `row` las columnas de la clave si no las tiene (CSVs anteriores)."""
+    if not row.get('Periodo'):
+        row.update(extraer_clave(row.get('filename')))
+    return row
+
+
+def formatear_clave(clave: tuple) -> str:
+    """Texto legible de una clave: '1025335/2024-11' (o '?/2024-11' sin contrato)."""
+    contrato, periodo = clave
+    return f"{contrato or '?'}/{periodo}"
@@ -0,0 +1,384 @@
+"""Cola de PDFs en la base de datos para repartir la ingesta entre varios workers.
+
+Varios `main.py --worker` (en una o más máquinas, con la carpeta `Facturas`
+y la base de datos compartidas) se reparten los PDFs sin procesarlos dos
+veces. La tabla `ColaPDFs` (migración 6) tiene una fila por PDF:
+
+- `pendiente`: esperando un worker (o el próximo reintento).
+- `procesando`: tomado por `worker` con un arriendo (lease) hasta
+  `arriendo_hasta`. Mientras procesa, el worker lo renueva (`latido`); si
+  el worker muere, el arriendo vence y otro worker lo vuelve a tomar.
+- `ok` / `error`: terminado; `error` tras `MAX_INTENTOS` intentos fallidos.
+
+Tomar trabajo es atómico: en MySQL con `SELECT ... FOR UPDATE SKIP LOCKED`
+(los workers no se bloquean entre sí) y en SQLite con un único `UPDATE`
+(SQLite serializa las escrituras). Los tiempos se calculan con el reloj de
+la base de datos, no con el de cada máquina.
+
+Cada worker descubre los PDFs de la carpeta (ver `escaneo`) y los encola;
+encolar es idempotente, así que todos pueden hacerlo. Un PDF reemplazado
+(distinto tamaño o `mtime`) vuelve a `pendiente`; si un worker lo está
+procesando con el arriendo vigente, no se le quita: se marca `reencolar`
+(migración 7) y vuelve a `pendiente` cuando ese worker termina o cuando
+vence el arriendo.
+
+Uso:
+    python main.py --worker [--lote-worker 10] [--arriendo 300]
+"""
+
+import os
+import time
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+
+from conexion_sqlite import dialecto
+from conexion import conexion_bd, init_tables, errores_bd
+from corregir_cargar import TAMANO_CONSULTA, _en_lotes
+from escaneo import escanear_pdfs, ESCANEOS_POR_REVISION_COMPLETA
+from vigilante import _firma
+from ingesta import ingerir_archivos
+from metricas import incrementar
+
+
+# Segundos de un arriendo (se renueva cada tercio mientras se procesa)
+ARRIENDO_SEG = int(os.getenv('COLA_ARRIENDO', '300'))
+# Intentos antes de marcar un PDF como `error`
+MAX_INTENTOS = int(os.getenv('COLA_MAX_INTENTOS', '3'))
+# Espera antes de reintentar un PDF que falló
+REINTENTO_SEG = int(os.getenv('COLA_REINTENTO', '60'))
+# PDFs que toma un worker por vez
+LOTE_WORKER = int(os.getenv('COLA_LOTE', '10'))
+# Segundos que la firma de un PDF nuevo debe mantenerse antes de encolarlo
+ESPERA_ESTABLE = 1.0
+
+
+def id_worker() -> str:
+    """Identificador único del worker: `host:pid:aleatorio`."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _ahora(conn) -> str:
+    """Expresión SQL con el instante actual (segundos epoch) según el reloj de la BD."""
+    if dialecto(conn) == 'sqlite':
+        return "((julianday('now') - 2440587.5) * 86400.0)"
+    return "UNIX_TIMESTAMP(NOW(6))"
+
+
+def encolar(conn, firmas: dict) -> int:
+    """Agrega a la cola los PDFs de `firmas` (`{filename: (size, mtime_ns)}`).
+
+    Los nuevos y los que cambiaron de firma quedan `pendiente`; el resto no
+    se toca. Los que cambiaron mientras otro worker los procesa conservan
+    su arriendo y se marcan para volver a `pendiente` al terminar. Retorna
+    cuántos quedaron (o quedarán) pendientes.
+    """
+    ahora = _ahora(conn)
+    cursor = conn.cursor(buffered=True)
+    try:
+        nuevos = []
+        cambiados = []
+        for lote in _en_lotes(sorted(firmas), TAMANO_CONSULTA):
+            placeholders = ', '.join(['%s'] * len(lote))
+            cursor.execute(f"SELECT filename, size, mtime_ns FROM ColaPDFs WHERE filename IN ({placeholders})",
+                           tuple(lote))
+            existentes = {f: (s, m) for f, s, m in cursor.fetchall()}
+            for filename in lote:
+                firma = tuple(firmas[filename])
+                if filename not in existentes:
+                    nuevos.append((filename, *firma))
+                elif existentes[filename] != firma:
+                    cambiados.append((*firma, filename))
+
+        ignorar = 'OR IGNORE' if dialecto(conn) == 'sqlite' else 'IGNORE'
+        # IGNORE: otro worker pudo encolarlo entre la consulta y el INSERT
+        cursor.executemany(f"""INSERT {ignorar} INTO ColaPDFs (filename, size, mtime_ns, estado, actualizado_en)
+            VALUES (%s, %s, %s, 'pendiente', {ahora})""", nuevos)
+        cursor.executemany(f"""UPDATE ColaPDFs SET size = %s, mtime_ns = %s, estado = 'pendiente',
+                intentos = 0, worker = NULL, arriendo_hasta = NULL, error = NULL, reencolar = 0,
+                actualizado_en = {ahora}
+            WHERE filename = %s AND (estado <> 'procesando' OR arriendo_hasta IS NULL
+                OR arriendo_hasta < {ahora})""", cambiados)
+        # Los que siguen `procesando` con la firma anterior tienen el arriendo vigente
+        cursor.executemany(f"""UPDATE ColaPDFs SET size = %s, mtime_ns = %s, reencolar = 1,
+                actualizado_en = {ahora}
+            WHERE filename = %s AND estado = 'procesando' AND (size <> %s OR mtime_ns <> %s)""",
+                           [(*c, *c[:2]) for c in cambiados])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(nuevos) + len(cambiados)
+
+
+# Asignación que devuelve a `pendiente` un PDF reemplazado mientras se procesaba
+_REENCOLAR = """estado = 'pendiente', intentos = 0, worker = NULL, arriendo_hasta = NULL,
+    error = NULL, reencolar = 0"""
+
+
+def _vencer_agotados(cursor, ahora, max_intentos):
+    """Marca `error` los PDFs cuyo arriendo venció tras agotar los intentos
+    (p.ej. un PDF que hace caer al worker cada vez). Los que se reemplazaron
+    mientras tanto vuelven a `pendiente` con los intentos en cero."""
+    cursor.execute(f"""UPDATE ColaPDFs SET {_REENCOLAR}, actualizado_en = {ahora}
+        WHERE estado = 'procesando' AND arriendo_hasta < {ahora} AND reencolar = 1""")
+    cursor.execute(f"""UPDATE ColaPDFs SET estado = 'error', worker = NULL,
+            error = 'Arriendo vencido tras agotar los intentos', actualizado_en = {ahora}
+        WHERE estado = 'procesando' AND arriendo_hasta < {ahora} AND intentos >= %s""", (max_intentos,))
+
+
+def reclamar(conn, worker: str, cantidad: int = LOTE_WORKER, arriendo: int = ARRIENDO_SEG,
+             max_intentos: int = MAX_INTENTOS) -> list:
+    """Toma hasta `cantidad` PDFs disponibles con un arriendo de `arriendo` segundos.
+
+    Disponibles: `pendiente` cuyo reintento ya venció o `procesando` cuyo
+    arriendo venció (el worker que lo tenía murió). Retorna los filenames.
+    """
+    ahora = _ahora(conn)
+    sqlite = dialecto(conn) == 'sqlite'
+    cursor = conn.cursor(buffered=True)
+    try:
+        if sqlite:
+            # Instante fijo: distingue las filas recién tomadas de las de un lote
+            # anterior de este worker cuyo resultado no se pudo registrar
+            cursor.execute(f"SELECT {ahora}")
+            ahora = repr(cursor.fetchone()[0])
+        disponibles = f"""estado IN ('pendiente', 'procesando')
+            AND (arriendo_hasta IS NULL OR arriendo_hasta < {ahora}) AND intentos < %s"""
+        tomar = f"""UPDATE ColaPDFs SET estado = 'procesando', worker = %s, intentos = intentos + 1,
+            arriendo_hasta = {ahora} + %s, error = NULL, actualizado_en = {ahora}"""
+        _vencer_agotados(cursor, ahora, max_intentos)
+        if sqlite:
+            # Un solo UPDATE: SQLite no permite otra escritura en el medio
+            cursor.execute(f"""{tomar} WHERE id IN (
+                SELECT id FROM ColaPDFs WHERE {disponibles} ORDER BY id LIMIT %s)""",
+                           (worker, arriendo, max_intentos, cantidad))
+            cursor.execute(f"""SELECT filename FROM ColaPDFs WHERE worker = %s AND estado = 'procesando'
+                AND actualizado_en = {ahora} ORDER BY id""", (worker,))
+            filenames = [f for (f,) in cursor.fetchall()]
+        else:
+            # SKIP LOCKED: las filas que otro worker está tomando se saltan sin esperar
+            cursor.execute(f"""SELECT id, filename FROM ColaPDFs WHERE {disponibles}
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED""", (max_intentos, cantidad))
+            filas = cursor.fetchall()
+            filenames = [f for _, f in filas]
+            if filas:
+                placeholders = ', '.join(['%s'] * len(filas))
+                cursor.execute(f"{tomar} WHERE id IN ({placeholders})",
+                               (worker, arriendo, *[i for i, _ in filas]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    incrementar('etl_cola_pdfs_total', len(filenames), resultado='reclamado')
+    return filenames
+
+
+def renovar(conn, worker: str, arriendo: int = ARRIENDO_SEG) -> int:
+    """Extiende el arriendo de los PDFs que `worker` está procesando. Retorna cuántos."""
+    ahora = _ahora(conn)
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute(f"""UPDATE ColaPDFs SET arriendo_hasta = {ahora} + %s
+            WHERE worker = %s AND estado = 'procesando'""", (arriendo, worker))
+        renovados = cursor.rowcount
+        conn.commit()
+        return renovados
+    finally:
+        cursor.close()
+
+
+def _terminar(conn, worker, filenames, asignacion, parametros):
+    """Aplica `asignacion` a los `filenames` que `worker` sigue teniendo.
+
+    Si el arriendo venció y otro worker tomó el PDF, la fila no se modifica.
+    Los que se reemplazaron mientras se procesaban vuelven a `pendiente`.
+    Retorna a cuántos se aplicó `asignacion`.
+    """
+    if not filenames:
+        return 0
+    ahora = _ahora(conn)
+    cursor = conn.cursor(buffered=True)
+    try:
+        placeholders = ', '.join(['%s'] * len(filenames))
+        propios = f"worker = %s AND estado = 'procesando' AND filename IN ({placeholders})"
+        cursor.execute(f"""UPDATE ColaPDFs SET {_REENCOLAR}, actualizado_en = {ahora}
+            WHERE {propios} AND reencolar = 1""", (worker, *filenames))
+        reencolados = cursor.rowcount
+        cursor.execute(f"""UPDATE ColaPDFs SET {asignacion}, worker = NULL, actualizado_en = {ahora}
+            WHERE {propios}""", (*parametros, worker, *filenames))
+        terminados = cursor.rowcount
+        conn.commit()
+        incrementar('etl_cola_pdfs_total', reencolados, resultado='reencolado')
+        return terminados
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def completar(conn, worker: str, filenames: list) -> int:
+    """Marca como `ok` los PDFs procesados por `worker`."""
+    terminados = _terminar(conn, worker, filenames, "estado = 'ok', arriendo_hasta = NULL, error = NULL", ())
+    incrementar('etl_cola_pdfs_total', terminados, resultado='ok')
+    return terminados
+
+
+def fallar(conn, worker: str, filenames: list, error: str, max_intentos: int = MAX_INTENTOS,
+           reintento: int = REINTENTO_SEG) -> int:
+    """Libera los PDFs que fallaron: vuelven a `pendiente` (se reintentan tras
+    `reintento` segundos) o pasan a `error` si agotaron los intentos."""
+    ahora = _ahora(conn)
+    terminados = _terminar(conn, worker, filenames, f"""
+        estado = CASE WHEN intentos >= %s THEN 'error' ELSE 'pendiente' END,
+        arriendo_hasta = {ahora} + %s, error = %s""", (max_intentos, reintento, error[:1000]))
+    incrementar('etl_cola_pdfs_total', terminados, resultado='fallido')
+    return terminados
+
+
+def resumen_cola(conn) -> dict:
+    """Cantidad de PDFs por estado."""
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT estado, COUNT(*) FROM ColaPDFs GROUP BY estado")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def latido(worker: str, arriendo: int = ARRIENDO_SEG):
+    """Renueva en segundo plano (cada `arriendo / 3` segundos, con su propia
+    conexión del pool) los arriendos de `worker` mientras dura el bloque."""
+    detener = threading.Event()
+
+    def renovar_periodicamente():
+        while not detener.wait(arriendo / 3):
+            try:
+                with conexion_bd() as conn:
+                    renovar(conn, worker, arriendo)
+            except Exception as e:
+                # Si no se puede renovar, el arriendo vence y otro worker reintenta
+                print(f"[{time.ctime()}] No se pudo renovar el arriendo de {worker}: {e}")
+
+    hilo = threading.Thread(target=renovar_periodicamente, name='latido-cola', daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join()
+
+
+def procesar_lote(worker: str, filenames: list, prueba_path: str, arriendo: int = ARRIENDO_SEG,
+                  **opciones) -> bool:
+    """Ingiere `filenames` (ver `ingesta.ingerir_archivos`) manteniendo su
+    arriendo y registra el resultado en la cola. Retorna True si terminó bien."""
+    try:
+        with latido(worker, arriendo):
+            ingerir_archivos(filenames, prueba_path, registrar_manifiesto=False, **opciones)
+    except Exception as e:
+        print(f"[{time.ctime()}] Error procesando {len(filenames)} PDFs de la cola: {e}")
+        with conexion_bd() as conn:
+            fallar(conn, worker, filenames, str(e))
+        return False
+    with conexion_bd() as conn:
+        completar(conn, worker, filenames)
+    return True
+
+
+class DescubridorPDFs:
+    """Detecta los PDFs nuevos o modificados de la carpeta que ya terminaron
+    de escribirse, usando el escaneo por shards de `escaneo`.
+
+    Un PDF nuevo se confirma en una revisión posterior, pasados al menos
+    `espera` segundos, si su firma (tamaño, `mtime`) no cambió. La primera
+    revisión entrega todos los PDFs presentes. El escaneo vuelve a verificar
+    la firma de los PDFs recientes, así que uno que se siguió escribiendo
+    después de encolarse se vuelve a confirmar y encolar con su nueva firma.
+    Cada `ESCANEOS_POR_REVISION_COMPLETA` revisiones se verifican todos
+    (PDFs sobrescritos en el lugar).
+    """
+
+    def __init__(self, prueba_path: str, espera: float = ESPERA_ESTABLE):
+        self.prueba_path = prueba_path
+        self.espera = espera
+        self._carpetas = {}
+        self._anteriores = None
+        self._por_confirmar = {}    # filename -> (firma, visto_en)
+        self._revisiones = 0
+
+    def revisar(self) -> dict:
+        """`{filename: (size, mtime_ns)}` de los PDFs listos para encolar."""
+        self._revisiones += 1
+        completo = self._revisiones % ESCANEOS_POR_REVISION_COMPLETA == 0
+        firmas, _ = escanear_pdfs(self.prueba_path, self._carpetas, completo=completo)
+        ahora = time.monotonic()
+        if self._anteriores is None:
+            listos = dict(firmas)
+        else:
+            listos = {}
+            for filename, (firma, visto_en) in list(self._por_confirmar.items()):
+                if ahora - visto_en < self.espera:
+                    continue
+                del self._por_confirmar[filename]
+                # Si se sigue escribiendo, su nueva firma lo vuelve a poner por confirmar
+                if _firma(os.path.join(self.prueba_path, filename)) == firma:
+                    listos[filename] = firma
+            for filename, firma in firmas.items():
+                if self._anteriores.get(filename) != firma and filename not in listos:
+                    self._por_confirmar[filename] = (firma, ahora)
+        self._anteriores = firmas
+        return listos
+
+
+def ejecutar_worker(prueba_path: str = 'Facturas', intervalo: float = 30, cantidad: int = LOTE_WORKER,
+                    arriendo: int = ARRIENDO_SEG, una_vez: bool = False, **opciones) -> None:
+    """Bucle de un worker: descubrir y encolar PDFs, tomar un lote, procesarlo.
+
+    Mientras haya trabajo no se espera `intervalo`. Con `una_vez` sale
+    cuando la cola no tiene PDFs disponibles. Los errores de la BD (también
+    al registrar el resultado de un lote) se informan y se reintenta en la
+    siguiente vuelta; los PDFs de un lote sin registrar vuelven a la cola
+    cuando vence su arriendo.
+
+    `opciones` (`workers`, `backend`, `batch_size`) se pasan a la ingesta.
+    """
+    worker = id_worker()
+    descubridor = DescubridorPDFs(prueba_path)
+    with conexion_bd() as conn:
+        init_tables(conn)
+    print(f"[{time.ctime()}] Worker {worker} procesando la cola de {prueba_path}")
+
+    while True:
+        try:
+            with conexion_bd() as conn:
+                encolados = encolar(conn, descubridor.revisar())
+                if encolados:
+                    print(f"[{time.ctime()}] {encolados} PDFs nuevos en la cola")
+                filenames = reclamar(conn, worker, cantidad, arriendo)
+        except errores_bd() as e:
+            print(f"[{time.ctime()}] Error de base de datos en el worker {worker}: {e}")
+            time.sleep(intervalo)
+            continue
+
+        if filenames:
+            print(f"[{time.ctime()}] Worker {worker} tomó {len(filenames)} PDFs: {filenames}")
+            try:
+                procesar_lote(worker, filenames, prueba_path, arriendo, **opciones)
+            except errores_bd() as e:
+                # No se pudo registrar el resultado: el arriendo vence y otro worker los retoma
+                print(f"[{time.ctime()}] Error de base de datos en el worker {worker}: {e}")
+                time.sleep(intervalo)
+            continue
+        if una_vez:
+            with conexion_bd() as conn:
+                print(f"[{time.ctime()}] Cola sin PDFs disponibles: {resumen_cola(conn)}")
+            return
+        time.sleep(intervalo)
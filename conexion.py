@@ -1,7 +1,49 @@
-import mysql.connector
 import os
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from migraciones import aplicar_migraciones
+from conexion_sqlite import conectar_sqlite, dialecto
+from decimal import Decimal, InvalidOperation
+
+try:
+    import mysql.connector
+except ImportError:  # solo hace falta con DB_BACKEND=mysql
+    mysql = None
+
+BACKENDS_BD = ('mysql', 'sqlite')
+SQLITE_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'facturas.sqlite3')
+
+def backend_bd():
+    """Motor configurado en DB_BACKEND ('mysql' por defecto o 'sqlite')."""
+    nombre = os.getenv('DB_BACKEND', 'mysql').lower()
+    if nombre not in BACKENDS_BD:
+        raise ValueError(f"DB_BACKEND desconocido: {nombre}. Opciones: {', '.join(BACKENDS_BD)}")
+    return nombre
+
+def errores_bd():
+    """Excepciones de los drivers de base de datos (para capturarlas sin importar el motor)."""
+    return (sqlite3.Error, mysql.connector.Error) if mysql is not None else (sqlite3.Error,)
+
+def _errores_tabla_inexistente():
+    """Excepciones que lanza cada driver al consultar una tabla que no existe."""
+    if mysql is None:
+        return (sqlite3.OperationalError,)
+    return (sqlite3.OperationalError, mysql.connector.errors.ProgrammingError)
 
 def create_connection():
+    """Abre una conexión al motor configurado en DB_BACKEND.
+    
+    - mysql: credenciales DB_HOST, DB_NAME, DB_USER y DB_PASSWORD.
+    - sqlite: archivo DB_SQLITE_PATH (por defecto `facturas.sqlite3` junto al proyecto).
+    """
+    if backend_bd() == 'sqlite':
+        return conectar_sqlite(os.getenv('DB_SQLITE_PATH', SQLITE_POR_DEFECTO))
+    if mysql is None:
+        raise ImportError("mysql-connector-python no está instalado (o usa DB_BACKEND=sqlite)")
+    
     # Cargar variables de entorno (requiere archivo .env)
     host = os.getenv('DB_HOST')
     database = os.getenv('DB_NAME')
@@ -19,11 +61,147 @@ def create_connection():
     )
     return connection
 
+class PoolConexiones:
+    """Pool de conexiones reutilizables (MySQL o SQLite), seguro entre hilos.
+    
+    - Como máximo `tamano` conexiones abiertas; si todas están en uso,
+      `obtener` espera hasta `timeout` segundos.
+    - Las conexiones con más de `reciclar_seg` segundos de vida se cierran y
+      se reabren al pedirlas (evita cortes por `wait_timeout` del servidor).
+    - Las que estuvieron ociosas más de `ping_seg` segundos se verifican con
+      un ping antes de entregarlas; si están caídas se reemplazan.
+    """
+    
+    def __init__(self, tamano=5, reciclar_seg=1800, ping_seg=30, timeout=30, fabrica=create_connection):
+        self.tamano = tamano
+        self.timeout = timeout
+        self.reciclar_seg = reciclar_seg
+        self.ping_seg = ping_seg
+        self._fabrica = fabrica
+        self._libres = queue.LifoQueue()       # (conn, creada_en, usada_en)
+        self._cupos = threading.BoundedSemaphore(tamano)
+        self._creadas = {}                     # id(conn) -> creada_en
+        self._lock = threading.Lock()
+    
+    def _nueva(self):
+        conn = self._fabrica()
+        with self._lock:
+            self._creadas[id(conn)] = time.monotonic()
+        return conn
+    
+    def _descartar(self, conn):
+        with self._lock:
+            self._creadas.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _sana(self, conn, creada_en, usada_en):
+        ahora = time.monotonic()
+        if ahora - creada_en > self.reciclar_seg:
+            return False
+        if ahora - usada_en > self.ping_seg:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+    
+    def obtener(self):
+        """Entrega una conexión del pool (o una nueva si no hay libres)."""
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No hay conexiones libres en el pool (tamaño {self.tamano})")
+        try:
+            while True:
+                try:
+                    conn, creada_en, usada_en = self._libres.get_nowait()
+                except queue.Empty:
+                    return self._nueva()
+                if self._sana(conn, creada_en, usada_en):
+                    return conn
+                self._descartar(conn)
+        except Exception:
+            self._cupos.release()
+            raise
+    
+    def devolver(self, conn, descartar=False):
+        """Devuelve `conn` al pool. Con `descartar` (p.ej. tras un error) se cierra."""
+        try:
+            with self._lock:
+                creada_en = self._creadas.get(id(conn))
+            if descartar or creada_en is None:
+                self._descartar(conn)
+                return
+            try:
+                # No dejar transacciones abiertas para el próximo usuario
+                conn.rollback()
+            except Exception:
+                self._descartar(conn)
+                return
+            self._libres.put((conn, creada_en, time.monotonic()))
+        finally:
+            self._cupos.release()
+    
+    def cerrar(self):
+        """Cierra las conexiones libres del pool."""
+        while True:
+            try:
+                conn, _, _ = self._libres.get_nowait()
+            except queue.Empty:
+                return
+            self._descartar(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def obtener_pool():
+    """Pool compartido del proceso (se crea en el primer uso).
+    
+    Configurable con variables de entorno (.env): DB_POOL_SIZE (conexiones),
+    DB_POOL_RECYCLE (segundos de vida máxima), DB_POOL_PING (segundos ociosa
+    antes de verificarla) y DB_POOL_TIMEOUT (espera por una conexión libre).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexiones(
+                tamano=int(os.getenv('DB_POOL_SIZE', '5')),
+                reciclar_seg=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+                ping_seg=int(os.getenv('DB_POOL_PING', '30')),
+                timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+            )
+        return _pool
+
+@contextmanager
+def conexion_bd():
+    """Context manager que toma una conexión del pool compartido y la devuelve al salir.
+    
+    Uso:
+        with conexion_bd() as conn:
+            ...
+    
+    Si el bloque lanza una excepción del driver de la BD la conexión se descarta.
+    """
+    pool = obtener_pool()
+    conn = pool.obtener()
+    descartar = False
+    try:
+        yield conn
+    except errores_bd():
+        descartar = True
+        raise
+    finally:
+        pool.devolver(conn, descartar=descartar)
+
 def create_tables(conn):
+    # SQLite solo autoincrementa con INTEGER PRIMARY KEY
+    id_columna = ("id INTEGER PRIMARY KEY AUTOINCREMENT" if dialecto(conn) == 'sqlite'
+                  else "id INT AUTO_INCREMENT PRIMARY KEY")
     cursor = conn.cursor(buffered=True)
     try:
-        cursor.execute("""CREATE TABLE IF NOT EXISTS Facturas (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS Facturas (
+            {id_columna},
             filename VARCHAR(50),
             nombre VARCHAR(255),
             fecha DATE,
@@ -32,8 +210,8 @@ def create_tables(conn):
             total DECIMAL(10,2),
             consumo_m3 DECIMAL(10,2)
         )""")
-        cursor.execute("""CREATE TABLE IF NOT EXISTS Detalles (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS Detalles (
+            {id_columna},
             factura_id INT,
             concepto VARCHAR(255),
             valor_pagar DECIMAL(10,2),
@@ -45,12 +223,20 @@ def create_tables(conn):
 
 def init_tables(conn):
     create_tables(conn)
+    # Índices y cambios de esquema sobre bases de datos ya existentes
+    aplicar_migraciones(conn)
+
+# Columnas de Facturas en el orden de las tuplas de `preparar_factura` (corregir_cargar)
+COLUMNAS_FACTURA = "filename, nombre, fecha, gas, credito, total, consumo_m3, contrato, periodo, numero_factura"
+INSERT_FACTURA = f"INSERT INTO Facturas ({COLUMNAS_FACTURA}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
 
-def insert_factura(conn, filename, nombre, fecha, gas, credito, total, consumo_m3):
+def insert_factura(conn, filename, nombre, fecha, gas, credito, total, consumo_m3,
+                   contrato='', periodo='', numero_factura=None):
     cursor = conn.cursor(buffered=True)
     try:
-        cursor.execute("INSERT INTO Facturas VALUES (NULL, %s, %s, %s, %s, %s, %s, %s)",
-                       (filename, nombre, fecha, gas, credito, total, consumo_m3))
+        cursor.execute(INSERT_FACTURA,
+                       (filename, nombre, fecha, gas, credito, total, consumo_m3,
+                        contrato, periodo, numero_factura))
         factura_id = cursor.lastrowid
         conn.commit()
         return factura_id
@@ -75,16 +261,16 @@ def get_factura_id_by_filename(conn, filename):
     finally:
         cursor.close()
 
-def get_all_filenames(conn):
-    """Obtiene todos los filenames existentes en la tabla Facturas.
+def get_all_claves(conn):
+    """Obtiene las claves (contrato, periodo) de todas las facturas de la BD.
     
-    Retorna un set de filenames para búsqueda rápida O(1).
+    Retorna un set de tuplas para búsqueda rápida O(1).
     """
     cursor = conn.cursor(buffered=True)
     try:
-        cursor.execute("SELECT filename FROM Facturas")
+        cursor.execute("SELECT contrato, periodo FROM Facturas")
         results = cursor.fetchall()
-        return {row[0] for row in results}
+        return {(row[0], row[1]) for row in results}
     finally:
         cursor.close()
 
@@ -96,4 +282,158 @@ def check_detalle_exists(conn, factura_id, concepto, valor_pagar):
         result = cursor.fetchone()
         return result is not None
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+def insert_facturas_lote(conn, rows):
+    """Inserta varias facturas en una sola transacción usando executemany.
+    
+    `rows` es una lista de tuplas con las columnas de `COLUMNAS_FACTURA`.
+    Si algo falla se hace rollback del lote completo.
+    """
+    if not rows:
+        return
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.executemany(INSERT_FACTURA, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def actualizar_facturas_lote(conn, rows):
+    """Reemplaza, en una sola transacción, los datos de facturas ya cargadas.
+    
+    `rows` son tuplas de `COLUMNAS_FACTURA`; cada una actualiza la factura con
+    su misma clave (contrato, periodo), que conserva su id y sus detalles.
+    Retorna cuántas se actualizaron.
+    """
+    if not rows:
+        return 0
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.executemany("""UPDATE Facturas SET filename = %s, nombre = %s, fecha = %s, gas = %s,
+            credito = %s, total = %s, consumo_m3 = %s, numero_factura = %s
+            WHERE contrato = %s AND periodo = %s""",
+                           [(*r[:7], r[9], r[7], r[8]) for r in rows])
+        actualizadas = cursor.rowcount
+        conn.commit()
+        return actualizadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def insert_detalles_lote(conn, rows):
+    """Inserta varios detalles en una sola transacción usando executemany.
+    
+    `rows` es una lista de tuplas (factura_id, concepto, valor_pagar).
+    Si algo falla se hace rollback del lote completo.
+    """
+    if not rows:
+        return
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.executemany("INSERT INTO Detalles VALUES (NULL, %s, %s, %s)", rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def get_factura_ids_by_claves(conn, claves):
+    """Obtiene `{(contrato, periodo): id}` para varias claves en una sola consulta.
+    
+    Usa el índice único `ux_facturas_contrato_periodo`.
+    """
+    claves = list(claves)
+    if not claves:
+        return {}
+    cursor = conn.cursor(buffered=True)
+    try:
+        placeholders = ', '.join(['(%s, %s)'] * len(claves))
+        cursor.execute(f"SELECT contrato, periodo, id FROM Facturas WHERE (contrato, periodo) IN ({placeholders})",
+                       tuple(v for clave in claves for v in clave))
+        return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def adoptar_facturas_legadas(conn, rows):
+    """Asigna contrato, número y filename completo a facturas cargadas antes de
+    existir la clave compuesta (contrato vacío) en lugar de duplicarlas.
+    
+    `rows` son tuplas de `COLUMNAS_FACTURA`; una factura antigua se adopta si
+    coincide en período, fecha y total. Retorna cuántas se adoptaron.
+    """
+    if not rows:
+        return 0
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.executemany("""UPDATE Facturas SET contrato = %s, numero_factura = %s, filename = %s
+            WHERE contrato = '' AND periodo = %s AND fecha = %s AND total = %s""",
+                           [(r[7], r[9], r[0], r[8], r[2], r[5]) for r in rows])
+        adoptadas = cursor.rowcount
+        conn.commit()
+        return adoptadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def get_detalle_keys(conn, factura_ids):
+    """Obtiene en una sola consulta las claves (factura_id, concepto, valor_pagar)
+    de los detalles ya existentes para `factura_ids`.
+    
+    Retorna un set para búsqueda O(1).
+    """
+    factura_ids = list(factura_ids)
+    if not factura_ids:
+        return set()
+    cursor = conn.cursor(buffered=True)
+    try:
+        placeholders = ', '.join(['%s'] * len(factura_ids))
+        cursor.execute(f"SELECT factura_id, concepto, valor_pagar FROM Detalles WHERE factura_id IN ({placeholders})",
+                       tuple(factura_ids))
+        return {(row[0], row[1], normalizar_valor(row[2])) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def normalizar_valor(valor):
+    """Normaliza un monto para comparar valores del CSV ('36156') con los de la BD (Decimal('36156.00'))."""
+    try:
+        return Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        return valor
+
+def get_generacion(conn):
+    """Contador de generación de los datos (cambia cada vez que el ETL carga datos).
+    
+    Retorna 0 si la tabla Metadatos aún no existe (migraciones sin aplicar).
+    """
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT valor FROM Metadatos WHERE clave = 'generacion'")
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    except _errores_tabla_inexistente():
+        return 0
+    finally:
+        cursor.close()
+
+def incrementar_generacion(conn):
+    """Incrementa el contador de generación para invalidar las cachés de la web."""
+    if dialecto(conn) == 'sqlite':
+        upsert = "ON CONFLICT(clave) DO UPDATE SET valor = valor + 1"
+    else:
+        upsert = "ON DUPLICATE KEY UPDATE valor = valor + 1"
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute(f"""INSERT INTO Metadatos (clave, valor) VALUES ('generacion', 1)
+            {upsert}""")
+        conn.commit()
+    finally:
+        cursor.close()
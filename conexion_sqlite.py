@@ -0,0 +1,115 @@
+"""Backend SQLite embebido con la misma interfaz que las conexiones de mysql.connector.
+
+Permite usar `conexion`, `corregir_cargar` y la aplicación web sin un
+servidor MySQL (benchmarks, CI o instalaciones pequeñas de un solo nodo).
+Se elige con `DB_BACKEND=sqlite` y la ruta del archivo con `DB_SQLITE_PATH`.
+
+`ConexionSQLite` imita lo que el proyecto usa de mysql.connector:
+
+- Placeholders `%s` (se traducen a `?`).
+- `cursor(buffered=True, dictionary=True)`, `lastrowid`, `rowcount`,
+  `executemany`, `commit`, `rollback` y `ping`.
+- Las columnas DATE se leen como `datetime.date` y las DECIMAL como
+  `Decimal`, igual que en MySQL.
+
+La base se abre en modo WAL (lectores concurrentes con un escritor) y con
+las claves foráneas activadas. Las diferencias de SQL entre motores se
+resuelven en `conexion` y `migraciones` según `dialecto(conn)`.
+"""
+
+import sqlite3
+import datetime
+from decimal import Decimal, InvalidOperation
+
+
+def _leer_decimal(valor: bytes):
+    texto = valor.decode()
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return texto
+
+
+# Conversión de tipos entre Python y las columnas declaradas en el esquema
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('DATE', lambda v: datetime.date.fromisoformat(v.decode()))
+sqlite3.register_converter('DECIMAL', _leer_decimal)
+
+
+def dialecto(conn_o_cursor) -> str:
+    """'sqlite' para las conexiones/cursores de este módulo, 'mysql' para el resto."""
+    return getattr(conn_o_cursor, 'dialecto', 'mysql')
+
+
+class CursorSQLite:
+    """Cursor con la interfaz de mysql.connector (placeholders `%s`)."""
+
+    dialecto = 'sqlite'
+
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params))
+
+    def executemany(self, sql, filas):
+        self._cursor.executemany(sql.replace('%s', '?'), filas)
+
+    def _fila(self, fila):
+        if fila is None or not self._dictionary:
+            return fila
+        return {col[0]: valor for col, valor in zip(self._cursor.description, fila)}
+
+    def fetchone(self):
+        return self._fila(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._fila(f) for f in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    """Conexión SQLite que se comporta como una de mysql.connector."""
+
+    dialecto = 'sqlite'
+
+    def __init__(self, ruta, timeout=30):
+        # El pool entrega cada conexión a un solo hilo a la vez
+        self._conn = sqlite3.connect(ruta, timeout=timeout, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+
+    def cursor(self, buffered=False, dictionary=False):
+        return CursorSQLite(self._conn, dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+
+def conectar_sqlite(ruta: str) -> ConexionSQLite:
+    """Abre (y crea si no existe) la base SQLite en `ruta`."""
+    return ConexionSQLite(ruta)
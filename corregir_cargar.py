@@ -1,136 +1,326 @@
+import os
 import csv
+import logging
 import datetime
+import argparse
 from dotenv import load_dotenv
 from conexion import *  
+from metricas import incrementar, configurar_logging
+from clave_factura import clave_de_fila, completar_clave, formatear_clave
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+# Filas por lote en la carga masiva (cargar_*_por_lotes)
+TAMANO_LOTE = int(os.getenv('DB_BATCH_SIZE', '500'))
+# Máximo de valores por consulta `IN (...)` al reconciliar detalles
+TAMANO_CONSULTA = int(os.getenv('DB_QUERY_CHUNK', '10000'))
+
+
+def leer_csv(file_path):
+    """Lee un CSV completo como lista de dicts (una por fila)."""
+    with open(file_path, 'r') as f:
+        return list(csv.DictReader(f))
+
+
+def preparar_factura(row):
+    """Convierte una fila del CSV general en la tupla de columnas de `Facturas`
+    (ver `COLUMNAS_FACTURA`): (filename, nombre, fecha, gas, credito, total,
+    consumo_m3, contrato, periodo, numero_factura).
+    """
+    completar_clave(row)
+    # Limitar nombre a solo 2 palabras
+    nombre_completo = row['Nombre']
+    palabras = nombre_completo.split()
+    if len(palabras) > 2:
+        nombre_corto = ' '.join(palabras[:2])
+    else:
+        nombre_corto = nombre_completo
+    
+    return (
+        row['filename'],
+        nombre_corto,
+        datetime.datetime.strptime(row['Fecha'], '%d/%m/%Y').strftime('%Y-%m-%d'),
+        row['Gas'],
+        row['credito'],
+        row['Total'],
+        row['Consumo_m3'],
+        row['Contrato'],
+        row['Periodo'],
+        row['NumeroFactura'] or None,
+    )
+
+
+def adoptar_legadas(conn, existentes, facturas):
+    """Adopta las facturas cargadas antes de la clave compuesta (contrato vacío)
+    que corresponden a `facturas` (tuplas de `preparar_factura`) y actualiza
+    `existentes`. Retorna las facturas que siguen siendo nuevas."""
+    candidatas = [f for f in facturas if f[7] and ('', f[8]) in existentes]
+    if not candidatas or not adoptar_facturas_legadas(conn, candidatas):
+        return facturas
+    # `existentes` ya incluye las claves de `facturas`: solo cuentan las que ahora están en la BD
+    en_bd = get_all_claves(conn)
+    existentes |= en_bd
+    return [f for f in facturas if (f[7], f[8]) not in en_bd]
+
+
+def registrar_carga(tabla, insertadas, **saltadas):
+    """Suma a las métricas las filas insertadas en `tabla` y las saltadas por motivo."""
+    incrementar('etl_filas_insertadas_total', insertadas, tabla=tabla)
+    for motivo, cantidad in saltadas.items():
+        incrementar('etl_filas_saltadas_total', cantidad, tabla=tabla, motivo=motivo)
+
 
 def process_generales(conn, file_path):
-    """Procesa el CSV de datos generales y carga solo las facturas nuevas a la BD.
+    """Procesa el CSV de datos generales y carga solo las facturas nuevas a la BD."""
+    process_generales_filas(conn, leer_csv(file_path))
+
+
+def process_generales_filas(conn, rows):
+    """Carga a la BD las filas de datos generales de facturas que aún no existen.
     
-    Optimizado: Obtiene todos los filenames de la BD una sola vez y filtra
-    el CSV para procesar solo las facturas que no existen en la BD.
+    Optimizado: Obtiene todas las claves (contrato, periodo) de la BD una sola
+    vez y filtra las filas para procesar solo las facturas que no existen en la BD.
     """
-    # Obtener todos los filenames existentes en la BD (1 sola consulta)
-    existing_filenames = get_all_filenames(conn)
-    print(f"Facturas existentes en BD: {len(existing_filenames)}")
+    # Obtener todas las claves existentes en la BD (1 sola consulta)
+    existing_claves = get_all_claves(conn)
+    print(f"Facturas existentes en BD: {len(existing_claves)}")
     
     facturas_procesadas = 0
-    facturas_nuevas = 0
+    nuevas = []
     
-    with open(file_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            original_filename = row['filename']
-            base_name = original_filename.rsplit('.', 1)[0]
-            new_filename = base_name[-7:]
-            
-            # Si la factura ya existe en la BD, saltarla
-            if new_filename in existing_filenames:
-                facturas_procesadas += 1
-                continue
-            
-            # Limitar nombre a solo 2 palabras
-            nombre_completo = row['Nombre']
-            palabras = nombre_completo.split()
-            if len(palabras) > 2:
-                nombre_corto = ' '.join(palabras[:2])
-            else:
-                nombre_corto = nombre_completo
-            
-            # Insertar factura nueva
-            factura_id = insert_factura(
-                conn, 
-                new_filename, 
-                nombre_corto, 
-                datetime.datetime.strptime(row['Fecha'], '%d/%m/%Y').strftime('%Y-%m-%d'), 
-                row['Gas'], 
-                row['credito'], 
-                row['Total'], 
-                row['Consumo_m3']
-            )
-            print(f"✓ Insertada factura {factura_id} - {new_filename} ({nombre_corto})")
-            facturas_nuevas += 1
+    for row in rows:
+        clave = clave_de_fila(row)
+        
+        # Si la factura ya existe en la BD, saltarla
+        if clave in existing_claves:
+            facturas_procesadas += 1
+            continue
+        existing_claves.add(clave)
+        nuevas.append(preparar_factura(row))
+    
+    pendientes = adoptar_legadas(conn, existing_claves, nuevas)
+    adoptadas = len(nuevas) - len(pendientes)
+    facturas_nuevas = 0
+    for factura in pendientes:
+        # Insertar factura nueva
+        factura_id = insert_factura(conn, *factura)
+        log.debug("Insertada factura %s - %s (%s)", factura_id, formatear_clave((factura[7], factura[8])), factura[1])
+        facturas_nuevas += 1
     
+    registrar_carga('facturas', facturas_nuevas, existentes=facturas_procesadas, adoptadas=adoptadas)
     print(f"\n--- Resumen process_generales ---")
     print(f"Facturas ya existentes (saltadas): {facturas_procesadas}")
     print(f"Facturas nuevas insertadas: {facturas_nuevas}")
+    if adoptadas:
+        print(f"Facturas anteriores completadas con su contrato: {adoptadas}")
 
 
 def process_especificos(conn, file_path):
-    """Procesa el CSV de datos específicos y carga solo los detalles de facturas nuevas.
+    """Procesa el CSV de datos específicos y carga solo los detalles de facturas nuevas."""
+    process_especificos_filas(conn, leer_csv(file_path))
+
+
+def process_especificos_filas(conn, rows):
+    """Carga a la BD los detalles (ítems) que aún no existen.
     
-    Optimizado: Primero filtra para procesar solo detalles de facturas que
-    existen en la BD, evitando consultas innecesarias.
+    Optimizado: los factura_id y los detalles ya existentes se obtienen en
+    bloque (una consulta cada uno) y la comparación se hace en memoria, así
+    que una corrida sin detalles nuevos cuesta un número constante de consultas.
     """
-    # Obtener todos los filenames existentes en la BD
-    existing_filenames = get_all_filenames(conn)
-    
-    # Crear diccionario para evitar consultas repetidas de factura_id
-    filename_to_id = {}
+    pendientes, detalles_procesados, detalles_saltados = reconciliar_detalles(conn, rows)
     
-    detalles_procesados = 0
-    detalles_nuevos = 0
-    detalles_saltados = 0
-    
-    with open(file_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Saltar filas vacías
-            if not row['Concepto'].strip():
-                continue
-            
-            original_filename = row['filename']
-            base_name = original_filename.rsplit('.', 1)[0]
-            new_filename = base_name[-7:]
-            
-            # Si la factura no existe en la BD, saltar este detalle
-            if new_filename not in existing_filenames:
-                detalles_saltados += 1
-                continue
-            
-            # Obtener factura_id (usar caché para evitar consultas repetidas)
-            if new_filename not in filename_to_id:
-                factura_id = get_factura_id_by_filename(conn, new_filename)
-                if factura_id:
-                    filename_to_id[new_filename] = factura_id
-                else:
-                    detalles_saltados += 1
-                    continue
-            else:
-                factura_id = filename_to_id[new_filename]
-            
-            # Verificar si el detalle ya existe
-            if check_detalle_exists(conn, factura_id, row['Concepto'], row['ValorPagar']):
-                detalles_procesados += 1
-            else:
-                insert_detalles(conn, factura_id, row['Concepto'], row['ValorPagar'])
-                print(f"✓ Insertado detalle para factura {factura_id}: {row['Concepto']}")
-                detalles_nuevos += 1
+    for factura_id, concepto, valor_pagar in pendientes:
+        insert_detalles(conn, factura_id, concepto, valor_pagar)
+        log.debug("Insertado detalle para factura %s: %s", factura_id, concepto)
     
+    registrar_carga('detalles', len(pendientes), existentes=detalles_procesados, sin_factura=detalles_saltados)
     print(f"\n--- Resumen process_especificos ---")
     print(f"Detalles ya existentes (saltados): {detalles_procesados}")
-    print(f"Detalles nuevos insertados: {detalles_nuevos}")
+    print(f"Detalles nuevos insertados: {len(pendientes)}")
     print(f"Detalles sin factura asociada (saltados): {detalles_saltados}")
 
 
-def main():
-    # Crear conexión y tablas antes de procesar
-    conn = create_connection()
-    print("Creando tablas en la base de datos...")
-    init_tables(conn)
-    print("Tablas creadas exitosamente!\n")
+def reconciliar_detalles(conn, rows, tamano_consulta=None):
+    """Compara en memoria las filas de detalles contra la BD.
+    
+    Resuelve los factura_id de todas las facturas involucradas y precarga las
+    claves (factura_id, concepto, valor_pagar) ya existentes, con consultas
+    por bloques de `tamano_consulta` valores (por defecto `TAMANO_CONSULTA`,
+    para no superar el límite de parámetros del motor con cientos de miles
+    de facturas).
+    
+    Retorna `(pendientes, ya_existentes, sin_factura)` donde `pendientes` es la
+    lista de tuplas (factura_id, concepto, valor_pagar) a insertar.
+    """
+    # Saltar filas vacías
+    rows = [r for r in rows if r['Concepto'].strip()]
+    claves = sorted({clave_de_fila(r) for r in rows})
+    tamano = tamano_consulta or TAMANO_CONSULTA
+    
+    clave_to_id = {}
+    for lote in _en_lotes(claves, tamano):
+        clave_to_id.update(get_factura_ids_by_claves(conn, lote))
+    
+    existentes = set()
+    for lote in _en_lotes(sorted(set(clave_to_id.values())), tamano):
+        existentes |= get_detalle_keys(conn, lote)
+    
+    ya_existentes = 0
+    sin_factura = 0
+    pendientes = []
+    for row in rows:
+        # Si la factura no existe en la BD, saltar este detalle
+        factura_id = clave_to_id.get(clave_de_fila(row))
+        if not factura_id:
+            sin_factura += 1
+            continue
+        clave = (factura_id, row['Concepto'], normalizar_valor(row['ValorPagar']))
+        if clave in existentes:
+            ya_existentes += 1
+            continue
+        # Evitar insertar dos veces el mismo detalle en una corrida
+        existentes.add(clave)
+        pendientes.append((factura_id, row['Concepto'], row['ValorPagar']))
+    
+    return pendientes, ya_existentes, sin_factura
 
-    # Run processing
-    print("=== Procesando datos generales ===")
-    process_generales(conn, 'Facturas/datos_generales.csv')
+
+def _en_lotes(items, batch_size):
+    """Divide `items` en listas de a lo sumo `batch_size` elementos."""
+    items = list(items)
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+def cargar_generales_por_lotes(conn, rows, batch_size=TAMANO_LOTE):
+    """Carga masiva de facturas: INSERT multi-fila (executemany) en lotes de
+    `batch_size`, con una transacción por lote.
+    
+    Es idempotente: las facturas ya presentes en la BD (p.ej. de lotes
+    confirmados antes de una interrupción) se saltan al reintentar.
+    Las facturas cargadas antes de la clave compuesta se completan con su
+    contrato en lugar de duplicarse (ver `adoptar_legadas`).
+    Retorna `{(contrato, periodo): factura_id}` de las facturas insertadas.
+    """
+    existing_claves = get_all_claves(conn)
+    print(f"Facturas existentes en BD: {len(existing_claves)}")
+    
+    clave_to_id, facturas_procesadas, adoptadas = insertar_facturas_nuevas(conn, rows, existing_claves, batch_size)
+    print(f"\n--- Resumen cargar_generales_por_lotes ---")
+    print(f"Facturas ya existentes (saltadas): {facturas_procesadas}")
+    print(f"Facturas nuevas insertadas: {len(clave_to_id)}")
+    if adoptadas:
+        print(f"Facturas anteriores completadas con su contrato: {adoptadas}")
+    return clave_to_id
+
+
+def insertar_facturas_nuevas(conn, rows, existing_claves, batch_size=TAMANO_LOTE):
+    """Inserta por lotes las facturas de `rows` cuya clave no está en
+    `existing_claves` (set que se actualiza con las nuevas), sin imprimir
+    resumen. Permite cargar por tandas sin volver a leer todas las claves de
+    la BD en cada una (ver `pipeline_async`).
+    
+    Retorna `(clave_to_id, ya_existentes, adoptadas)`.
+    """
+    facturas_procesadas = 0
+    nuevas = []
+    for row in rows:
+        clave = clave_de_fila(row)
+        if clave in existing_claves:
+            facturas_procesadas += 1
+            continue
+        # Marcarla ya como existente para no insertarla dos veces en la misma corrida
+        existing_claves.add(clave)
+        nuevas.append(preparar_factura(row))
+    
+    pendientes = adoptar_legadas(conn, existing_claves, nuevas)
+    adoptadas = len(nuevas) - len(pendientes)
+    clave_to_id = {}
+    for lote in _en_lotes(pendientes, batch_size):
+        insert_facturas_lote(conn, lote)
+        clave_to_id.update(get_factura_ids_by_claves(conn, [(f[7], f[8]) for f in lote]))
+        log.info("Lote de %d facturas insertado (%d/%d)", len(lote), len(clave_to_id), len(pendientes))
+    
+    registrar_carga('facturas', len(clave_to_id), existentes=facturas_procesadas, adoptadas=adoptadas)
+    return clave_to_id, facturas_procesadas, adoptadas
+
+
+def cargar_especificos_por_lotes(conn, rows, batch_size=TAMANO_LOTE):
+    """Carga masiva de detalles: INSERT multi-fila (executemany) en lotes de
+    `batch_size`, con una transacción por lote.
     
-    print("\n=== Procesando datos específicos ===")
-    process_especificos(conn, 'Facturas/datos_especificos.csv')
+    Los factura_id se resuelven con una consulta por lote de claves y los
+    detalles existentes se precargan por lote de facturas, así que la carga es
+    idempotente: al reintentar tras una interrupción no se duplican detalles.
+    """
+    insertados, detalles_procesados, detalles_saltados = insertar_detalles_nuevos(conn, rows, batch_size)
+    print(f"\n--- Resumen cargar_especificos_por_lotes ---")
+    print(f"Detalles ya existentes (saltados): {detalles_procesados}")
+    print(f"Detalles nuevos insertados: {insertados}")
+    print(f"Detalles sin factura asociada (saltados): {detalles_saltados}")
+
+
+def insertar_detalles_nuevos(conn, rows, batch_size=TAMANO_LOTE):
+    """Inserta por lotes los detalles de `rows` que aún no existen, sin
+    imprimir resumen. Retorna `(insertados, ya_existentes, sin_factura)`."""
+    pendientes, detalles_procesados, detalles_saltados = reconciliar_detalles(conn, rows)
+    
+    for i, lote in enumerate(_en_lotes(pendientes, batch_size), 1):
+        insert_detalles_lote(conn, lote)
+        log.info("Lote %d de %d detalles insertado", i, len(lote))
+    
+    registrar_carga('detalles', len(pendientes), existentes=detalles_procesados, sin_factura=detalles_saltados)
+    return len(pendientes), detalles_procesados, detalles_saltados
+
+
+def cargar_filas(conn, entradas, items, batch_size=0):
+    """Carga filas de datos generales y sus detalles (p.ej. de PDFs recién procesados).
     
-    conn.close()
+    Con `batch_size` > 0 usa la carga masiva por lotes; si no, fila por fila.
+    """
+    print(f"Procesando {len(entradas)} facturas y {len(items)} detalles nuevos...")
+    if batch_size > 0:
+        cargar_generales_por_lotes(conn, entradas, batch_size)
+        cargar_especificos_por_lotes(conn, items, batch_size)
+    else:
+        process_generales_filas(conn, entradas)
+        process_especificos_filas(conn, items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga los CSVs de Facturas a la base de datos')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help=f'Carga masiva en lotes de N filas (0 = fila por fila; DB_BATCH_SIZE={TAMANO_LOTE})')
+    parser.add_argument('--log-level', default=None,
+                        help='Nivel de logging (DEBUG muestra cada fila insertada; por defecto LOG_LEVEL o WARNING)')
+    args = parser.parse_args()
+    configurar_logging(args.log_level)
+
+    # Crear conexión (del pool compartido) y tablas antes de procesar
+    with conexion_bd() as conn:
+        print("Creando tablas en la base de datos...")
+        init_tables(conn)
+        print("Tablas creadas exitosamente!\n")
+
+        # Run processing
+        print("=== Procesando datos generales ===")
+        if args.batch_size > 0:
+            cargar_generales_por_lotes(conn, leer_csv('Facturas/datos_generales.csv'), args.batch_size)
+        else:
+            process_generales(conn, 'Facturas/datos_generales.csv')
+        
+        print("\n=== Procesando datos específicos ===")
+        if args.batch_size > 0:
+            cargar_especificos_por_lotes(conn, leer_csv('Facturas/datos_especificos.csv'), args.batch_size)
+        else:
+            process_especificos(conn, 'Facturas/datos_especificos.csv')
+        
+        # Invalida las cachés de la aplicación web
+        incrementar_generacion(conn)
+
     print("\n✓ Proceso completado exitosamente!")
 
 if __name__ == "__main__":
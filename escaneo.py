@@ -0,0 +1,149 @@
+"""Escaneo recursivo y por carpetas (shards) de los PDFs de `Facturas`.
+
+Además de la carpeta plana, los PDFs pueden organizarse en subcarpetas
+(p.ej. `Facturas/<año>/<mes>/` o una por contrato). Cada PDF se identifica
+por su ruta relativa a la carpeta raíz con `/` como separador
+(`2024/11/2110376038_1025335_NOV2024.pdf`); en la carpeta plana es solo el
+nombre, como antes.
+
+Cada carpeta es un shard con su propio registro:
+`{ruta_relativa: (mtime_ns, {pdf: (size, mtime_ns)}, [subcarpetas])}`.
+El `mtime` de una carpeta cambia cuando se crean, borran o renombran
+entradas en ella, así que una carpeta cuyo `mtime` no cambió no se vuelve a
+listar: se usan los PDFs y los `stat` registrados la vez anterior. Un
+escaneo sin cambios cuesta un `stat` por carpeta en lugar de un `listdir` y
+un `stat` por PDF.
+
+Escribir en un PDF existente tampoco cambia el `mtime` de su carpeta, así
+que un archivo que se sigue copiando después de listarlo tendría una firma
+vieja para siempre. Por eso los PDFs cuyo `mtime` tiene menos de
+`VENTANA_RECIENTES` segundos se vuelven a consultar con `stat` en cada
+escaneo, aunque su carpeta no haya cambiado, hasta que su firma se asienta.
+
+Un PDF viejo sobrescrito en el lugar (sin crear un archivo nuevo) tampoco
+cambia el `mtime` de su carpeta y su firma registrada queda fuera de la
+ventana. Lo detecta una revisión completa (`completo=True`), que vuelve a
+consultar con `stat` todos los PDFs sin volver a listar las carpetas: los
+bucles la hacen cada `ESCANEOS_POR_REVISION_COMPLETA` escaneos y `--once` en
+cada corrida. Las copias con rename (lo habitual al subir o mover archivos)
+se detectan en cualquier escaneo.
+
+Las carpetas ocultas (`.cache`, etc.) no se recorren. El registro se puede
+persistir en el manifiesto (ver `manifiesto.cargar_carpetas`).
+"""
+
+import os
+import time
+
+
+# Segundos desde su último cambio durante los que la firma de un PDF se
+# sigue verificando con `stat` (ver docstring del módulo)
+VENTANA_RECIENTES = 300
+# Cada cuántos escaneos de un bucle se verifica la firma de todos los PDFs
+ESCANEOS_POR_REVISION_COMPLETA = 20
+
+
+def es_pdf(nombre: str) -> bool:
+    return nombre.lower().endswith('.pdf')
+
+
+def _unir(carpeta_rel: str, nombre: str) -> str:
+    return f"{carpeta_rel}/{nombre}" if carpeta_rel else nombre
+
+
+def _listar_carpeta(ruta: str) -> tuple:
+    """Lista una carpeta con `os.scandir`. Retorna `({pdf: (size, mtime_ns)}, [subcarpetas])`."""
+    pdfs = {}
+    subcarpetas = []
+    with os.scandir(ruta) as it:
+        for e in it:
+            if e.name.startswith('.'):
+                continue
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    subcarpetas.append(e.name)
+                elif es_pdf(e.name) and e.is_file():
+                    # DirEntry.stat() reutiliza lo que ya obtuvo scandir cuando puede
+                    st = e.stat()
+                    pdfs[e.name] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                # Borrado mientras se listaba
+                continue
+    return pdfs, sorted(subcarpetas)
+
+
+def _refrescar_recientes(ruta: str, pdfs: dict, desde_ns: int = None) -> bool:
+    """Vuelve a hacer `stat` de los PDFs de `pdfs` modificados después de
+    `desde_ns` (todos si es None) y actualiza su firma en el lugar. Retorna
+    True si alguna cambió."""
+    cambio = False
+    for nombre, firma in list(pdfs.items()):
+        if desde_ns is not None and firma[1] < desde_ns:
+            continue
+        try:
+            st = os.stat(os.path.join(ruta, nombre))
+        except FileNotFoundError:
+            del pdfs[nombre]
+            cambio = True
+            continue
+        nueva = (st.st_size, st.st_mtime_ns)
+        if nueva != tuple(firma):
+            pdfs[nombre] = nueva
+            cambio = True
+    return cambio
+
+
+def escanear_pdfs(carpeta: str, carpetas: dict = None, ventana: float = VENTANA_RECIENTES,
+                  completo: bool = False) -> tuple:
+    """Recorre `carpeta` y sus subcarpetas.
+
+    `carpetas` es el registro por shard de un escaneo anterior (se actualiza
+    en el lugar); sin él se listan todas las carpetas. En las carpetas que no
+    cambiaron se vuelve a consultar la firma de los PDFs modificados en los
+    últimos `ventana` segundos, o la de todos con `completo`.
+
+    Retorna `(firmas, rescaneadas)`: `{ruta_relativa: (size, mtime_ns)}` de
+    todos los PDFs y la lista de carpetas cuyo registro cambió (se volvieron
+    a listar o cambió la firma de un PDF que se volvió a consultar).
+    """
+    if carpetas is None:
+        carpetas = {}
+    desde_ns = None if completo else time.time_ns() - int(ventana * 1e9)
+    firmas = {}
+    rescaneadas = []
+    visitadas = set()
+    pila = ['']
+    while pila:
+        rel = pila.pop()
+        ruta = os.path.join(carpeta, rel) if rel else carpeta
+        try:
+            mtime_ns = os.stat(ruta).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        visitadas.add(rel)
+        registro = carpetas.get(rel)
+        if registro is None or registro[0] != mtime_ns:
+            try:
+                pdfs, subcarpetas = _listar_carpeta(ruta)
+            except FileNotFoundError:
+                continue
+            registro = carpetas[rel] = (mtime_ns, pdfs, subcarpetas)
+            rescaneadas.append(rel)
+        elif _refrescar_recientes(ruta, registro[1], desde_ns):
+            rescaneadas.append(rel)
+        _, pdfs, subcarpetas = registro
+        for nombre, firma in pdfs.items():
+            firmas[_unir(rel, nombre)] = tuple(firma)
+        pila.extend(_unir(rel, s) for s in reversed(subcarpetas))
+
+    # Carpetas que ya no existen
+    for rel in [r for r in carpetas if r not in visitadas]:
+        del carpetas[rel]
+    return firmas, rescaneadas
+
+
+def listar_pdfs(carpeta: str, carpetas: dict = None) -> list:
+    """Rutas relativas de los PDFs de `carpeta` y sus subcarpetas, ordenadas."""
+    firmas, _ = escanear_pdfs(carpeta, carpetas)
+    return sorted(firmas)
+
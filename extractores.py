@@ -0,0 +1,104 @@
+"""Backends de extracción de texto para PDFs.
+
+Cada backend es una función `ruta -> lista de textos por página`. El backend se
+elige por nombre (`pypdf`, `pymupdf` o `pdfplumber`); si no se indica, se usa la
+variable de entorno `EXTRACTOR_PDF` y, en su defecto, `pypdf`.
+
+Para comparar velocidad y calidad de los backends sobre la carpeta `Facturas`
+ver `benchmark_extractores.py`.
+"""
+
+import os
+import importlib.util
+
+
+BACKEND_POR_DEFECTO = 'pypdf'
+
+
+def paginas_pypdf(path: str) -> list:
+    """Extrae el texto de cada página con `pypdf`."""
+    from pypdf import PdfReader
+
+    texts = []
+    reader = PdfReader(path)
+    for page in reader.pages:
+        try:
+            t = page.extract_text() or ''
+        except Exception:
+            t = ''
+        texts.append(t)
+    return texts
+
+
+def paginas_pymupdf(path: str) -> list:
+    """Extrae el texto de cada página con `pymupdf` (normalmente el más rápido)."""
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+
+    texts = []
+    with pymupdf.open(path) as doc:
+        for page in doc:
+            try:
+                t = page.get_text() or ''
+            except Exception:
+                t = ''
+            texts.append(t)
+    return texts
+
+
+def paginas_pdfplumber(path: str) -> list:
+    """Extrae el texto de cada página con `pdfplumber`."""
+    import pdfplumber
+
+    texts = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            try:
+                t = page.extract_text() or ''
+            except Exception:
+                t = ''
+            texts.append(t)
+    return texts
+
+
+BACKENDS = {
+    'pypdf': paginas_pypdf,
+    'pymupdf': paginas_pymupdf,
+    'pdfplumber': paginas_pdfplumber,
+}
+
+# Módulos que debe poder importar cada backend (cualquiera de ellos basta)
+_MODULOS = {
+    'pypdf': ('pypdf',),
+    'pymupdf': ('pymupdf', 'fitz'),
+    'pdfplumber': ('pdfplumber',),
+}
+
+
+def backend_configurado() -> str:
+    """Nombre del backend configurado vía `EXTRACTOR_PDF` (o el de por defecto)."""
+    return os.getenv('EXTRACTOR_PDF') or BACKEND_POR_DEFECTO
+
+
+def validar_backend(nombre: str) -> str:
+    """Retorna `nombre` si corresponde a un backend conocido; si no, lanza ValueError."""
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de extracción desconocido: {nombre}. Opciones: {', '.join(BACKENDS)}")
+    return nombre
+
+
+def backend_disponible(nombre: str) -> bool:
+    """Indica si la librería del backend `nombre` está instalada."""
+    return any(importlib.util.find_spec(m) is not None for m in _MODULOS[validar_backend(nombre)])
+
+
+def extraer_paginas(path: str, backend: str = BACKEND_POR_DEFECTO) -> list:
+    """Extrae el texto de cada página de `path` con el backend indicado."""
+    return BACKENDS[validar_backend(backend)](path)
+
+
+def extraer_texto(path: str, backend: str = BACKEND_POR_DEFECTO) -> str:
+    """Extrae el texto completo de `path` (páginas unidas por salto de línea)."""
+    return "\n".join(extraer_paginas(path, backend))
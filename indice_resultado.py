@@ -0,0 +1,140 @@
+"""Índice de acceso aleatorio sobre `resultado.txt`.
+
+Junto a `resultado.txt` se guarda `resultado.txt.idx` (JSON) con, para cada
+factura, el offset en bytes y la longitud de su bloque y un CRC32 del bloque.
+También se registra el tamaño y `mtime` del texto para detectar un índice
+desactualizado.
+
+`leer_bloque` abre el texto con `mmap` y devuelve solo el bloque pedido, de
+modo que volver a parsear una factura cuesta O(tamaño del bloque) y no
+O(tamaño del corpus).
+
+Uso (depuración):
+    python indice_resultado.py 2110376038_1025335_NOV2024.pdf
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+
+INDICE_SUFIJO = '.idx'
+INDICE_VERSION = 1
+
+# Mismo separador que `analisis_general.separador_re`, sobre bytes
+_separador_re = re.compile(rb'^-----\s*(.+?)\s*-----\s*$', flags=re.MULTILINE)
+
+
+@contextmanager
+def _abrir_mmap(f, size: int):
+    """mmap de solo lectura sobre `f` (tolera archivos vacíos)."""
+    if size == 0:
+        yield b''
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mm
+    finally:
+        mm.close()
+
+
+def ruta_indice(txt_path: str) -> str:
+    """Ruta del índice sidecar de `txt_path`."""
+    return txt_path + INDICE_SUFIJO
+
+
+def construir_indice(txt_path: str) -> dict:
+    """Recorre `txt_path` una vez y escribe su índice sidecar. Retorna el índice.
+
+    Cada entrada es `filename -> [offset, longitud, crc32]`, donde el rango
+    cubre el bloque entre su separador y el siguiente (sin el salto de línea
+    que cierra el separador).
+    """
+    st = os.stat(txt_path)
+    bloques = {}
+    with open(txt_path, 'rb') as f:
+        with _abrir_mmap(f, st.st_size) as data:
+            matches = list(_separador_re.finditer(data))
+            for i, m in enumerate(matches):
+                name = m.group(1).strip().decode('utf-8')
+                start = m.end()
+                end = matches[i+1].start() if i+1 < len(matches) else st.st_size
+                bloques[name] = [start, end - start, zlib.crc32(data[start:end])]
+
+    indice = {
+        'version': INDICE_VERSION,
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'bloques': bloques,
+    }
+    tmp_path = ruta_indice(txt_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False)
+    os.replace(tmp_path, ruta_indice(txt_path))
+    return indice
+
+
+def cargar_indice(txt_path: str) -> dict:
+    """Carga el índice de `txt_path`, reconstruyéndolo si falta o está desactualizado."""
+    st = os.stat(txt_path)
+    try:
+        with open(ruta_indice(txt_path), 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        if (indice.get('version') == INDICE_VERSION and indice.get('size') == st.st_size
+                and indice.get('mtime') == st.st_mtime_ns):
+            return indice
+    except (OSError, ValueError):
+        pass
+    return construir_indice(txt_path)
+
+
+def leer_bloque(prueba_path: str, filename: str, txt_nombre: str = 'resultado.txt') -> Optional[str]:
+    """Retorna el bloque de texto de `filename` tal como lo ven los parsers
+    (saltos de línea normalizados y sin espacios en los extremos), o None si
+    la factura no está en `resultado.txt`.
+
+    Solo se lee del disco el rango de bytes del bloque. Si el CRC no coincide
+    (el archivo cambió sin actualizar su `mtime`), el índice se reconstruye.
+    """
+    txt_path = os.path.join(prueba_path, txt_nombre)
+    if not os.path.isfile(txt_path):
+        raise FileNotFoundError(f"No existe el archivo de texto: {txt_path}")
+
+    indice = cargar_indice(txt_path)
+    for _ in range(2):
+        entrada = indice['bloques'].get(filename)
+        if entrada is None:
+            return None
+        offset, longitud, crc = entrada
+        with open(txt_path, 'rb') as f:
+            with _abrir_mmap(f, os.fstat(f.fileno()).st_size) as data:
+                raw = data[offset:offset + longitud]
+        if zlib.crc32(raw) == crc:
+            texto = raw.decode('utf-8')
+            # Igual que al leer en modo texto: \r\n y \r se convierten en \n
+            return texto.replace('\r\n', '\n').replace('\r', '\n').strip()
+        indice = construir_indice(txt_path)
+    return None
+
+
+def listar_facturas(prueba_path: str, txt_nombre: str = 'resultado.txt') -> list:
+    """Nombres de archivo presentes en `resultado.txt`, en el orden del archivo."""
+    indice = cargar_indice(os.path.join(prueba_path, txt_nombre))
+    return sorted(indice['bloques'], key=lambda k: indice['bloques'][k][0])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Uso: python indice_resultado.py <archivo.pdf> [carpeta]")
+        sys.exit(1)
+    carpeta = sys.argv[2] if len(sys.argv) > 2 else 'Facturas'
+    bloque = leer_bloque(carpeta, sys.argv[1])
+    if bloque is None:
+        print(f"No se encontró '{sys.argv[1]}' en {carpeta}/resultado.txt")
+        sys.exit(1)
+    print(bloque)
@@ -0,0 +1,98 @@
+"""Ingesta de PDFs puntuales: extraer, parsear y cargar a la BD solo esos archivos.
+
+Lo usan el modo `--incremental` de `main.py` y la cola de trabajos de la
+aplicación web (al subir una factura se ingiere de inmediato, sin esperar al
+monitoreo ni reprocesar la carpeta completa).
+
+Como ambos procesos pueden reescribir los CSVs de la misma carpeta, la
+fusión y el registro en el manifiesto se hacen con un bloqueo de archivo
+(`Facturas/.ingesta.lock`) cuando el sistema lo soporta (fcntl). La
+extracción, el parseo y la carga a la BD quedan fuera del bloqueo, así que
+varios workers pueden ingerir en paralelo.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from procesamiento_streaming import parsear_archivos, fusionar_filas
+from corregir_cargar import conexion_bd, init_tables, cargar_filas, incrementar_generacion
+from manifiesto import registrar_procesamiento
+from metricas import cronometro, incrementar
+
+
+BLOQUEO_NOMBRE = '.ingesta.lock'
+
+
+@contextmanager
+def bloqueo_carpeta(prueba_path: str):
+    """Bloqueo exclusivo entre procesos sobre los CSVs de `prueba_path`."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(prueba_path, BLOQUEO_NOMBRE), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def registrar_con_bloqueo(prueba_path: str, archivos: list, estado_extraccion: str, estado_carga: str) -> None:
+    """`registrar_procesamiento` con el bloqueo de la carpeta."""
+    with bloqueo_carpeta(prueba_path):
+        registrar_procesamiento(prueba_path, archivos, estado_extraccion, estado_carga)
+
+
+def ingerir_archivos(nuevos_archivos: list, prueba_path: str = 'Facturas',
+                     csv_general: str = 'datos_generales.csv', csv_especifico: str = 'datos_especificos.csv',
+                     workers: int = 1, backend: Optional[str] = None, batch_size: int = 0,
+                     progreso: Optional[Callable[[str], None]] = None, registrar_manifiesto: bool = True) -> dict:
+    """Extrae y parsea `nuevos_archivos`, fusiona sus filas en los CSVs y las carga a la BD.
+
+    `progreso`, si se indica, recibe el nombre de cada etapa ('extrayendo',
+    'cargando'). El resultado de cada etapa se registra en el manifiesto de
+    la carpeta (ver `manifiesto`), salvo con `registrar_manifiesto=False`
+    (los workers de `cola_pdfs` llevan el estado en la BD). Los errores se
+    propagan al llamador.
+
+    Retorna `{'facturas': n, 'detalles': m}` con las filas incorporadas.
+    """
+    if progreso:
+        progreso('extrayendo')
+    try:
+        archivos, entradas, items = parsear_archivos(nuevos_archivos, prueba_path,
+                                                     workers=workers, backend=backend)
+        # Solo la fusión reescribe archivos compartidos con otros procesos
+        with bloqueo_carpeta(prueba_path):
+            entradas, items = fusionar_filas(prueba_path, archivos, entradas, items,
+                                             csv_general=csv_general, csv_especifico=csv_especifico)
+    except Exception:
+        incrementar('etl_errores_total', etapa='extraccion')
+        if registrar_manifiesto:
+            registrar_con_bloqueo(prueba_path, nuevos_archivos, 'error', 'pendiente')
+        raise
+    print(f"[{time.ctime()}] CSVs fusionados: {len(entradas)} facturas, {len(items)} detalles")
+
+    if progreso:
+        progreso('cargando')
+    try:
+        with cronometro('carga'), conexion_bd() as conn:
+            init_tables(conn) # Asegurar que las tablas existan
+            cargar_filas(conn, entradas, items, batch_size)
+            # Invalida las cachés de la aplicación web
+            incrementar_generacion(conn)
+    except Exception:
+        if registrar_manifiesto:
+            registrar_con_bloqueo(prueba_path, nuevos_archivos, 'ok', 'error')
+        raise
+    if registrar_manifiesto:
+        registrar_con_bloqueo(prueba_path, nuevos_archivos, 'ok', 'ok')
+
+    return {'facturas': len(entradas), 'detalles': len(items)}
@@ -5,18 +5,35 @@ Monitorea la carpeta `Facturas` y, al detectar PDFs nuevos, regenera
 `datos_especificos.csv` llamando a las funciones existentes.
 
 OPTIMIZADO: Solo carga a la BD las facturas que no existen, comparando
-los filenames normalizados entre la BD y el CSV.
+las claves (contrato, período) entre la BD y el CSV (ver `clave_factura`).
 
 Incluye un modo `--once` para ejecutar una sola iteración (útil para pruebas).
+
+Con `--pipeline` la extracción, el parseo y la carga a la BD corren
+solapados (ver `pipeline_async`).
+
+Con `--worker` varias instancias (en una o más máquinas) se reparten los
+PDFs mediante la cola con arriendos de la base de datos (ver `cola_pdfs`).
 """
 
 import os
 import time
 import csv
+import json
 import argparse
 from analisis_general import leer_pdfs_y_guardar_txt, parse_resultado_y_guardar_csv
 from analisis_especifico import parse_resultado_y_guardar_especifico
-from corregir_cargar import create_connection, init_tables, process_generales, process_especificos
+from extractores import BACKENDS
+from procesamiento_streaming import procesar_streaming
+from pipeline_async import ejecutar_pipeline
+from ingesta import ingerir_archivos, bloqueo_carpeta, registrar_con_bloqueo
+from escaneo import listar_pdfs
+from vigilante import vigilar_carpeta
+from manifiesto import abrir_manifiesto, esta_vacio, pendientes, registrar, escanear
+from metricas import cronometro, configurar_logging, resumen
+from cola_pdfs import ejecutar_worker, LOTE_WORKER, ARRIENDO_SEG
+from corregir_cargar import (conexion_bd, init_tables, process_generales, process_especificos, leer_csv,
+                             cargar_generales_por_lotes, cargar_especificos_por_lotes, incrementar_generacion)
 
 
 # Directorio y nombres
@@ -26,8 +43,49 @@ CSV_GENERAL = 'datos_generales.csv'
 CSV_ESPECIFICO = 'datos_especificos.csv'
 
 
-def asegurar_csvs_existen() -> None:
-    """Asegura que los CSVs existan. Si no existen, los crea ejecutando el proceso de extracción."""
+def generar_csvs(workers: int = 1, backend: str = None, streaming: bool = False, guardar_txt: bool = False) -> tuple:
+    """Extrae el texto de todos los PDFs de la carpeta y genera ambos CSVs.
+
+    `workers` es la cantidad de procesos usados para extraer el texto de los
+    PDFs y `backend` la librería de extracción (ver `extractores`).
+
+    Con `streaming` el texto pasa directamente de la extracción a los parsers
+    (ver `procesamiento_streaming`) y `resultado.txt` solo se escribe si
+    `guardar_txt` es True. Retorna `(ruta_csv_general, ruta_csv_especifico)`.
+    """
+    if streaming:
+        return procesar_streaming(CARPETA_FACTURAS, csv_general=CSV_GENERAL, csv_especifico=CSV_ESPECIFICO,
+                                  txt_debug=RESULTADO_NOMBRE if guardar_txt else None,
+                                  workers=workers, backend=backend)
+
+    # Extraer texto de todos los PDFs de la carpeta y escribir resultado.txt
+    leer_pdfs_y_guardar_txt(CARPETA_FACTURAS, salida_nombre=RESULTADO_NOMBRE, workers=workers, backend=backend)
+
+    # Generar CSV general y específico usando el resultado recién creado
+    csv_g = parse_resultado_y_guardar_csv(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_GENERAL)
+    csv_e = parse_resultado_y_guardar_especifico(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_ESPECIFICO)
+    return csv_g, csv_e
+
+
+def generar_y_cargar(workers: int = 1, backend: str = None, batch_size: int = 0) -> tuple:
+    """Genera ambos CSVs y carga las facturas nuevas a la BD con las etapas
+    solapadas (ver `pipeline_async`).
+
+    Retorna `(ruta_csv_general, ruta_csv_especifico, cargado)`, donde
+    `cargado` es True si la carga a la BD terminó sin errores.
+    """
+    totales = ejecutar_pipeline(CARPETA_FACTURAS, csv_general=CSV_GENERAL, csv_especifico=CSV_ESPECIFICO,
+                                workers=workers, backend=backend, batch_size=batch_size)
+    return (os.path.join(CARPETA_FACTURAS, CSV_GENERAL), os.path.join(CARPETA_FACTURAS, CSV_ESPECIFICO),
+            totales['error'] is None)
+
+
+def asegurar_csvs_existen(pipeline: bool = False, batch_size: int = 0, **opciones) -> None:
+    """Asegura que los CSVs existan. Si no existen, los crea ejecutando el proceso de extracción.
+
+    `opciones` se pasan a `generar_csvs`. Con `pipeline` se usa
+    `generar_y_cargar`, que además carga las facturas a la BD.
+    """
     csv_gral = os.path.join(CARPETA_FACTURAS, CSV_GENERAL)
     csv_esp = os.path.join(CARPETA_FACTURAS, CSV_ESPECIFICO)
     
@@ -39,12 +97,11 @@ def asegurar_csvs_existen() -> None:
     print(f"[{time.ctime()}] CSVs no encontrados, creándolos...")
     
     try:
-        # Extraer texto de todos los PDFs de la carpeta
-        ruta_txt = leer_pdfs_y_guardar_txt(CARPETA_FACTURAS, salida_nombre=RESULTADO_NOMBRE)
-        
-        # Generar CSV general y específico
-        csv_g = parse_resultado_y_guardar_csv(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_GENERAL)
-        csv_e = parse_resultado_y_guardar_especifico(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_ESPECIFICO)
+        # Extraer texto de todos los PDFs y generar CSV general y específico
+        if pipeline:
+            csv_g, csv_e, _ = generar_y_cargar(opciones.get('workers', 1), opciones.get('backend'), batch_size)
+        else:
+            csv_g, csv_e = generar_csvs(**opciones)
         
         print(f"[{time.ctime()}] ✓ CSVs creados: {csv_g}, {csv_e}")
     except Exception as e:
@@ -53,7 +110,10 @@ def asegurar_csvs_existen() -> None:
 
 
 def load_processed() -> set:
-    """Carga nombres de archivos ya procesados desde `datos_generales.csv` (si existe)."""
+    """Carga nombres de archivos ya procesados desde `datos_generales.csv` (si existe).
+
+    Solo se usa para inicializar el manifiesto la primera vez (ver `abrir_manifiesto_inicial`).
+    """
     s = set()
     p = os.path.join(CARPETA_FACTURAS, CSV_GENERAL)
     if os.path.exists(p):
@@ -69,116 +129,241 @@ def load_processed() -> set:
     return s
 
 
-def cargar_datos_existentes_a_bd() -> None:
+def abrir_manifiesto_inicial():
+    """Abre el manifiesto de la carpeta. Si está vacío (primer arranque con
+    manifiesto), registra como procesados los PDFs que ya figuran en
+    `datos_generales.csv` para no reprocesarlos."""
+    manifiesto = abrir_manifiesto(CARPETA_FACTURAS)
+    if esta_vacio(manifiesto):
+        procesados = load_processed()
+        existentes = [f for f in listar_pdfs(CARPETA_FACTURAS) if f in procesados]
+        if existentes:
+            with bloqueo_carpeta(CARPETA_FACTURAS):
+                registrar(manifiesto, CARPETA_FACTURAS, existentes, 'ok', 'ok')
+            print(f"[{time.ctime()}] Manifiesto inicializado con {len(existentes)} archivos de {CSV_GENERAL}")
+    return manifiesto
+
+
+def cargar_datos_existentes_a_bd(batch_size: int = 0) -> bool:
     """Carga a la BD solo las facturas nuevas que no existen en la BD.
     
     OPTIMIZADO: Usa las funciones optimizadas de process_generales y 
     process_especificos que filtran antes de intentar cargar.
+
+    Con `batch_size` > 0 se usa la carga masiva (`cargar_*_por_lotes`):
+    INSERTs multi-fila con una transacción por lote. Retorna True si la carga
+    terminó sin errores.
     """
     print(f"\n[{time.ctime()}] === Iniciando carga optimizada a base de datos ===")
     try:
-        conn = create_connection()
-        init_tables(conn) # Asegurar que las tablas existan
-        
-        csv_gral = os.path.join(CARPETA_FACTURAS, CSV_GENERAL)
-        csv_esp = os.path.join(CARPETA_FACTURAS, CSV_ESPECIFICO)
-
-        if os.path.exists(csv_gral):
-            print(f"[{time.ctime()}] Procesando datos generales...")
-            process_generales(conn, csv_gral)
-        else:
-            print(f"[{time.ctime()}] ADVERTENCIA: {CSV_GENERAL} no encontrado")
-        
-        if os.path.exists(csv_esp):
-            print(f"[{time.ctime()}] Procesando datos específicos...")
-            process_especificos(conn, csv_esp)
-        else:
-            print(f"[{time.ctime()}] ADVERTENCIA: {CSV_ESPECIFICO} no encontrado")
+        with cronometro('carga'), conexion_bd() as conn:
+            init_tables(conn) # Asegurar que las tablas existan
+            
+            csv_gral = os.path.join(CARPETA_FACTURAS, CSV_GENERAL)
+            csv_esp = os.path.join(CARPETA_FACTURAS, CSV_ESPECIFICO)
+
+            if os.path.exists(csv_gral):
+                print(f"[{time.ctime()}] Procesando datos generales...")
+                if batch_size > 0:
+                    cargar_generales_por_lotes(conn, leer_csv(csv_gral), batch_size)
+                else:
+                    process_generales(conn, csv_gral)
+            else:
+                print(f"[{time.ctime()}] ADVERTENCIA: {CSV_GENERAL} no encontrado")
+            
+            if os.path.exists(csv_esp):
+                print(f"[{time.ctime()}] Procesando datos específicos...")
+                if batch_size > 0:
+                    cargar_especificos_por_lotes(conn, leer_csv(csv_esp), batch_size)
+                else:
+                    process_especificos(conn, csv_esp)
+            else:
+                print(f"[{time.ctime()}] ADVERTENCIA: {CSV_ESPECIFICO} no encontrado")
+
+            # Invalida las cachés de la aplicación web
+            incrementar_generacion(conn)
             
-        conn.close()
         print(f"[{time.ctime()}] === Carga a base de datos completada ===\n")
+        return True
     except Exception as db_err:
         print(f"[{time.ctime()}] ERROR cargando a base de datos: {db_err}")
+        return False
 
 
-def procesar_y_actualizar(nuevos_archivos: list) -> None:
+def procesar_y_actualizar(nuevos_archivos: list, incremental: bool = False, batch_size: int = 0,
+                          pipeline: bool = False, **opciones) -> None:
     """Regenera `resultado.txt` y los CSVs para la carpeta `Facturas`.
 
     Esta estrategia regenera los CSVs completos (sobrescribe), que es más
-    robusta frente a variaciones de extracción. Después marca como procesados
-    los archivos en `nuevos_archivos`.
+    robusta frente a variaciones de extracción. Después registra en el
+    manifiesto el resultado de `nuevos_archivos`. `opciones` se pasan a `generar_csvs`.
+
+    Con `incremental` solo se extraen y parsean `nuevos_archivos`: sus filas se
+    fusionan en los CSVs existentes y solo esas filas se cargan a la BD (ver
+    `ingesta.ingerir_archivos`). `batch_size` se pasa a la carga en la BD.
+
+    Con `pipeline` los CSVs se regeneran y las facturas se cargan a la BD en
+    una sola pasada con las etapas solapadas (ver `generar_y_cargar`).
     """
-    try:
-        # Extraer texto de todos los PDFs de la carpeta y escribir resultado.txt
-        ruta_txt = leer_pdfs_y_guardar_txt(CARPETA_FACTURAS, salida_nombre=RESULTADO_NOMBRE)
+    if incremental:
+        try:
+            ingerir_archivos(nuevos_archivos, CARPETA_FACTURAS,
+                             csv_general=CSV_GENERAL, csv_especifico=CSV_ESPECIFICO,
+                             workers=opciones.get('workers', 1), backend=opciones.get('backend'),
+                             batch_size=batch_size)
+            print(f"[{time.ctime()}] === Carga a base de datos completada ===\n")
+        except Exception as e:
+            print(f"[{time.ctime()}] Error en la actualización incremental: {e}")
+        return
 
-        # Generar CSV general y específico usando el resultado recién creado
-        csv_g = parse_resultado_y_guardar_csv(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_GENERAL)
-        csv_e = parse_resultado_y_guardar_especifico(CARPETA_FACTURAS, txt_nombre=RESULTADO_NOMBRE, csv_nombre=CSV_ESPECIFICO)
+    if pipeline:
+        try:
+            with bloqueo_carpeta(CARPETA_FACTURAS):
+                _, _, cargado = generar_y_cargar(opciones.get('workers', 1), opciones.get('backend'), batch_size)
+        except Exception as e:
+            print(f"[{time.ctime()}] Error en el pipeline: {e}")
+            registrar_con_bloqueo(CARPETA_FACTURAS, nuevos_archivos, 'error', 'pendiente')
+            return
+        if cargado:
+            print(f"[{time.ctime()}] === Carga a base de datos completada ===\n")
+        registrar_con_bloqueo(CARPETA_FACTURAS, nuevos_archivos, 'ok', 'ok' if cargado else 'error')
+        return
 
-        print(f"[{time.ctime()}] CSVs actualizados: {csv_g}, {csv_e}")
+    try:
+        # Extraer texto de todos los PDFs y generar CSV general y específico
+        # (con el mismo bloqueo que la ingesta desde la aplicación web)
+        with bloqueo_carpeta(CARPETA_FACTURAS):
+            csv_g, csv_e = generar_csvs(**opciones)
 
-        # Cargar a la base de datos (solo las facturas nuevas)
-        cargar_datos_existentes_a_bd()
+        print(f"[{time.ctime()}] CSVs actualizados: {csv_g}, {csv_e}")
 
     except Exception as e:
         print(f"[{time.ctime()}] Error al regenerar CSVs: {e}")
+        registrar_con_bloqueo(CARPETA_FACTURAS, nuevos_archivos, 'error', 'pendiente')
+        return
+
+    # Cargar a la base de datos (solo las facturas nuevas)
+    cargado = cargar_datos_existentes_a_bd(batch_size)
+    registrar_con_bloqueo(CARPETA_FACTURAS, nuevos_archivos, 'ok', 'ok' if cargado else 'error')
+
+
+def escribir_resumen(ruta: str) -> None:
+    """Escribe en `ruta` el resumen JSON de la corrida (ver `metricas.resumen`):
+    segundos por etapa, PDFs procesados, filas insertadas/saltadas y errores."""
+    if not ruta:
+        return
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(resumen(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, ruta)
 
 
-def detectar_nuevas_facturas_loop(interval: int = 30):
-    ARCHIVOS_PROCESADOS = load_processed()
-    print(f"[{time.ctime()}] Procesados inicialmente: {len(ARCHIVOS_PROCESADOS)} archivos")
+def detectar_nuevas_facturas_loop(interval: int = 30, polling: bool = False, resumen_json: str = None, **opciones):
+    """Procesa los PDFs nuevos a medida que aparecen en la carpeta.
 
-    while True:
-        archivos_pdf = [f for f in os.listdir(CARPETA_FACTURAS) if f.lower().endswith('.pdf')]
-        nuevos = [f for f in archivos_pdf if f not in ARCHIVOS_PROCESADOS]
+    Usa eventos del sistema (inotify, ver `vigilante`) cuando están
+    disponibles; si no, o con `polling`, revisa la carpeta cada `interval`
+    segundos. Los PDFs que llegan juntos se procesan en un solo lote.
+
+    Con `resumen_json`, el resumen acumulado se reescribe tras cada lote.
+    """
+    manifiesto = abrir_manifiesto_inicial()
+
+    for lote in vigilar_carpeta(CARPETA_FACTURAS, intervalo=interval, forzar_polling=polling):
+        # Nuevos o reemplazados (el manifiesto compara tamaño/mtime y hash)
+        nuevos = pendientes(manifiesto, CARPETA_FACTURAS, lote)
 
         if nuevos:
             print(f"[{time.ctime()}] Se detectaron {len(nuevos)} facturas nuevas: {nuevos}")
-            procesar_y_actualizar(nuevos)
-            # marcar todos los PDFs actuales como procesados para no repetir
-            ARCHIVOS_PROCESADOS.update(archivos_pdf)
+            # procesar_y_actualizar registra el resultado en el manifiesto
+            procesar_y_actualizar(nuevos, **opciones)
+            escribir_resumen(resumen_json)
 
-        time.sleep(interval)
 
-
-def detectar_nuevas_facturas_once() -> None:
+def detectar_nuevas_facturas_once(**opciones) -> None:
     """Una única iteración: detecta nuevos PDFs, procesa y sale (útil para pruebas)."""
-    ARCHIVOS_PROCESADOS = load_processed()
-    archivos_pdf = [f for f in os.listdir(CARPETA_FACTURAS) if f.lower().endswith('.pdf')]
-    nuevos = [f for f in archivos_pdf if f not in ARCHIVOS_PROCESADOS]
+    manifiesto = abrir_manifiesto_inicial()
+    # Solo se listan las subcarpetas que cambiaron desde el último escaneo; la
+    # firma de todos los PDFs se verifica para detectar los sobrescritos en el lugar
+    firmas = escanear(manifiesto, CARPETA_FACTURAS, completo=True)
+    archivos_pdf = sorted(firmas)
+    nuevos = pendientes(manifiesto, CARPETA_FACTURAS, archivos_pdf, firmas)
+    manifiesto.close()
 
     if nuevos:
         print(f"[{time.ctime()}] Se detectaron {len(nuevos)} facturas nuevas: {nuevos}")
-        procesar_y_actualizar(nuevos)
+        procesar_y_actualizar(nuevos, **opciones)
     else:
-        print(f"[{time.ctime()}] No hay facturas nuevas. Procesados: {len(ARCHIVOS_PROCESADOS)}")
+        print(f"[{time.ctime()}] No hay facturas nuevas. Procesados: {len(archivos_pdf)}")
 
 
 def main():
     parser = argparse.ArgumentParser(description='Monitorea carpeta Facturas y actualiza CSVs')
     parser.add_argument('--once', action='store_true', help='Ejecutar una sola iteración y salir')
-    parser.add_argument('--interval', type=int, default=30, help='Intervalo en segundos para el modo loop')
+    parser.add_argument('--interval', type=int, default=30, help='Intervalo en segundos para el modo loop con polling')
+    parser.add_argument('--polling', action='store_true',
+                        help='Revisar la carpeta cada --interval segundos en lugar de usar eventos (inotify)')
+    parser.add_argument('--workers', type=int, default=1, help='Procesos para extraer texto de los PDFs en paralelo')
+    parser.add_argument('--backend', choices=list(BACKENDS), default=None,
+                        help='Librería de extracción de PDFs (por defecto EXTRACTOR_PDF o pypdf)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Pasar el texto extraído directo a los parsers sin releer resultado.txt')
+    parser.add_argument('--guardar-txt', action='store_true',
+                        help='En modo --streaming, escribir igualmente resultado.txt (depuración)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Procesar solo los PDFs nuevos y fusionar sus filas en los CSVs existentes')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Extraer, parsear y cargar a la BD con las etapas solapadas (asyncio, sin resultado.txt)')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help='Cargar a la BD en lotes de N filas por transacción (0 = fila por fila)')
+    parser.add_argument('--log-level', default=None,
+                        help='Nivel de logging (DEBUG muestra cada factura/fila; por defecto LOG_LEVEL o WARNING)')
+    parser.add_argument('--resumen-json', default=None,
+                        help='Escribir en este archivo el resumen JSON de la corrida (tiempos por etapa y contadores)')
+    parser.add_argument('--worker', action='store_true',
+                        help='Procesar la cola de PDFs de la BD junto con otros workers (ver cola_pdfs)')
+    parser.add_argument('--lote-worker', type=int, default=LOTE_WORKER,
+                        help='En modo --worker, PDFs que se toman de la cola por vez')
+    parser.add_argument('--arriendo', type=int, default=ARRIENDO_SEG,
+                        help='En modo --worker, segundos del arriendo de los PDFs tomados (se renueva)')
     args = parser.parse_args()
+    configurar_logging(args.log_level)
+    opciones = {'workers': args.workers, 'backend': args.backend,
+                'streaming': args.streaming, 'guardar_txt': args.guardar_txt}
 
     if not os.path.isdir(CARPETA_FACTURAS):
         print(f"Carpeta no encontrada: {CARPETA_FACTURAS}")
         return
 
+    if args.worker:
+        # Cada PDF lo procesa un solo worker; con --once sale al vaciarse la cola
+        ejecutar_worker(CARPETA_FACTURAS, intervalo=args.interval, cantidad=args.lote_worker,
+                        arriendo=args.arriendo, una_vez=args.once,
+                        workers=args.workers, backend=args.backend, batch_size=args.batch_size)
+        escribir_resumen(args.resumen_json)
+        return
+
     # ASEGURAR que los CSVs existan antes de arrancar
     # Si no existen, los crea automáticamente
-    asegurar_csvs_existen()
+    asegurar_csvs_existen(pipeline=args.pipeline, batch_size=args.batch_size, **opciones)
 
     # SIEMPRE intentar cargar lo que ya exista en los CSVs al arrancar
     # Esto cubre el caso de que existan CSVs pero la BD esté vacía o desactualizada
     # La función optimizada solo cargará las facturas que faltan en la BD
-    cargar_datos_existentes_a_bd()
+    cargar_datos_existentes_a_bd(args.batch_size)
 
     if args.once:
-        detectar_nuevas_facturas_once()
+        detectar_nuevas_facturas_once(incremental=args.incremental, batch_size=args.batch_size,
+                                      pipeline=args.pipeline, **opciones)
+        escribir_resumen(args.resumen_json)
+        if args.resumen_json:
+            print(f"[{time.ctime()}] Resumen de la corrida en {args.resumen_json}")
     else:
+        escribir_resumen(args.resumen_json)
         print(f"[{time.ctime()}] Iniciando monitoreo de facturas en {CARPETA_FACTURAS}...")
-        detectar_nuevas_facturas_loop(interval=args.interval)
+        detectar_nuevas_facturas_loop(interval=args.interval, polling=args.polling, incremental=args.incremental,
+                                      batch_size=args.batch_size, pipeline=args.pipeline,
+                                      resumen_json=args.resumen_json, **opciones)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+"""Manifiesto persistente de los PDFs procesados.
+
+Base SQLite en `<carpeta>/.manifiesto.sqlite3` con una fila por PDF:
+filename, tamaño, `mtime`, hash SHA-256, estado de la extracción y estado de
+la carga a la BD ('pendiente', 'ok' o 'error').
+
+Reemplaza a reconstruir el conjunto de "ya procesados" leyendo todo
+`datos_generales.csv` en cada arranque: saber si un PDF es nuevo es una
+búsqueda por clave primaria. Además, un PDF reemplazado con el mismo nombre
+(distinto contenido) se detecta y se vuelve a procesar.
+
+Validación de un archivo (igual que `cache_extraccion`):
+- Si tamaño y `mtime` coinciden con el manifiesto, no cambió.
+- Si no, se calcula el hash; si coincide solo se actualizan tamaño y `mtime`.
+
+Con subcarpetas, `filename` es la ruta relativa del PDF y la tabla
+`carpetas` guarda el registro de cada shard (ver `escaneo`), de modo que al
+reiniciar solo se vuelven a listar las carpetas cuyo `mtime` cambió.
+"""
+
+import os
+import json
+import time
+import sqlite3
+
+from cache_extraccion import hash_archivo
+from escaneo import escanear_pdfs
+
+
+MANIFIESTO_NOMBRE = '.manifiesto.sqlite3'
+
+
+def abrir_manifiesto(prueba_path: str, nombre: str = MANIFIESTO_NOMBRE) -> sqlite3.Connection:
+    """Abre (y crea si hace falta) el manifiesto de `prueba_path`."""
+    conn = sqlite3.connect(os.path.join(prueba_path, nombre), timeout=30)
+    # WAL: el monitor y la aplicación web pueden usarlo a la vez
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS archivos (
+        filename TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        estado_extraccion TEXT NOT NULL DEFAULT 'pendiente',
+        estado_carga TEXT NOT NULL DEFAULT 'pendiente',
+        actualizado_en REAL NOT NULL
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS carpetas (
+        ruta TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        pdfs TEXT NOT NULL,
+        subcarpetas TEXT NOT NULL
+    )""")
+    conn.commit()
+    return conn
+
+
+def esta_vacio(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM archivos LIMIT 1").fetchone() is None
+
+
+def pendientes(conn: sqlite3.Connection, prueba_path: str, archivos: list, firmas: dict = None) -> list:
+    """De `archivos`, los que no están en el manifiesto o cuyo contenido cambió.
+
+    `firmas` (`{filename: (size, mtime_ns)}`, p.ej. de `escaneo.escanear_pdfs`)
+    evita un `stat` por archivo.
+    """
+    resultado = []
+    for filename in archivos:
+        ruta = os.path.join(prueba_path, filename)
+        firma = firmas.get(filename) if firmas else None
+        if firma is None:
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            firma = (st.st_size, st.st_mtime_ns)
+        fila = conn.execute("SELECT size, mtime_ns, sha256 FROM archivos WHERE filename = ?",
+                            (filename,)).fetchone()
+        if fila is None:
+            resultado.append(filename)
+            continue
+        size, mtime_ns, sha256 = fila
+        if (size, mtime_ns) == firma:
+            continue
+        if size == firma[0] and hash_archivo(ruta) == sha256:
+            # Solo cambió el mtime (p.ej. copiado de nuevo): mismo contenido
+            conn.execute("UPDATE archivos SET mtime_ns = ? WHERE filename = ?", (firma[1], filename))
+            conn.commit()
+            continue
+        resultado.append(filename)
+    return resultado
+
+
+def cargar_carpetas(conn: sqlite3.Connection) -> dict:
+    """Registro por shard del último escaneo (formato de `escaneo.escanear_pdfs`)."""
+    return {ruta: (mtime_ns, json.loads(pdfs), json.loads(subcarpetas))
+            for ruta, mtime_ns, pdfs, subcarpetas in conn.execute(
+                "SELECT ruta, mtime_ns, pdfs, subcarpetas FROM carpetas")}
+
+
+def guardar_carpetas(conn: sqlite3.Connection, carpetas: dict, rescaneadas: list) -> None:
+    """Guarda los shards `rescaneadas` y borra los que ya no están en `carpetas`."""
+    conn.executemany("INSERT OR REPLACE INTO carpetas (ruta, mtime_ns, pdfs, subcarpetas) VALUES (?, ?, ?, ?)",
+                     [(rel, carpetas[rel][0], json.dumps(carpetas[rel][1]), json.dumps(carpetas[rel][2]))
+                      for rel in rescaneadas if rel in carpetas])
+    registradas = [r for (r,) in conn.execute("SELECT ruta FROM carpetas")]
+    conn.executemany("DELETE FROM carpetas WHERE ruta = ?", [(r,) for r in registradas if r not in carpetas])
+    conn.commit()
+
+
+def escanear(conn: sqlite3.Connection, prueba_path: str, completo: bool = False) -> dict:
+    """Escanea `prueba_path` reutilizando los shards sin cambios del manifiesto.
+
+    Con `completo` se verifica la firma de todos los PDFs (ver `escaneo`).
+    Retorna `{ruta_relativa: (size, mtime_ns)}` de todos los PDFs.
+    """
+    carpetas = cargar_carpetas(conn)
+    firmas, rescaneadas = escanear_pdfs(prueba_path, carpetas, completo=completo)
+    if rescaneadas or len(carpetas) != conn.execute("SELECT COUNT(*) FROM carpetas").fetchone()[0]:
+        guardar_carpetas(conn, carpetas, rescaneadas)
+    return firmas
+
+
+def registrar(conn: sqlite3.Connection, prueba_path: str, archivos: list,
+              estado_extraccion: str, estado_carga: str) -> None:
+    """Guarda la firma actual de `archivos` y el resultado de su procesamiento."""
+    ahora = time.time()
+    filas = []
+    for filename in archivos:
+        ruta = os.path.join(prueba_path, filename)
+        try:
+            st = os.stat(ruta)
+            sha256 = hash_archivo(ruta)
+        except FileNotFoundError:
+            continue
+        filas.append((filename, st.st_size, st.st_mtime_ns, sha256, estado_extraccion, estado_carga, ahora))
+    conn.executemany("""INSERT INTO archivos
+            (filename, size, mtime_ns, sha256, estado_extraccion, estado_carga, actualizado_en)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(filename) DO UPDATE SET
+            size = excluded.size, mtime_ns = excluded.mtime_ns, sha256 = excluded.sha256,
+            estado_extraccion = excluded.estado_extraccion, estado_carga = excluded.estado_carga,
+            actualizado_en = excluded.actualizado_en""", filas)
+    conn.commit()
+
+
+def registrar_procesamiento(prueba_path: str, archivos: list, estado_extraccion: str, estado_carga: str) -> None:
+    """Abre el manifiesto de `prueba_path`, registra `archivos` y lo cierra."""
+    conn = abrir_manifiesto(prueba_path)
+    try:
+        registrar(conn, prueba_path, archivos, estado_extraccion, estado_carga)
+    finally:
+        conn.close()
+
+
+def resumen(conn: sqlite3.Connection) -> dict:
+    """Cantidad de archivos por (estado_extraccion, estado_carga)."""
+    return {(e, c): n for e, c, n in conn.execute(
+        "SELECT estado_extraccion, estado_carga, COUNT(*) FROM archivos GROUP BY 1, 2")}
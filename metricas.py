@@ -0,0 +1,181 @@
+"""Instrumentación del ETL: temporizadores por etapa, contadores e histogramas.
+
+Las métricas viven en memoria del proceso (son seguras entre hilos) y se
+exportan de dos formas:
+
+- `formato_prometheus()`: texto para el endpoint `/metrics` de la aplicación web.
+- `resumen()`: dict para el resumen JSON de una corrida de `main.py`.
+
+Las etapas se miden con `cronometro(etapa)`, que además cuenta un error de
+la etapa si el bloque lanza una excepción. Todas las métricas se declaran en
+`METRICAS` con su tipo y descripción.
+
+`configurar_logging` fija el nivel de los mensajes por fila (`logging.debug`),
+que por defecto no se muestran para no frenar las cargas grandes.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+# Límites (en segundos) de los buckets de los histogramas
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# nombre -> (tipo, descripción)
+METRICAS = {
+    'etl_etapa_segundos': ('histogram', 'Duración de cada etapa del ETL (extraccion, parseo_general, parseo_especifico, carga, pipeline)'),
+    'etl_pdf_extraccion_segundos': ('histogram', 'Tiempo de extracción de texto por PDF'),
+    'etl_pdfs_total': ('counter', 'PDFs procesados por resultado (ok, error, cache)'),
+    'etl_filas_insertadas_total': ('counter', 'Filas insertadas en la BD por tabla'),
+    'etl_filas_saltadas_total': ('counter', 'Filas no insertadas por tabla y motivo (existente, sin_factura)'),
+    'etl_errores_total': ('counter', 'Errores por etapa'),
+    'etl_cola_pdfs_total': ('counter', 'PDFs de la cola de workers por resultado (reclamado, ok, fallido)'),
+    'web_solicitudes_total': ('counter', 'Solicitudes HTTP por endpoint y código de estado'),
+    'web_solicitud_segundos': ('histogram', 'Duración de las solicitudes HTTP por endpoint'),
+    'web_cache_total': ('counter', 'Respuestas de la API por resultado de la caché (hit, miss, no_modificado)'),
+}
+
+_lock = threading.Lock()
+_contadores = {}    # (nombre, etiquetas) -> valor
+_histogramas = {}   # (nombre, etiquetas) -> [conteos por bucket, suma, cuenta, máximo]
+_inicio = time.time()
+
+
+def _clave(nombre: str, etiquetas: dict) -> tuple:
+    if nombre not in METRICAS:
+        raise KeyError(f"Métrica no declarada: {nombre}")
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def incrementar(nombre: str, valor: float = 1, **etiquetas) -> None:
+    """Suma `valor` al contador `nombre` con esas etiquetas."""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def observar(nombre: str, valor: float, **etiquetas) -> None:
+    """Registra una observación (en segundos) en el histograma `nombre`."""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        h = _histogramas.get(clave)
+        if h is None:
+            h = _histogramas[clave] = [[0] * len(BUCKETS_SEGUNDOS), 0.0, 0, 0.0]
+        for i, limite in enumerate(BUCKETS_SEGUNDOS):
+            if valor <= limite:
+                h[0][i] += 1
+        h[1] += valor
+        h[2] += 1
+        h[3] = max(h[3], valor)
+
+
+@contextmanager
+def cronometro(etapa: str):
+    """Mide la duración del bloque como etapa `etapa` del ETL; si el bloque
+    falla, cuenta además un error de esa etapa."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        incrementar('etl_errores_total', etapa=etapa)
+        raise
+    finally:
+        observar('etl_etapa_segundos', time.perf_counter() - t0, etapa=etapa)
+
+
+def reiniciar() -> None:
+    """Borra todas las métricas (p.ej. entre corridas de un mismo proceso)."""
+    global _inicio
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+        _inicio = time.time()
+
+
+def _etiquetas_texto(etiquetas: tuple, extra: tuple = ()) -> str:
+    pares = etiquetas + extra
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formato_prometheus() -> str:
+    """Métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+    with _lock:
+        contadores = dict(_contadores)
+        histogramas = {k: (list(v[0]), v[1], v[2]) for k, v in _histogramas.items()}
+
+    lineas = []
+    for nombre, (tipo, descripcion) in METRICAS.items():
+        if tipo == 'counter':
+            series = sorted((k[1], v) for k, v in contadores.items() if k[0] == nombre)
+        else:
+            series = sorted((k[1], v) for k, v in histogramas.items() if k[0] == nombre)
+        if not series:
+            continue
+        lineas.append(f"# HELP {nombre} {descripcion}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, valor in series:
+            if tipo == 'counter':
+                lineas.append(f"{nombre}{_etiquetas_texto(etiquetas)} {_numero(valor)}")
+                continue
+            conteos, suma, cuenta = valor
+            for limite, conteo in zip(BUCKETS_SEGUNDOS, conteos):
+                lineas.append(f"{nombre}_bucket{_etiquetas_texto(etiquetas, (('le', limite),))} {conteo}")
+            lineas.append(f"{nombre}_bucket{_etiquetas_texto(etiquetas, (('le', '+Inf'),))} {cuenta}")
+            lineas.append(f"{nombre}_sum{_etiquetas_texto(etiquetas)} {_numero(suma)}")
+            lineas.append(f"{nombre}_count{_etiquetas_texto(etiquetas)} {cuenta}")
+    return '\n'.join(lineas) + '\n'
+
+
+def resumen() -> dict:
+    """Resumen de la corrida: duración total, segundos por etapa y contadores.
+
+    Los contadores y los histogramas se agrupan por nombre y, dentro de
+    cada uno, por sus etiquetas en forma `clave=valor` ('' si no tiene).
+    """
+    with _lock:
+        contadores = dict(_contadores)
+        histogramas = {k: (v[1], v[2], v[3]) for k, v in _histogramas.items()}
+
+    etiqueta = lambda pares: ','.join(f"{k}={v}" for k, v in pares)
+    salida = {
+        'inicio': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_inicio)),
+        'fin': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'duracion_seg': round(time.time() - _inicio, 3),
+        'etapas': {},
+        'contadores': {},
+        'histogramas': {},
+    }
+    for (nombre, pares), valor in sorted(contadores.items()):
+        salida['contadores'].setdefault(nombre, {})[etiqueta(pares)] = valor
+    for (nombre, pares), (suma, cuenta, maximo) in sorted(histogramas.items()):
+        datos = {'cuenta': cuenta, 'suma_seg': round(suma, 6),
+                 'promedio_seg': round(suma / cuenta, 6) if cuenta else 0.0, 'max_seg': round(maximo, 6)}
+        if nombre == 'etl_etapa_segundos':
+            salida['etapas'][dict(pares)['etapa']] = {'segundos': datos['suma_seg'], 'ejecuciones': cuenta}
+        else:
+            salida['histogramas'].setdefault(nombre, {})[etiqueta(pares)] = datos
+    return salida
+
+
+def configurar_logging(nivel=None) -> None:
+    """Configura el logging de la aplicación.
+
+    `nivel` (p.ej. 'DEBUG', 'INFO') o, si no se indica, la variable
+    `LOG_LEVEL`; por defecto 'WARNING', que oculta los mensajes por fila.
+    """
+    nivel = (nivel or os.getenv('LOG_LEVEL', 'WARNING')).upper()
+    logging.basicConfig(level=getattr(logging, nivel, logging.WARNING),
+                        format='[%(asctime)s] %(levelname)s %(name)s: %(message)s')
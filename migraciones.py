@@ -0,0 +1,260 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+`create_tables` solo crea las tablas si no existen; no puede modificar una
+base de datos ya creada. Aquí cada cambio de esquema es una migración
+numerada y la tabla `schema_version` registra cuáles ya se aplicaron, de modo
+que `aplicar_migraciones` (llamada desde `init_tables`) lleva cualquier base
+de datos, nueva o existente, a la última versión.
+
+En MySQL los `ALTER TABLE` / `CREATE INDEX` confirman la transacción de forma
+implícita, así que cada migración está escrita para poder reejecutarse sin
+error si se interrumpió antes de registrarse.
+
+Las migraciones se escriben para MySQL; donde la sintaxis de SQLite difiere
+(`DELETE ... JOIN`, `INSERT IGNORE`, `information_schema`) se elige la
+variante según `dialecto(cursor)` (ver `conexion_sqlite`).
+
+Para agregar una migración: escribir una función `_mNNN_descripcion(cursor)` y
+añadirla al final de `MIGRACIONES` con el siguiente número de versión.
+
+Uso (ver estado):
+    python migraciones.py
+"""
+
+import time
+
+from conexion_sqlite import dialecto
+from clave_factura import desde_nombre, clave_legada
+
+
+def _indice_existe(cursor, tabla, indice):
+    """True si `tabla` ya tiene un índice llamado `indice`."""
+    if dialecto(cursor) == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (tabla, indice))
+        return cursor.fetchone() is not None
+    cursor.execute("""SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1""", (tabla, indice))
+    return cursor.fetchone() is not None
+
+
+def _columna_existe(cursor, tabla, columna):
+    """True si `tabla` ya tiene la columna `columna`."""
+    if dialecto(cursor) == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        return any(fila[1] == columna for fila in cursor.fetchall())
+    cursor.execute("""SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1""", (tabla, columna))
+    return cursor.fetchone() is not None
+
+
+def _agregar_columna(cursor, tabla, columna, definicion):
+    """Agrega la columna solo si todavía no existe."""
+    if not _columna_existe(cursor, tabla, columna):
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+
+def _crear_indice(cursor, tabla, indice, definicion):
+    """Crea el índice solo si todavía no existe."""
+    if not _indice_existe(cursor, tabla, indice):
+        cursor.execute(f"CREATE {definicion}")
+
+
+def _m001_filename_unico(cursor):
+    """Índice único en Facturas.filename (elimina antes las facturas duplicadas)."""
+    # Los detalles de una factura duplicada pasan a la de menor id, salvo los
+    # que ya existen allí; después se borran las facturas sobrantes.
+    if dialecto(cursor) == 'sqlite':
+        _deduplicar_facturas_sqlite(cursor)
+    else:
+        _deduplicar_facturas_mysql(cursor)
+    if cursor.rowcount:
+        print(f"[{time.ctime()}] Migración 1: {cursor.rowcount} facturas duplicadas eliminadas")
+    _crear_indice(cursor, 'Facturas', 'ux_facturas_filename',
+                  "UNIQUE INDEX ux_facturas_filename ON Facturas (filename)")
+
+
+def _deduplicar_facturas_mysql(cursor):
+    cursor.execute("""DELETE d FROM Detalles d
+        JOIN Facturas f ON f.id = d.factura_id
+        JOIN (SELECT filename, MIN(id) AS id FROM Facturas GROUP BY filename) keep
+            ON keep.filename = f.filename AND keep.id <> f.id
+        JOIN Detalles dk ON dk.factura_id = keep.id
+            AND dk.concepto = d.concepto AND dk.valor_pagar = d.valor_pagar""")
+    cursor.execute("""UPDATE Detalles d
+        JOIN Facturas f ON f.id = d.factura_id
+        JOIN (SELECT filename, MIN(id) AS id FROM Facturas GROUP BY filename) keep
+            ON keep.filename = f.filename AND keep.id <> f.id
+        SET d.factura_id = keep.id""")
+    cursor.execute("""DELETE f FROM Facturas f
+        JOIN (SELECT filename, MIN(id) AS id FROM Facturas GROUP BY filename) keep
+            ON keep.filename = f.filename AND keep.id <> f.id""")
+
+
+def _deduplicar_facturas_sqlite(cursor):
+    # SQLite no admite DELETE/UPDATE con JOIN: mismas operaciones con subconsultas
+    duplicadas = """SELECT f.id, keep.id AS keep_id FROM Facturas f
+        JOIN (SELECT filename, MIN(id) AS id FROM Facturas GROUP BY filename) keep
+            ON keep.filename = f.filename AND keep.id <> f.id"""
+    cursor.execute(f"""DELETE FROM Detalles WHERE id IN (
+        SELECT d.id FROM Detalles d
+        JOIN ({duplicadas}) dup ON dup.id = d.factura_id
+        JOIN Detalles dk ON dk.factura_id = dup.keep_id
+            AND dk.concepto = d.concepto AND dk.valor_pagar = d.valor_pagar)""")
+    cursor.execute(f"""UPDATE Detalles SET factura_id = (
+        SELECT dup.keep_id FROM ({duplicadas}) dup WHERE dup.id = Detalles.factura_id)
+        WHERE factura_id IN (SELECT id FROM ({duplicadas}))""")
+    cursor.execute(f"DELETE FROM Facturas WHERE id IN (SELECT id FROM ({duplicadas}))")
+
+
+def _m002_detalles_factura_concepto(cursor):
+    """Índice compuesto en Detalles(factura_id, concepto)."""
+    _crear_indice(cursor, 'Detalles', 'ix_detalles_factura_concepto',
+                  "INDEX ix_detalles_factura_concepto ON Detalles (factura_id, concepto)")
+
+
+def _m003_facturas_fecha(cursor):
+    """Índice en Facturas.fecha."""
+    _crear_indice(cursor, 'Facturas', 'ix_facturas_fecha',
+                  "INDEX ix_facturas_fecha ON Facturas (fecha)")
+
+
+def _m004_metadatos_generacion(cursor):
+    """Tabla Metadatos con el contador de generación de los datos."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Metadatos (
+        clave VARCHAR(64) PRIMARY KEY,
+        valor BIGINT NOT NULL
+    )""")
+    ignorar = 'OR IGNORE' if dialecto(cursor) == 'sqlite' else 'IGNORE'
+    cursor.execute(f"INSERT {ignorar} INTO Metadatos (clave, valor) VALUES ('generacion', 0)")
+
+
+def _m005_clave_contrato_periodo(cursor):
+    """Clave compuesta Facturas(contrato, periodo) en lugar del filename normalizado."""
+    _agregar_columna(cursor, 'Facturas', 'contrato', "VARCHAR(20) NOT NULL DEFAULT ''")
+    _agregar_columna(cursor, 'Facturas', 'periodo', "VARCHAR(10) NOT NULL DEFAULT ''")
+    _agregar_columna(cursor, 'Facturas', 'numero_factura', "VARCHAR(20) NULL")
+    if dialecto(cursor) != 'sqlite':
+        # Ahora se guarda el nombre completo del PDF (SQLite no limita VARCHAR)
+        cursor.execute("ALTER TABLE Facturas MODIFY filename VARCHAR(255)")
+
+    # Las facturas existentes solo tienen el filename normalizado ('NOV2024'):
+    # el período se deduce de él y el contrato queda vacío hasta que la
+    # próxima carga las adopte (ver `conexion.adoptar_facturas_legadas`).
+    cursor.execute("SELECT id, filename FROM Facturas WHERE periodo = ''")
+    filas = []
+    for factura_id, filename in cursor.fetchall():
+        datos = desde_nombre(filename or '')
+        filas.append((datos['contrato'] or '', datos['periodo'] or clave_legada(filename or ''), factura_id))
+    if filas:
+        cursor.executemany("UPDATE Facturas SET contrato = %s, periodo = %s WHERE id = %s", filas)
+        print(f"[{time.ctime()}] Migración 5: clave asignada a {len(filas)} facturas existentes")
+
+    if _indice_existe(cursor, 'Facturas', 'ux_facturas_filename'):
+        if dialecto(cursor) == 'sqlite':
+            cursor.execute("DROP INDEX ux_facturas_filename")
+        else:
+            cursor.execute("DROP INDEX ux_facturas_filename ON Facturas")
+    _crear_indice(cursor, 'Facturas', 'ux_facturas_contrato_periodo',
+                  "UNIQUE INDEX ux_facturas_contrato_periodo ON Facturas (contrato, periodo)")
+
+
+def _m006_cola_pdfs(cursor):
+    """Tabla ColaPDFs: cola de PDFs con arriendos para varios workers."""
+    id_columna = ("id INTEGER PRIMARY KEY AUTOINCREMENT" if dialecto(cursor) == 'sqlite'
+                  else "id INT AUTO_INCREMENT PRIMARY KEY")
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS ColaPDFs (
+        {id_columna},
+        filename VARCHAR(255) NOT NULL UNIQUE,
+        size BIGINT NOT NULL,
+        mtime_ns BIGINT NOT NULL,
+        estado VARCHAR(12) NOT NULL DEFAULT 'pendiente',
+        intentos INT NOT NULL DEFAULT 0,
+        worker VARCHAR(100) NULL,
+        arriendo_hasta DOUBLE NULL,
+        error TEXT NULL,
+        actualizado_en DOUBLE NULL
+    )""")
+    _crear_indice(cursor, 'ColaPDFs', 'ix_cola_estado_arriendo',
+                  "INDEX ix_cola_estado_arriendo ON ColaPDFs (estado, arriendo_hasta)")
+    _crear_indice(cursor, 'ColaPDFs', 'ix_cola_worker',
+                  "INDEX ix_cola_worker ON ColaPDFs (worker)")
+
+
+def _m007_cola_reencolar(cursor):
+    """Columna ColaPDFs.reencolar: PDF reemplazado mientras un worker lo procesaba."""
+    _agregar_columna(cursor, 'ColaPDFs', 'reencolar', "SMALLINT NOT NULL DEFAULT 0")
+
+
+# (versión, función); las versiones deben ser consecutivas y nunca reordenarse
+MIGRACIONES = [
+    (1, _m001_filename_unico),
+    (2, _m002_detalles_factura_concepto),
+    (3, _m003_facturas_fecha),
+    (4, _m004_metadatos_generacion),
+    (5, _m005_clave_contrato_periodo),
+    (6, _m006_cola_pdfs),
+    (7, _m007_cola_reencolar),
+]
+
+
+def crear_tabla_version(conn):
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            descripcion VARCHAR(255),
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""")
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def version_actual(conn):
+    """Última versión de esquema aplicada (0 si ninguna)."""
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def aplicar_migraciones(conn):
+    """Aplica, en orden, las migraciones pendientes. Retorna la versión final."""
+    crear_tabla_version(conn)
+    actual = version_actual(conn)
+
+    for version, migracion in MIGRACIONES:
+        if version <= actual:
+            continue
+        descripcion = (migracion.__doc__ or migracion.__name__).strip()
+        print(f"[{time.ctime()}] Aplicando migración {version}: {descripcion}")
+        cursor = conn.cursor(buffered=True)
+        try:
+            migracion(cursor)
+            cursor.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                           (version, descripcion[:255]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        actual = version
+
+    return actual
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from conexion import create_connection, init_tables
+
+    load_dotenv()
+    conn = create_connection()
+    init_tables(conn)
+    print(f"Versión de esquema: {version_actual(conn)} (última disponible: {MIGRACIONES[-1][0]})")
+    conn.close()
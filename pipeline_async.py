@@ -0,0 +1,284 @@
+"""Pipeline solapado (asyncio): extracción, parseo y carga a la BD al mismo tiempo.
+
+En el modo clásico las etapas corren una después de la otra: se extraen
+todos los PDFs, luego se parsea todo y al final se carga todo, así que la
+BD espera durante la extracción y la CPU durante la carga. Aquí las tres
+etapas corren a la vez, unidas por colas `asyncio.Queue` acotadas:
+
+    extracción ──(cola_textos)──> parseo ──(cola_filas)──> carga
+
+- Extracción: cada PDF se envía a un `ProcessPoolExecutor` (o se toma de
+  la caché de `cache_extraccion`). En `cola_textos` se encola el futuro de
+  cada PDF en orden, así que los resultados se consumen en el mismo orden
+  alfabético que en el modo clásico.
+- Parseo: extrae los campos generales y los ítems de cada bloque, escribe
+  los ítems en `datos_especificos.csv` y arma tandas de `tamano_tanda`
+  facturas para la carga. Corre en el hilo del event loop: es liviano
+  comparado con la extracción y, por el GIL, más hilos no lo acelerarían.
+- Carga: un único escritor (un hilo con su propia conexión) inserta cada
+  tanda con `insertar_facturas_nuevas` / `insertar_detalles_nuevos`. Si
+  una tanda falla, las siguientes ya no se cargan (como en el modo
+  clásico, la próxima carga completa lo que falte) y el error queda en
+  los totales.
+
+Si una etapa es más lenta, su cola de entrada se llena y la etapa anterior
+espera (backpressure): la memoria queda acotada por el tamaño de las colas
+y el tiempo total tiende al de la etapa más lenta en lugar de la suma.
+
+`datos_generales.csv` se escribe al final, deduplicado. Si dos PDFs tienen
+la misma clave (contrato, período), en la BD queda el mismo que en el CSV
+(`preferir_entrada`): dentro de cada tanda se elige uno y, si el preferido
+llega en una tanda posterior, reemplaza los datos de la factura ya cargada
+en esta corrida (conserva su id y sus detalles). Las facturas que ya
+estaban en la BD antes de la corrida no se tocan, igual que en el modo
+clásico.
+
+Uso:
+    python main.py --pipeline [--workers 4] [--batch-size 500]
+"""
+
+import os
+import csv
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from analisis_general import (
+    _extraer_seguro, contenido_bloque, extraer_campos_generales,
+    deduplicar_generales, preferir_entrada, escribir_csv_generales,
+)
+from analisis_especifico import extraer_items, CAMPOS_ESPECIFICOS
+from procesamiento_streaming import iterar_bloques
+from cache_extraccion import abrir_cache, cerrar_cache, buscar_en_cache, actualizar_cache, podar_cache
+from extractores import backend_configurado, backend_disponible
+from escaneo import listar_pdfs
+from clave_factura import clave_de_fila
+from corregir_cargar import (
+    conexion_bd, init_tables, get_all_claves, incrementar_generacion, preparar_factura,
+    insertar_facturas_nuevas, insertar_detalles_nuevos, actualizar_facturas_lote, TAMANO_LOTE,
+)
+from metricas import incrementar, observar
+
+
+# PDFs en vuelo entre extracción y parseo (por proceso de extracción)
+PDFS_EN_VUELO_POR_WORKER = 4
+# Tandas de filas esperando al escritor de la BD
+TANDAS_EN_COLA = 4
+
+_FIN = object()
+
+
+async def _etapa_extraccion(pdf_files, prueba_path, cola_textos, pool, backend, cache):
+    """Encola, en orden, el contenido (o el futuro de su extracción) de cada PDF."""
+    loop = asyncio.get_running_loop()
+    # Si la librería del backend no está instalada, se produce un mensaje de error por archivo
+    hay_extractor = backend_disponible(backend)
+    for pdf_file in pdf_files:
+        ruta = os.path.join(prueba_path, pdf_file)
+        texto = buscar_en_cache(cache, ruta, pdf_file, backend) if cache is not None else None
+        if texto is not None:
+            incrementar('etl_pdfs_total', resultado='cache')
+            resultado = contenido_bloque(pdf_file, texto)
+        elif not hay_extractor:
+            incrementar('etl_pdfs_total', resultado='error')
+            resultado = "ERROR: No hay librería disponible para extraer texto de PDFs.\n"
+        else:
+            resultado = loop.run_in_executor(pool, _extraer_seguro, ruta, backend)
+        # Espera si el parseo va atrasado (cola llena)
+        await cola_textos.put((pdf_file, resultado))
+    await cola_textos.put(_FIN)
+
+
+async def _etapa_parseo(prueba_path, cola_textos, cola_filas, writer_items, entradas, backend, cache,
+                        tamano_tanda, tiempos):
+    """Parsea cada PDF en orden y entrega tandas `(entradas, items)` al escritor."""
+    tanda_entradas, tanda_items = [], []
+    while True:
+        elemento = await cola_textos.get()
+        if elemento is _FIN:
+            break
+        pdf_file, contenido = elemento
+        if not isinstance(contenido, str):
+            try:
+                texto, error, segundos = await contenido
+                observar('etl_pdf_extraccion_segundos', segundos)
+            except Exception as e:
+                # p.ej. el proceso worker murió (BrokenProcessPool)
+                texto, error = None, str(e)
+            incrementar('etl_pdfs_total', resultado='ok' if error is None else 'error')
+            if error is None and cache is not None:
+                actualizar_cache(cache, os.path.join(prueba_path, pdf_file), pdf_file, texto, backend)
+            contenido = contenido_bloque(pdf_file, texto, error)
+
+        for filename, block in iterar_bloques([(pdf_file, contenido)]):
+            t0 = time.perf_counter()
+            entrada = extraer_campos_generales(filename, block)
+            t1 = time.perf_counter()
+            items = extraer_items(filename, block)
+            writer_items.writerows(items)
+            tiempos['parseo_general'] += t1 - t0
+            tiempos['parseo_especifico'] += time.perf_counter() - t1
+            entradas.append(entrada)
+            tanda_entradas.append(entrada)
+            tanda_items.extend(items)
+
+        if len(tanda_entradas) >= tamano_tanda:
+            await cola_filas.put((tanda_entradas, tanda_items))
+            tanda_entradas, tanda_items = [], []
+    if tanda_entradas:
+        await cola_filas.put((tanda_entradas, tanda_items))
+    await cola_filas.put(_FIN)
+
+
+def _cargar_tanda(conn, existentes, cargadas, entradas, items, batch_size, totales):
+    """Inserta una tanda en la BD (corre en el hilo del escritor).
+
+    `cargadas` es `{clave: entrada}` de las facturas cargadas en esta corrida:
+    si la tanda trae una que `preferir_entrada` prefiere, la reemplaza.
+    """
+    t0 = time.perf_counter()
+    elegidas = {}
+    for e in entradas:
+        clave = clave_de_fila(e)
+        if clave not in elegidas or preferir_entrada(elegidas[clave], e):
+            elegidas[clave] = e
+    a_insertar = []
+    reemplazos = []
+    for clave, e in elegidas.items():
+        if clave not in cargadas:
+            a_insertar.append(e)
+        elif preferir_entrada(cargadas[clave], e):
+            reemplazos.append(e)
+    # Las que no estaban en la BD quedan cargadas (insertadas o adoptadas)
+    nuevas = [e for e in a_insertar if clave_de_fila(e) not in existentes]
+
+    clave_to_id, ya_existentes, adoptadas = insertar_facturas_nuevas(conn, a_insertar, existentes, batch_size)
+    cargadas.update((clave_de_fila(e), e) for e in nuevas)
+    if reemplazos:
+        actualizar_facturas_lote(conn, [preparar_factura(e) for e in reemplazos])
+        cargadas.update((clave_de_fila(e), e) for e in reemplazos)
+    detalles, detalles_existentes, sin_factura = insertar_detalles_nuevos(conn, items, batch_size)
+    totales['facturas'] += len(clave_to_id)
+    totales['reemplazadas'] += len(reemplazos)
+    totales['facturas_existentes'] += ya_existentes
+    totales['adoptadas'] += adoptadas
+    totales['detalles'] += detalles
+    totales['detalles_existentes'] += detalles_existentes
+    totales['sin_factura'] += sin_factura
+    totales['segundos'] += time.perf_counter() - t0
+
+
+async def _etapa_carga(cola_filas, escritor, conn, batch_size, totales):
+    """Escritor único: carga las tandas a medida que llegan.
+
+    Tras la primera tanda que falla, el resto se consume sin cargarse para
+    que el parseo termine y los CSVs queden completos.
+    """
+    loop = asyncio.get_running_loop()
+    existentes = await loop.run_in_executor(escritor, get_all_claves, conn)
+    print(f"[{time.ctime()}] Facturas existentes en BD: {len(existentes)}")
+    cargadas = {}
+    while True:
+        tanda = await cola_filas.get()
+        if tanda is _FIN:
+            break
+        if totales['error'] is not None:
+            continue
+        entradas, items = tanda
+        try:
+            await loop.run_in_executor(escritor, _cargar_tanda, conn, existentes, cargadas,
+                                       entradas, items, batch_size, totales)
+        except Exception as e:
+            incrementar('etl_errores_total', etapa='carga')
+            print(f"[{time.ctime()}] Error al cargar a la BD (se omiten las tandas restantes): {e}")
+            totales['error'] = str(e)
+    try:
+        # Invalida las cachés de la aplicación web (también tras una carga parcial)
+        await loop.run_in_executor(escritor, incrementar_generacion, conn)
+    except Exception:
+        # Si la BD ya había fallado, el error queda informado en los totales
+        if totales['error'] is None:
+            raise
+
+
+async def procesar_pipeline(prueba_path: str = 'Facturas', csv_general: str = 'datos_generales.csv',
+                            csv_especifico: str = 'datos_especificos.csv', workers: Optional[int] = None,
+                            backend: Optional[str] = None, batch_size: int = 0, tamano_tanda: Optional[int] = None,
+                            usar_cache: bool = True) -> dict:
+    """Extrae, parsea y carga a la BD todos los PDFs de `prueba_path` con las
+    etapas solapadas. Genera ambos CSVs como el modo `--streaming`.
+
+    `workers` es la cantidad de procesos de extracción (por defecto uno por
+    CPU; con uno solo la extracción igual se solapa con el parseo y la
+    carga) y `batch_size` las filas por INSERT (0 = `TAMANO_LOTE`). Las
+    colas admiten `PDFS_EN_VUELO_POR_WORKER * workers` PDFs y
+    `TANDAS_EN_COLA` tandas de `tamano_tanda` facturas (por defecto
+    `batch_size`).
+
+    Retorna los totales de la carga y los segundos de cada etapa. Si la
+    carga falló, `error` tiene el mensaje (si no, es None).
+    """
+    backend = backend or backend_configurado()
+    workers = workers or os.cpu_count() or 1
+    batch_size = batch_size if batch_size > 0 else TAMANO_LOTE
+    tamano_tanda = tamano_tanda or batch_size
+
+    cola_textos = asyncio.Queue(maxsize=PDFS_EN_VUELO_POR_WORKER * workers)
+    cola_filas = asyncio.Queue(maxsize=TANDAS_EN_COLA)
+    tiempos = {'parseo_general': 0.0, 'parseo_especifico': 0.0}
+    totales = dict.fromkeys(['facturas', 'facturas_existentes', 'adoptadas', 'reemplazadas', 'detalles',
+                             'detalles_existentes', 'sin_factura', 'segundos'], 0)
+    totales['error'] = None
+    entradas = []
+    t0 = time.perf_counter()
+
+    pdf_files = listar_pdfs(prueba_path)
+    cache = abrir_cache(prueba_path) if usar_cache else None
+    try:
+        if cache is not None:
+            podar_cache(cache, pdf_files)
+
+        with conexion_bd() as conn, ProcessPoolExecutor(max_workers=workers) as pool, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='escritor-bd') as escritor, \
+                open(os.path.join(prueba_path, csv_especifico), 'w', encoding='utf-8', newline='') as cf:
+            init_tables(conn)
+            writer_items = csv.DictWriter(cf, fieldnames=CAMPOS_ESPECIFICOS)
+            writer_items.writeheader()
+            etapas = [
+                asyncio.create_task(_etapa_extraccion(pdf_files, prueba_path, cola_textos, pool, backend, cache)),
+                asyncio.create_task(_etapa_parseo(prueba_path, cola_textos, cola_filas, writer_items, entradas,
+                                                  backend, cache, tamano_tanda, tiempos)),
+                asyncio.create_task(_etapa_carga(cola_filas, escritor, conn, batch_size, totales)),
+            ]
+            try:
+                await asyncio.gather(*etapas)
+            except BaseException:
+                # Si una etapa falla, las demás quedarían esperando en las colas
+                for etapa in etapas:
+                    etapa.cancel()
+                pool.shutdown(wait=False, cancel_futures=True)
+                await asyncio.gather(*etapas, return_exceptions=True)
+                raise
+
+        escribir_csv_generales(deduplicar_generales(entradas), os.path.join(prueba_path, csv_general))
+    finally:
+        if cache is not None:
+            cerrar_cache(cache)
+
+    total = time.perf_counter() - t0
+    for etapa, segundos in tiempos.items():
+        observar('etl_etapa_segundos', segundos, etapa=etapa)
+    observar('etl_etapa_segundos', totales['segundos'], etapa='carga')
+    observar('etl_etapa_segundos', total, etapa='pipeline')
+    print(f"[{time.ctime()}] Pipeline: {len(pdf_files)} PDFs en {total:.1f}s "
+          f"(parseo {sum(tiempos.values()):.1f}s, carga {totales['segundos']:.1f}s solapados)")
+    print(f"[{time.ctime()}] Facturas nuevas: {totales['facturas']} (existentes: {totales['facturas_existentes']}, "
+          f"completadas: {totales['adoptadas']}, reemplazadas: {totales['reemplazadas']}); detalles nuevos: {totales['detalles']} "
+          f"(existentes: {totales['detalles_existentes']}, sin factura: {totales['sin_factura']})")
+    return {**totales, **tiempos, 'total': total}
+
+
+def ejecutar_pipeline(prueba_path: str = 'Facturas', **opciones) -> dict:
+    """Versión síncrona de `procesar_pipeline` (para `main.py`)."""
+    return asyncio.run(procesar_pipeline(prueba_path, **opciones))
@@ -0,0 +1,158 @@
+"""Pipeline en streaming: PDFs -> CSVs en una sola pasada, sin releer `resultado.txt`.
+
+En el modo clásico el texto va PDF -> `resultado.txt` en disco y luego cada
+parser (`parse_resultado_y_guardar_csv` y `parse_resultado_y_guardar_especifico`)
+vuelve a leer el archivo completo y a dividirlo en bloques.
+
+Aquí la extracción (`iterar_textos_pdf`) produce registros `(filename, texto)`
+que se entregan a ambos parsers a medida que llegan: los ítems se escriben
+directamente en `datos_especificos.csv` y de los datos generales solo se
+mantiene una fila por factura (necesaria para deduplicar). `resultado.txt` se
+escribe únicamente si se pide como artefacto de depuración.
+"""
+
+import os
+import csv
+import time
+from typing import Optional
+
+from analisis_general import (
+    iterar_textos_pdf, dividir_bloques, extraer_campos_generales,
+    deduplicar_generales, escribir_csv_generales, fusionar_csv_generales,
+)
+from analisis_especifico import extraer_items, fusionar_csv_especificos, CAMPOS_ESPECIFICOS
+from indice_resultado import construir_indice
+from metricas import observar
+
+
+def registrar_etapas(total: float, t_general: float, t_especifico: float) -> None:
+    """Reparte la duración `total` de una pasada en streaming entre las etapas:
+    lo que no se gastó en los parsers se atribuye a la extracción."""
+    observar('etl_etapa_segundos', max(total - t_general - t_especifico, 0.0), etapa='extraccion')
+    observar('etl_etapa_segundos', t_general, etapa='parseo_general')
+    observar('etl_etapa_segundos', t_especifico, etapa='parseo_especifico')
+
+
+def normalizar_saltos(texto: str) -> str:
+    """Convierte `\\r\\n` y `\\r` en `\\n`, igual que al releer `resultado.txt` en modo texto."""
+    return texto.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def iterar_bloques(registros):
+    """Convierte registros `(pdf_file, contenido)` en bloques `(filename, bloque)`
+    idénticos a los que se obtendrían al dividir `resultado.txt`."""
+    for pdf_file, contenido in registros:
+        yield from dividir_bloques(normalizar_saltos(f"\n----- {pdf_file} -----\n{contenido}"))
+
+
+def procesar_streaming(prueba_path: str = 'Facturas', csv_general: str = 'datos_generales.csv',
+                       csv_especifico: str = 'datos_especificos.csv', txt_debug: Optional[str] = None,
+                       usar_cache: bool = True, workers: int = 1, backend: Optional[str] = None) -> tuple:
+    """Extrae los PDFs de `prueba_path` y genera ambos CSVs en una sola pasada.
+
+    Si `txt_debug` tiene un nombre de archivo, además se escribe allí el texto
+    consolidado con el mismo formato de `resultado.txt`.
+
+    Retorna `(ruta_csv_general, ruta_csv_especifico)`.
+    """
+    csv_g_path = os.path.join(prueba_path, csv_general)
+    csv_e_path = os.path.join(prueba_path, csv_especifico)
+    registros = iterar_textos_pdf(prueba_path, usar_cache=usar_cache, workers=workers, backend=backend)
+
+    t0 = time.perf_counter()
+    t_general = t_especifico = 0.0
+    entries = []
+    txt_f = open(os.path.join(prueba_path, txt_debug), 'w', encoding='utf-8') if txt_debug else None
+    try:
+        with open(csv_e_path, 'w', encoding='utf-8', newline='') as cf:
+            writer = csv.DictWriter(cf, fieldnames=CAMPOS_ESPECIFICOS)
+            writer.writeheader()
+
+            for pdf_file, contenido in registros:
+                if txt_f is not None:
+                    txt_f.write(f"\n----- {pdf_file} -----\n")
+                    txt_f.write(contenido)
+
+                for filename, block in iterar_bloques([(pdf_file, contenido)]):
+                    t1 = time.perf_counter()
+                    entries.append(extraer_campos_generales(filename, block))
+                    t2 = time.perf_counter()
+                    writer.writerows(extraer_items(filename, block))
+                    t_general += t2 - t1
+                    t_especifico += time.perf_counter() - t2
+    finally:
+        if txt_f is not None:
+            txt_f.close()
+            construir_indice(txt_f.name)
+
+    t1 = time.perf_counter()
+    escribir_csv_generales(deduplicar_generales(entries), csv_g_path)
+    t_general += time.perf_counter() - t1
+    registrar_etapas(time.perf_counter() - t0, t_general, t_especifico)
+    return csv_g_path, csv_e_path
+
+
+def parsear_archivos(nuevos_archivos: list, prueba_path: str = 'Facturas', usar_cache: bool = True,
+                     workers: int = 1, backend: Optional[str] = None) -> tuple:
+    """Extrae y parsea solo `nuevos_archivos`, sin tocar los CSVs.
+
+    El costo crece con la cantidad de PDFs nuevos y no con el total de la
+    carpeta. Como no escribe nada compartido, puede correr en paralelo en
+    varios procesos; la fusión (`fusionar_filas`) es la que necesita el
+    bloqueo de la carpeta.
+
+    Retorna `(archivos, entradas_generales, filas_especificas)`.
+    """
+    registros = iterar_textos_pdf(prueba_path, usar_cache=usar_cache, workers=workers,
+                                  backend=backend, solo_archivos=nuevos_archivos)
+
+    t0 = time.perf_counter()
+    t_general = t_especifico = 0.0
+    archivos = []
+    entries = []
+    items = []
+    for filename, block in iterar_bloques(registros):
+        archivos.append(filename)
+        t1 = time.perf_counter()
+        entries.append(extraer_campos_generales(filename, block))
+        t2 = time.perf_counter()
+        items.extend(extraer_items(filename, block))
+        t_general += t2 - t1
+        t_especifico += time.perf_counter() - t2
+    registrar_etapas(time.perf_counter() - t0, t_general, t_especifico)
+    return archivos, entries, items
+
+
+def fusionar_filas(prueba_path: str, archivos: list, entries: list, items: list,
+                   csv_general: str = 'datos_generales.csv', csv_especifico: str = 'datos_especificos.csv') -> tuple:
+    """Fusiona las filas de `parsear_archivos` en los CSVs existentes.
+
+    Los CSVs se reescriben de forma atómica (archivo temporal + rename)
+    manteniendo la deduplicación por clave (contrato, período).
+
+    Retorna `(entradas_generales, filas_especificas)` incorporadas a los CSVs,
+    que son las únicas que hace falta cargar a la base de datos.
+    """
+    t0 = time.perf_counter()
+    incorporadas = fusionar_csv_generales(os.path.join(prueba_path, csv_general), entries)
+    t1 = time.perf_counter()
+    fusionar_csv_especificos(os.path.join(prueba_path, csv_especifico), items, archivos)
+    observar('etl_etapa_segundos', t1 - t0, etapa='parseo_general')
+    observar('etl_etapa_segundos', time.perf_counter() - t1, etapa='parseo_especifico')
+    return incorporadas, items
+
+
+def procesar_incremental(nuevos_archivos: list, prueba_path: str = 'Facturas',
+                         csv_general: str = 'datos_generales.csv', csv_especifico: str = 'datos_especificos.csv',
+                         usar_cache: bool = True, workers: int = 1, backend: Optional[str] = None) -> tuple:
+    """Extrae y parsea solo `nuevos_archivos` y fusiona sus filas en los CSVs existentes.
+
+    Equivale a `parsear_archivos` seguido de `fusionar_filas`. `resultado.txt`
+    no se modifica.
+
+    Retorna `(entradas_generales, filas_especificas)` incorporadas a los CSVs.
+    """
+    archivos, entries, items = parsear_archivos(nuevos_archivos, prueba_path, usar_cache=usar_cache,
+                                                workers=workers, backend=backend)
+    return fusionar_filas(prueba_path, archivos, entries, items,
+                          csv_general=csv_general, csv_especifico=csv_especifico)
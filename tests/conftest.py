@@ -0,0 +1,31 @@
+"""Configuración compartida de las pruebas.
+
+Las pruebas usan el backend SQLite (`DB_BACKEND=sqlite`) sobre un archivo
+temporal, así que no necesitan un servidor MySQL ni el `.env` del proyecto.
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def bd_sqlite(tmp_path, monkeypatch):
+    """Apunta `conexion_bd()` a una base SQLite nueva en `tmp_path` y retorna su ruta."""
+    import conexion
+
+    ruta = str(tmp_path / 'facturas.sqlite3')
+    monkeypatch.setenv('DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('DB_SQLITE_PATH', ruta)
+    # El pool del proceso guarda conexiones a la base anterior
+    if conexion._pool is not None:
+        conexion._pool.cerrar()
+    monkeypatch.setattr(conexion, '_pool', None)
+    yield ruta
+    if conexion._pool is not None:
+        conexion._pool.cerrar()
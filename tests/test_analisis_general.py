@@ -0,0 +1,63 @@
+"""Extracción de los PDFs de la carpeta (`analisis_general.iterar_textos_pdf`)."""
+
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('pypdf')
+
+import analisis_general
+from analisis_general import iterar_textos_pdf
+from benchmark_etl import escribir_pdfs_sinteticos, nombre_archivo
+from cache_extraccion import abrir_cache
+
+
+def test_solo_archivos_no_recorre_la_carpeta_ni_la_cache(tmp_path, monkeypatch):
+    escribir_pdfs_sinteticos(str(tmp_path), 3)
+    todos = list(iterar_textos_pdf(str(tmp_path)))
+
+    def prohibido(*args):
+        raise AssertionError('una corrida incremental no debe recorrer toda la carpeta o la caché')
+
+    monkeypatch.setattr(analisis_general, 'listar_pdfs', prohibido)
+    monkeypatch.setattr(analisis_general, 'podar_cache', prohibido)
+    nuevo = nombre_archivo(1)
+    assert list(iterar_textos_pdf(str(tmp_path), solo_archivos=[nuevo, 'no_existe.pdf', '../x.pdf'])) == [todos[1]]
+
+    cache = abrir_cache(str(tmp_path))
+    try:
+        # Las entradas de los demás PDFs siguen en la caché
+        assert cache.execute("SELECT COUNT(*) FROM archivos").fetchone() == (3,)
+    finally:
+        cache.close()
+
+
+class PoolSincrono:
+    """Reemplazo de `ProcessPoolExecutor` que cuenta los PDFs enviados."""
+
+    enviados = 0
+
+    def __init__(self, max_workers):
+        pass
+
+    def submit(self, funcion, *args):
+        PoolSincrono.enviados += 1
+        futuro = Future()
+        futuro.set_result(funcion(*args))
+        return futuro
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_workers_mantienen_una_ventana_acotada(tmp_path, monkeypatch):
+    escribir_pdfs_sinteticos(str(tmp_path), 12)
+    esperado = list(iterar_textos_pdf(str(tmp_path), usar_cache=False))
+    monkeypatch.setattr(analisis_general, 'ProcessPoolExecutor', PoolSincrono)
+    PoolSincrono.enviados = 0
+
+    obtenido = []
+    for registro in iterar_textos_pdf(str(tmp_path), usar_cache=False, workers=2):
+        obtenido.append(registro)
+        assert PoolSincrono.enviados - len(obtenido) < analisis_general.PDFS_EN_VUELO_POR_WORKER * 2
+    assert obtenido == esperado and PoolSincrono.enviados == 12
@@ -0,0 +1,121 @@
+"""Etapas del benchmark sobre el corpus sintético de 1k facturas.
+
+Verifican que los parsers entienden el formato que genera `texto_factura`
+(si cambian sus heurísticas, el benchmark dejaría de medir lo que dice) y
+que cada etapa procesa todas las filas.
+"""
+
+import os
+import re
+import csv
+import json
+import random
+import sqlite3
+import argparse
+
+import pytest
+
+import benchmark_etl
+from benchmark_etl import (
+    ESCALAS, RESULTADO_NOMBRE, CSV_GENERAL, CSV_ESPECIFICO,
+    clave_sintetica, nombre_archivo, texto_factura, escribir_resultado_sintetico,
+    escribir_pdfs_sinteticos, crear_bd_prueba, ejecutar_etapa,
+)
+
+ESCALA = ESCALAS['1k']
+ITEM = re.compile(r'^\d+ (\d{4}) (\D+?) -?[\d,]+ ')
+
+
+def facturas_esperadas(n, semilla=0):
+    """`{filename: (contrato, periodo, total, consumo, {(ID, Concepto)})}` del corpus generado."""
+    rng = random.Random(semilla)
+    esperadas = {}
+    for i in range(n):
+        lineas = texto_factura(i, rng).splitlines()
+        contrato, mes, anio = clave_sintetica(i)
+        items = {m.groups() for m in map(ITEM.match, lineas) if m}
+        esperadas[nombre_archivo(i)] = (str(contrato), f"{anio}-{mes:02d}", lineas[6].lstrip('$').replace(',', ''),
+                                        lineas[-5], items)
+    return esperadas
+
+
+def leer(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    carpeta = tmp_path_factory.mktemp('texto')
+    escribir_resultado_sintetico(str(carpeta), ESCALA)
+    return str(carpeta)
+
+
+def opciones(batch_size=0):
+    return argparse.Namespace(workers=1, backend=None, batch_size=batch_size)
+
+
+def test_parsers_reconocen_el_corpus(corpus):
+    assert ejecutar_etapa('generales', corpus, None, None, opciones()) == ESCALA
+    n_items = ejecutar_etapa('especificos', corpus, None, None, opciones())
+
+    esperadas = facturas_esperadas(ESCALA)
+    generales = leer(os.path.join(corpus, CSV_GENERAL))
+    assert {g['filename'] for g in generales} == set(esperadas)
+    for g in generales:
+        contrato, periodo, total, consumo, _ = esperadas[g['filename']]
+        assert (g['Contrato'], g['Periodo'], g['Total'], g['Consumo_m3']) == (contrato, periodo, total, consumo)
+        assert g['Nombre'] and g['Fecha']
+
+    items = {}
+    for e in leer(os.path.join(corpus, CSV_ESPECIFICO)):
+        items.setdefault(e['filename'], set()).add((e['ID'], e['Concepto']))
+    assert items == {f: esp[4] for f, esp in esperadas.items()}
+    assert n_items == sum(len(esp[4]) for esp in esperadas.values())
+
+
+@pytest.mark.parametrize('batch_size', [0, 500])
+def test_cargas_insertan_todas_las_filas(corpus, tmp_path, batch_size):
+    ejecutar_etapa('generales', corpus, None, None, opciones())
+    n_items = ejecutar_etapa('especificos', corpus, None, None, opciones())
+    db_path = str(tmp_path / 'bench.sqlite3')
+    crear_bd_prueba(db_path)
+
+    assert ejecutar_etapa('bd_generales', corpus, None, db_path, opciones(batch_size)) == ESCALA
+    assert ejecutar_etapa('bd_especificos', corpus, None, db_path, opciones(batch_size)) == n_items
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM Facturas").fetchone()[0] == ESCALA
+        assert conn.execute("SELECT COUNT(*) FROM Detalles").fetchone()[0] == n_items
+    finally:
+        conn.close()
+
+
+def test_pdf_a_txt_cuenta_subcarpetas(tmp_path):
+    pytest.importorskip('pypdf')
+    carpeta_pdfs = tmp_path / 'pdfs'
+    (carpeta_pdfs / '2024').mkdir(parents=True)
+    escribir_pdfs_sinteticos(str(carpeta_pdfs), 10)
+    escribir_pdfs_sinteticos(str(carpeta_pdfs / '2024'), 10, semilla=1)
+
+    assert ejecutar_etapa('pdf_a_txt', None, str(carpeta_pdfs), None, opciones()) == 20
+    texto = (carpeta_pdfs / RESULTADO_NOMBRE).read_text(encoding='utf-8')
+    assert texto.count('\n----- ') == 20
+    assert 'ERROR' not in texto
+
+
+def test_main_registra_todas_las_etapas(tmp_path, monkeypatch):
+    pytest.importorskip('pypdf')
+    resultados = tmp_path / 'resultados.jsonl'
+    monkeypatch.setattr('sys.argv', ['benchmark_etl.py', '--escala', '1k', '--pdfs', '20',
+                                     '--batch-size', '500', '--resultados', str(resultados)])
+    benchmark_etl.main()
+
+    registro = json.loads(resultados.read_text(encoding='utf-8').splitlines()[-1])
+    etapas = registro['etapas']
+    assert list(etapas) == benchmark_etl.ETAPAS
+    assert etapas['pdf_a_txt']['filas'] == 20
+    assert etapas['generales']['filas'] == etapas['bd_generales']['filas'] == ESCALA
+    assert etapas['especificos']['filas'] == etapas['bd_especificos']['filas'] > ESCALA
+    assert all(m['segundos'] > 0 for m in etapas.values())
@@ -0,0 +1,68 @@
+"""Caché de extracción por hash de contenido (`cache_extraccion`)."""
+
+import os
+import shutil
+
+import pytest
+
+from cache_extraccion import abrir_cache, cerrar_cache, buscar_en_cache, actualizar_cache, podar_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    conn = abrir_cache(str(tmp_path))
+    yield conn
+    cerrar_cache(conn)
+
+
+def pdf(tmp_path, nombre, contenido=b'%PDF-1.4 a'):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+def test_acierto_y_revalidacion_por_hash(tmp_path, cache):
+    ruta = pdf(tmp_path, 'a.pdf')
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pypdf') is None
+    actualizar_cache(cache, ruta, 'a.pdf', 'texto a', 'pypdf')
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pypdf') == 'texto a'
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pymupdf') is None
+
+    # Mismo contenido copiado de nuevo (otro mtime): se revalida y el índice se actualiza
+    os.utime(ruta, ns=(1, 1))
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pypdf') == 'texto a'
+    assert cache.execute("SELECT mtime_ns FROM archivos WHERE filename = 'a.pdf'").fetchone() == (1,)
+
+    # Contenido distinto con el mismo tamaño: hay que extraerlo
+    pdf(tmp_path, 'a.pdf', b'%PDF-1.4 b')
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pypdf') is None
+
+
+def test_copia_renombrada_usa_el_mismo_texto(tmp_path, cache):
+    ruta = pdf(tmp_path, 'a.pdf')
+    actualizar_cache(cache, ruta, 'a.pdf', 'texto a', 'pypdf')
+    shutil.copy(ruta, tmp_path / 'b.pdf')
+    assert buscar_en_cache(cache, str(tmp_path / 'b.pdf'), 'b.pdf', 'pypdf') == 'texto a'
+    assert cache.execute("SELECT COUNT(*) FROM textos").fetchone() == (1,)
+
+
+def test_pdf_eliminado_despues_de_listarse(tmp_path, cache):
+    ruta = pdf(tmp_path, 'a.pdf')
+    actualizar_cache(cache, ruta, 'a.pdf', 'texto a', 'pypdf')
+    os.remove(ruta)
+    assert buscar_en_cache(cache, ruta, 'a.pdf', 'pypdf') is None
+    actualizar_cache(cache, ruta, 'a.pdf', 'otro', 'pypdf')
+
+
+def test_podar_y_persistir(tmp_path, cache):
+    for nombre, contenido in (('a.pdf', b'a'), ('b.pdf', b'b')):
+        actualizar_cache(cache, pdf(tmp_path, nombre, contenido), nombre, f'texto {nombre}', 'pypdf')
+    assert podar_cache(cache, ['b.pdf']) == 1
+    assert cache.execute("SELECT COUNT(*) FROM textos").fetchone() == (1,)
+    cache.commit()
+
+    otra = abrir_cache(str(tmp_path))
+    try:
+        assert buscar_en_cache(otra, str(tmp_path / 'b.pdf'), 'b.pdf', 'pypdf') == 'texto b.pdf'
+    finally:
+        otra.close()
@@ -0,0 +1,38 @@
+"""Clave de factura (`clave_factura`) y elección entre duplicados (`preferir_entrada`)."""
+
+from analisis_general import deduplicar_generales, preferir_entrada
+from clave_factura import desde_texto, extraer_clave
+
+
+ENCABEZADO = '\n'.join([
+    '2110376038',
+    'Kit34',
+    '1025335',
+    'JUAN CARLOS',
+    'PEREZ 05/12/2024 15/NOV/2024',
+    '$12.345 $0  $0  $0',
+    '1980 20/12/2024',
+])
+
+
+def test_periodo_de_la_etiqueta_y_no_de_la_primera_fecha():
+    # La primera fecha es la de expedición (diciembre); el período es noviembre
+    assert desde_texto(ENCABEZADO) == {'contrato': '1025335', 'periodo': '2024-11', 'numero': '2110376038'}
+    assert extraer_clave('KUL2025.pdf', ENCABEZADO)['Periodo'] == '2024-11'
+
+
+def test_sin_etiqueta_solo_fechas_del_mismo_mes():
+    assert desde_texto('1025335\nPEREZ 15/11/2024\n1980 20/11/2024')['periodo'] == '2024-11'
+    assert desde_texto('1025335\nPEREZ 05/12/2024\n1980 20/01/2025')['periodo'] is None
+
+
+def test_preferir_el_periodo_leido_del_nombre():
+    correcto = {'filename': 'SEP2025.pdf', 'Contrato': '', 'Periodo': '2025-09'}
+    mal_escrito = {'filename': 'FEP2025.pdf', 'Contrato': '', 'Periodo': '2025-09'}
+    assert preferir_entrada(mal_escrito, correcto) and not preferir_entrada(correcto, mal_escrito)
+    assert deduplicar_generales([mal_escrito, correcto]) == [correcto]
+    assert deduplicar_generales([correcto, mal_escrito]) == [correcto]
+
+    # Ambos nombres válidos: el más largo y, ante empate, el menor
+    largo = {'filename': '335_SEP2025.pdf', 'Contrato': '', 'Periodo': '2025-09'}
+    assert deduplicar_generales([correcto, largo]) == [largo]
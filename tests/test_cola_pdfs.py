@@ -0,0 +1,183 @@
+"""Cola de PDFs con arriendos (`cola_pdfs`) e ingesta con el bloqueo acotado a la fusión."""
+
+import sqlite3
+from contextlib import contextmanager, nullcontext
+
+import pytest
+
+import cola_pdfs
+import ingesta
+from cola_pdfs import encolar, reclamar, renovar, completar, fallar, resumen_cola
+from corregir_cargar import conexion_bd, init_tables
+
+
+@pytest.fixture
+def conn(bd_sqlite):
+    with conexion_bd() as conn:
+        init_tables(conn)
+        yield conn
+
+
+def fila(conn, filename):
+    cursor = conn.cursor()
+    cursor.execute("""SELECT estado, worker, intentos, size, reencolar FROM ColaPDFs
+        WHERE filename = %s""", (filename,))
+    resultado = cursor.fetchone()
+    cursor.close()
+    return resultado
+
+
+def test_reclamar_reparte_sin_repetir(conn):
+    assert encolar(conn, {f'{i}.pdf': (100, i) for i in range(5)}) == 5
+    assert encolar(conn, {f'{i}.pdf': (100, i) for i in range(5)}) == 0
+
+    a = reclamar(conn, 'a', cantidad=3)
+    b = reclamar(conn, 'b', cantidad=3)
+    assert a == ['0.pdf', '1.pdf', '2.pdf'] and b == ['3.pdf', '4.pdf']
+    assert reclamar(conn, 'c') == []
+    assert resumen_cola(conn) == {'procesando': 5}
+
+
+def test_arriendo_vencido_se_retoma(conn):
+    encolar(conn, {'a.pdf': (100, 1)})
+    assert reclamar(conn, 'muerto', arriendo=-1) == ['a.pdf']
+    assert reclamar(conn, 'vivo') == ['a.pdf']
+    # El worker que perdió el arriendo ya no puede terminarlo
+    assert completar(conn, 'muerto', ['a.pdf']) == 0
+    assert completar(conn, 'vivo', ['a.pdf']) == 1
+    assert fila(conn, 'a.pdf')[:3] == ('ok', None, 2)
+
+
+def test_renovar_mantiene_el_arriendo(conn):
+    encolar(conn, {'a.pdf': (100, 1)})
+    reclamar(conn, 'a', arriendo=-1)
+    assert renovar(conn, 'a', arriendo=300) == 1
+    assert reclamar(conn, 'b') == []
+
+
+def test_encolar_no_quita_un_arriendo_vigente(conn):
+    encolar(conn, {'a.pdf': (100, 1)})
+    assert reclamar(conn, 'a') == ['a.pdf']
+
+    # El PDF se reemplaza mientras `a` lo procesa
+    assert encolar(conn, {'a.pdf': (200, 2)}) == 1
+    assert fila(conn, 'a.pdf') == ('procesando', 'a', 1, 200, 1)
+    assert reclamar(conn, 'b') == []
+
+    # Al terminar, vuelve a la cola para procesar la versión nueva
+    assert completar(conn, 'a', ['a.pdf']) == 0
+    assert fila(conn, 'a.pdf') == ('pendiente', None, 0, 200, 0)
+    assert reclamar(conn, 'b') == ['a.pdf']
+    assert completar(conn, 'b', ['a.pdf']) == 1
+    assert fila(conn, 'a.pdf')[0] == 'ok'
+
+
+def test_reemplazo_con_arriendo_vencido(conn):
+    encolar(conn, {'a.pdf': (100, 1), 'b.pdf': (100, 1)})
+    reclamar(conn, 'muerto', arriendo=-1)
+    # Vencido: se reencola de inmediato y sin el worker anterior
+    assert encolar(conn, {'a.pdf': (200, 2)}) == 1
+    assert fila(conn, 'a.pdf') == ('pendiente', None, 0, 200, 0)
+
+    # Marcado con el arriendo vigente y vencido después, aun sin intentos disponibles
+    reclamar(conn, 'vivo', cantidad=1)
+    encolar(conn, {'a.pdf': (300, 3)})
+    cursor = conn.cursor()
+    cursor.execute("UPDATE ColaPDFs SET arriendo_hasta = 0, intentos = 99 WHERE filename = 'a.pdf'")
+    conn.commit()
+    cursor.close()
+    assert 'a.pdf' in reclamar(conn, 'otro')
+    assert fila(conn, 'a.pdf') == ('procesando', 'otro', 1, 300, 0)
+
+
+def test_fallar_reintenta_y_luego_marca_error(conn):
+    encolar(conn, {'a.pdf': (100, 1)})
+    for intento in range(1, 3):
+        assert reclamar(conn, 'a', max_intentos=2) == ['a.pdf']
+        assert fallar(conn, 'a', ['a.pdf'], 'falló', max_intentos=2, reintento=-1) == 1
+        estado = 'pendiente' if intento < 2 else 'error'
+        assert fila(conn, 'a.pdf')[:3] == (estado, None, intento)
+    assert reclamar(conn, 'a', max_intentos=2) == []
+
+
+def test_reintento_respeta_la_espera(conn):
+    encolar(conn, {'a.pdf': (100, 1)})
+    reclamar(conn, 'a')
+    fallar(conn, 'a', ['a.pdf'], 'falló', reintento=300)
+    assert reclamar(conn, 'a') == []
+
+
+def test_worker_sobrevive_a_un_error_al_completar(conn, tmp_path, monkeypatch):
+    encolar(conn, {'a.pdf': (100, 1)})
+    procesados = []
+
+    def completar_sin_bd(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(cola_pdfs, 'ingerir_archivos', lambda filenames, *args, **kwargs: procesados.append(filenames))
+    monkeypatch.setattr(cola_pdfs, 'completar', completar_sin_bd)
+
+    cola_pdfs.ejecutar_worker(str(tmp_path), intervalo=0, una_vez=True)
+    # El lote quedó con su arriendo: vuelve a la cola cuando vence
+    assert procesados == [['a.pdf']]
+    assert fila(conn, 'a.pdf')[0] == 'procesando'
+
+
+def test_ingesta_solo_bloquea_la_fusion(tmp_path, monkeypatch):
+    """La extracción, el parseo y la carga no esperan el bloqueo de otros workers."""
+    eventos = []
+    bloqueado = []
+    original = ingesta.bloqueo_carpeta
+
+    @contextmanager
+    def bloqueo(prueba_path):
+        with original(prueba_path):
+            bloqueado.append(True)
+            yield
+            bloqueado.pop()
+
+    def etapa(nombre, resultado=None):
+        def funcion(*args, **kwargs):
+            eventos.append((nombre, bool(bloqueado)))
+            return resultado
+        return funcion
+
+    monkeypatch.setattr(ingesta, 'bloqueo_carpeta', bloqueo)
+    monkeypatch.setattr(ingesta, 'parsear_archivos', etapa('parseo', ([], [], [])))
+    monkeypatch.setattr(ingesta, 'fusionar_filas', etapa('fusion', ([], [])))
+    monkeypatch.setattr(ingesta, 'cargar_filas', etapa('carga'))
+    monkeypatch.setattr(ingesta, 'registrar_procesamiento', etapa('manifiesto'))
+    monkeypatch.setattr(ingesta, 'conexion_bd', nullcontext)
+    monkeypatch.setattr(ingesta, 'init_tables', etapa('init'))
+    monkeypatch.setattr(ingesta, 'incrementar_generacion', etapa('generacion'))
+
+    ingesta.ingerir_archivos(['a.pdf'], str(tmp_path))
+    assert [e for e in eventos if e[0] in ('parseo', 'fusion', 'carga', 'manifiesto')] == [
+        ('parseo', False), ('fusion', True), ('carga', False), ('manifiesto', True)]
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_main_registra_el_manifiesto_con_el_bloqueo(tmp_path, monkeypatch, pipeline):
+    import main
+
+    bloqueado = []
+    registros = []
+    original = ingesta.bloqueo_carpeta
+
+    @contextmanager
+    def bloqueo(prueba_path):
+        with original(prueba_path):
+            bloqueado.append(True)
+            yield
+            bloqueado.pop()
+
+    monkeypatch.setattr(ingesta, 'bloqueo_carpeta', bloqueo)
+    monkeypatch.setattr(ingesta, 'registrar_procesamiento',
+                        lambda *args: registros.append((args[2:], bool(bloqueado))))
+    monkeypatch.setattr(main, 'CARPETA_FACTURAS', str(tmp_path))
+    monkeypatch.setattr(main, 'generar_y_cargar', lambda *args: (None, None, True))
+    monkeypatch.setattr(main, 'generar_csvs', lambda **opciones: (None, None))
+    monkeypatch.setattr(main, 'cargar_datos_existentes_a_bd', lambda batch_size: True)
+
+    main.procesar_y_actualizar(['a.pdf'], pipeline=pipeline)
+    assert registros == [(('ok', 'ok'), True)]
@@ -0,0 +1,69 @@
+"""Pool de conexiones compartido (`conexion.PoolConexiones`, `conexion_bd`)."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from conexion import PoolConexiones, conexion_bd
+
+
+class Conexion:
+    """Conexión falsa que registra cómo la usa el pool."""
+
+    def __init__(self):
+        self.cerrada = False
+        self.caida = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if self.caida:
+            raise ConnectionError('MySQL server has gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.cerrada = True
+
+
+def test_reutiliza_y_limpia_la_conexion():
+    pool = PoolConexiones(tamano=2, fabrica=Conexion)
+    conn = pool.obtener()
+    pool.devolver(conn)
+    assert pool.obtener() is conn and conn.rollbacks == 1
+
+
+def test_espera_una_conexion_libre():
+    pool = PoolConexiones(tamano=1, timeout=0.05, fabrica=Conexion)
+    conn = pool.obtener()
+    with pytest.raises(TimeoutError):
+        pool.obtener()
+
+    threading.Timer(0.01, pool.devolver, (conn,)).start()
+    pool.timeout = 5
+    assert pool.obtener() is conn
+
+
+def test_recicla_vieja_y_reemplaza_caida():
+    pool = PoolConexiones(tamano=1, reciclar_seg=-1, fabrica=Conexion)
+    vieja = pool.obtener()
+    pool.devolver(vieja)
+    assert pool.obtener() is not vieja and vieja.cerrada
+
+    pool = PoolConexiones(tamano=1, ping_seg=-1, fabrica=Conexion)
+    caida = pool.obtener()
+    pool.devolver(caida)
+    caida.caida = True
+    assert pool.obtener() is not caida and caida.cerrada
+
+
+def test_conexion_bd_descarta_tras_error_del_driver(bd_sqlite):
+    with conexion_bd() as conn:
+        pass
+    with pytest.raises(sqlite3.OperationalError):
+        with conexion_bd() as otra:
+            assert otra is conn
+            otra.cursor().execute("SELECT * FROM tabla_inexistente")
+    with conexion_bd() as nueva:
+        assert nueva is not conn
@@ -0,0 +1,91 @@
+"""Carga masiva por lotes (`corregir_cargar.cargar_*_por_lotes`) contra la carga fila por fila."""
+
+import pytest
+
+import corregir_cargar
+from analisis_general import parse_resultado_y_guardar_csv
+from analisis_especifico import parse_resultado_y_guardar_especifico
+from benchmark_etl import escribir_resultado_sintetico
+from conexion_sqlite import conectar_sqlite
+from corregir_cargar import (init_tables, leer_csv, process_generales_filas, process_especificos_filas,
+                             cargar_generales_por_lotes, cargar_especificos_por_lotes)
+
+N_FACTURAS = 12
+
+
+@pytest.fixture(scope='module')
+def filas(tmp_path_factory):
+    carpeta = str(tmp_path_factory.mktemp('texto'))
+    escribir_resultado_sintetico(carpeta, N_FACTURAS)
+    return (leer_csv(parse_resultado_y_guardar_csv(carpeta)),
+            leer_csv(parse_resultado_y_guardar_especifico(carpeta)))
+
+
+@pytest.fixture
+def abrir(tmp_path):
+    conexiones = []
+
+    def abrir(nombre):
+        conn = conectar_sqlite(str(tmp_path / nombre))
+        init_tables(conn)
+        conexiones.append(conn)
+        return conn
+    yield abrir
+    for conn in conexiones:
+        conn.close()
+
+
+def contenido(conn):
+    cursor = conn.cursor()
+    cursor.execute("""SELECT f.contrato, f.periodo, f.filename, f.total, d.concepto, d.valor_pagar
+        FROM Facturas f LEFT JOIN Detalles d ON d.factura_id = f.id ORDER BY 1, 2, 5, 6""")
+    filas = cursor.fetchall()
+    cursor.close()
+    return filas
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 500])
+def test_por_lotes_equivale_a_fila_por_fila(filas, abrir, batch_size):
+    generales, especificos = filas
+    fila_por_fila = abrir('fila.sqlite3')
+    process_generales_filas(fila_por_fila, generales)
+    process_especificos_filas(fila_por_fila, especificos)
+
+    por_lotes = abrir('lotes.sqlite3')
+    clave_to_id = cargar_generales_por_lotes(por_lotes, generales, batch_size)
+    cargar_especificos_por_lotes(por_lotes, especificos, batch_size)
+
+    assert len(clave_to_id) == N_FACTURAS
+    assert contenido(por_lotes) == contenido(fila_por_fila)
+
+
+def test_reintento_tras_interrupcion_no_duplica(filas, abrir, monkeypatch):
+    generales, especificos = filas
+    completa = abrir('completa.sqlite3')
+    cargar_generales_por_lotes(completa, generales, 5)
+    cargar_especificos_por_lotes(completa, especificos, 5)
+
+    conn = abrir('interrumpida.sqlite3')
+    cargar_generales_por_lotes(conn, generales, 5)
+    original = corregir_cargar.insert_detalles_lote
+    lotes = []
+
+    def falla_en_el_segundo(conn, lote):
+        lotes.append(lote)
+        if len(lotes) == 2:
+            raise RuntimeError('conexión perdida')
+        original(conn, lote)
+
+    monkeypatch.setattr(corregir_cargar, 'insert_detalles_lote', falla_en_el_segundo)
+    with pytest.raises(RuntimeError):
+        cargar_especificos_por_lotes(conn, especificos, 5)
+    monkeypatch.undo()
+
+    # El primer lote quedó confirmado: al reintentar solo se inserta el resto
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Detalles")
+    assert cursor.fetchone()[0] == 5
+    cursor.close()
+    cargar_generales_por_lotes(conn, generales, 5)
+    cargar_especificos_por_lotes(conn, especificos, 5)
+    assert contenido(conn) == contenido(completa)
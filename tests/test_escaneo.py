@@ -0,0 +1,185 @@
+"""Escaneo por shards y vigilancia de la carpeta: PDFs que se siguen escribiendo después de listarse."""
+
+import os
+import time
+import signal
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import vigilante
+from escaneo import escanear_pdfs
+from manifiesto import abrir_manifiesto, escanear, pendientes, registrar
+from vigilante import vigilar_polling
+
+
+def escribir(ruta, contenido, modo='wb'):
+    with open(ruta, modo) as f:
+        f.write(contenido)
+
+
+def test_escaneo_refresca_pdfs_recientes(tmp_path):
+    (tmp_path / '2024').mkdir()
+    pdf = tmp_path / '2024' / 'a.pdf'
+    escribir(pdf, b'%PDF-1.4 parcial')
+    carpetas = {}
+    firmas, _ = escanear_pdfs(str(tmp_path), carpetas)
+    mtime_carpeta = os.stat(tmp_path / '2024').st_mtime_ns
+
+    escribir(pdf, b' resto del archivo', 'ab')
+    assert os.stat(tmp_path / '2024').st_mtime_ns == mtime_carpeta
+    nuevas, rescaneadas = escanear_pdfs(str(tmp_path), carpetas)
+
+    assert nuevas['2024/a.pdf'][0] == pdf.stat().st_size != firmas['2024/a.pdf'][0]
+    assert rescaneadas == ['2024']
+    # Sin cambios: no se vuelve a listar ni cambia el registro
+    assert escanear_pdfs(str(tmp_path), carpetas)[1] == []
+
+
+def test_escaneo_no_consulta_pdfs_viejos(tmp_path):
+    pdf = tmp_path / 'viejo.pdf'
+    escribir(pdf, b'%PDF-1.4')
+    os.utime(pdf, (1, 1))
+    carpetas = {}
+    escanear_pdfs(str(tmp_path), carpetas)
+    os.utime(pdf, (2, 2))
+    # Fuera de la ventana: se usa la firma registrada (un stat por carpeta)
+    firmas, rescaneadas = escanear_pdfs(str(tmp_path), carpetas)
+    assert firmas['viejo.pdf'][1] == 1_000_000_000 and rescaneadas == []
+
+
+def sobrescribir_pdf_viejo(carpeta):
+    """Crea un PDF viejo y retorna una función que lo sobrescribe en el lugar."""
+    pdf = carpeta / 'viejo.pdf'
+    escribir(pdf, b'%PDF-1.4 original')
+    os.utime(pdf, (1, 1))
+
+    def sobrescribir():
+        mtime_carpeta = os.stat(carpeta).st_mtime_ns
+        escribir(pdf, b'%PDF-1.4 corregido', 'r+b')
+        assert os.stat(carpeta).st_mtime_ns == mtime_carpeta
+    return sobrescribir
+
+
+def test_revision_completa_detecta_pdf_sobrescrito(tmp_path):
+    sobrescribir = sobrescribir_pdf_viejo(tmp_path)
+    carpetas = {}
+    escanear_pdfs(str(tmp_path), carpetas)
+    sobrescribir()
+
+    assert escanear_pdfs(str(tmp_path), carpetas)[0]['viejo.pdf'][1] == 1_000_000_000
+    firmas, rescaneadas = escanear_pdfs(str(tmp_path), carpetas, completo=True)
+    assert firmas['viejo.pdf'][1] == (tmp_path / 'viejo.pdf').stat().st_mtime_ns and rescaneadas == ['']
+
+
+def test_once_reprocesa_pdf_sobrescrito(tmp_path):
+    """Con el registro de shards persistido, `--once` escanea con `completo`."""
+    sobrescribir = sobrescribir_pdf_viejo(tmp_path)
+    conn = abrir_manifiesto(str(tmp_path))
+    try:
+        registrar(conn, str(tmp_path), list(escanear(conn, str(tmp_path))), 'ok', 'ok')
+        sobrescribir()
+        firmas = escanear(conn, str(tmp_path), completo=True)
+        assert pendientes(conn, str(tmp_path), sorted(firmas), firmas) == ['viejo.pdf']
+    finally:
+        conn.close()
+
+
+@contextmanager
+def limite_de_tiempo(segundos):
+    """Falla en lugar de colgarse si el generador nunca entrega el lote."""
+    def vencido(*_):
+        raise TimeoutError(f"Sin lote en {segundos}s")
+    anterior = signal.signal(signal.SIGALRM, vencido)
+    signal.alarm(segundos)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, anterior)
+
+
+def test_polling_reentrega_pdf_que_siguio_creciendo(tmp_path):
+    pdf = tmp_path / 'a.pdf'
+    lotes = vigilar_polling(str(tmp_path), intervalo=0.01, espera=0.05)
+    with limite_de_tiempo(5):
+        assert next(lotes) == []
+
+        escribir(pdf, b'%PDF-1.4 parcial')
+        assert next(lotes) == ['a.pdf']
+        # La copia continúa después de pasar el debounce
+        escribir(pdf, b' resto del archivo', 'ab')
+        assert next(lotes) == ['a.pdf']
+
+
+def test_polling_revisa_todo_periodicamente(tmp_path, monkeypatch):
+    monkeypatch.setattr(vigilante, 'ESCANEOS_POR_REVISION_COMPLETA', 3)
+    sobrescribir = sobrescribir_pdf_viejo(tmp_path)
+    lotes = vigilar_polling(str(tmp_path), intervalo=0.01, espera=0.01)
+    with limite_de_tiempo(5):
+        assert next(lotes) == ['viejo.pdf']
+        sobrescribir()
+        assert next(lotes) == ['viejo.pdf']
+
+
+def test_polling_espera_que_el_pdf_deje_de_cambiar(tmp_path, monkeypatch):
+    pdf = tmp_path / 'a.pdf'
+    verificados = []
+    original = vigilante._firma
+
+    def sigue_creciendo(ruta):
+        # La copia sigue durante el primer debounce
+        if not verificados:
+            escribir(pdf, b' resto del archivo', 'ab')
+        verificados.append(ruta)
+        return original(ruta)
+
+    monkeypatch.setattr(vigilante, '_firma', sigue_creciendo)
+    lotes = vigilar_polling(str(tmp_path), intervalo=0.01, espera=0.01)
+    with limite_de_tiempo(5):
+        assert next(lotes) == []
+        escribir(pdf, b'%PDF-1.4 parcial')
+        assert next(lotes) == ['a.pdf']
+    assert len(verificados) == 2
+
+
+def test_inotify_agrupa_la_rafaga_en_un_lote(tmp_path):
+    lotes = vigilante.vigilar_inotify(str(tmp_path), espera=0.3)
+    try:
+        primero = next(lotes)
+    except OSError as e:
+        pytest.skip(f"inotify no disponible: {e}")
+    assert primero == []
+
+    def copiar():
+        escribir(tmp_path / 'a.pdf', b'%PDF-1.4 parcial')
+        escribir(tmp_path / 'a.pdf', b' resto del archivo', 'ab')
+        time.sleep(0.1)
+        escribir(tmp_path / 'b.pdf', b'%PDF-1.4')
+
+    copia = threading.Thread(target=copiar)
+    copia.start()
+    with limite_de_tiempo(5):
+        assert next(lotes) == ['a.pdf', 'b.pdf']
+    copia.join()
+    lotes.close()
+
+
+def test_descubridor_reencola_pdf_que_siguio_creciendo(tmp_path):
+    from cola_pdfs import DescubridorPDFs
+
+    pdf = tmp_path / 'a.pdf'
+    descubridor = DescubridorPDFs(str(tmp_path), espera=0.05)
+    assert descubridor.revisar() == {}
+
+    escribir(pdf, b'%PDF-1.4 parcial')
+    assert descubridor.revisar() == {}
+    time.sleep(0.06)
+    assert list(descubridor.revisar()) == ['a.pdf']
+
+    escribir(pdf, b' resto del archivo', 'ab')
+    assert descubridor.revisar() == {}
+    time.sleep(0.06)
+    listos = descubridor.revisar()
+    assert listos == {'a.pdf': (pdf.stat().st_size, pdf.stat().st_mtime_ns)}
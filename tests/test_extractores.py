@@ -0,0 +1,55 @@
+"""Selección del backend de extracción (`extractores`) y su uso en `iterar_textos_pdf`."""
+
+import pytest
+
+import analisis_general
+import extractores
+from analisis_general import iterar_textos_pdf
+from benchmark_etl import escribir_pdfs_sinteticos, nombre_archivo
+from extractores import BACKEND_POR_DEFECTO, backend_configurado, extraer_texto, validar_backend
+
+
+def test_backend_configurado(monkeypatch):
+    monkeypatch.delenv('EXTRACTOR_PDF', raising=False)
+    assert backend_configurado() == BACKEND_POR_DEFECTO == 'pypdf'
+    monkeypatch.setenv('EXTRACTOR_PDF', 'pdfplumber')
+    assert backend_configurado() == 'pdfplumber'
+
+
+def test_backend_desconocido():
+    assert validar_backend('pymupdf') == 'pymupdf'
+    with pytest.raises(ValueError, match='Opciones: pypdf, pymupdf, pdfplumber'):
+        extraer_texto('a.pdf', 'tesseract')
+
+
+def test_iterar_usa_el_backend_configurado(tmp_path, monkeypatch):
+    escribir_pdfs_sinteticos(str(tmp_path), 2)
+    llamadas = []
+
+    def backend_falso(nombre):
+        def paginas(ruta):
+            llamadas.append(nombre)
+            return [f'{nombre} página 1', 'página 2']
+        return paginas
+
+    for nombre in ('pymupdf', 'pdfplumber'):
+        monkeypatch.setitem(extractores.BACKENDS, nombre, backend_falso(nombre))
+    monkeypatch.setattr(analisis_general, 'backend_disponible', lambda nombre: True)
+
+    monkeypatch.setenv('EXTRACTOR_PDF', 'pymupdf')
+    textos = list(iterar_textos_pdf(str(tmp_path)))
+    assert [f for f, _ in textos] == [nombre_archivo(i) for i in range(2)]
+    assert all('pymupdf página 1\npágina 2' in contenido for _, contenido in textos)
+    assert llamadas == ['pymupdf'] * 2
+
+    # La caché guarda el texto por backend: el mismo no vuelve a extraer, otro sí
+    assert list(iterar_textos_pdf(str(tmp_path))) == textos
+    pdfplumber = list(iterar_textos_pdf(str(tmp_path), backend='pdfplumber'))
+    assert all('pdfplumber página 1' in contenido for _, contenido in pdfplumber)
+    assert llamadas == ['pymupdf'] * 2 + ['pdfplumber'] * 2
+
+
+def test_pypdf_extrae_el_texto_de_la_factura(tmp_path):
+    pytest.importorskip('pypdf')
+    escribir_pdfs_sinteticos(str(tmp_path), 1)
+    assert 'Kit34' in extraer_texto(str(tmp_path / nombre_archivo(0)), 'pypdf')
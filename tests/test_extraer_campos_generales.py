@@ -0,0 +1,54 @@
+"""Campos generales de una factura (`analisis_general.extraer_campos_generales`).
+
+Los valores esperados son los que producía el parser anterior de varias pasadas:
+la versión de una sola pasada debe dar exactamente el mismo resultado.
+"""
+
+import random
+
+import pytest
+
+from analisis_general import extraer_campos_generales
+from benchmark_etl import texto_factura
+
+
+BLOQUES = {
+    'nombre_en_minusculas_y_total_con_etiqueta': (
+        ['2110376038', 'Kit34', '1025335', 'ana maria ruiz', 'PEREZ 05/11/2024 05/NOV/2024',
+         '$26,815 $0  $0  $0', 'TOTAL A PAGAR $ 1.234.567',
+         '1 0031 CONSUMO DE GAS NATURAL 26,815 26,815 0      Unidad 1.00', '3', '45', 'Al día'],
+        {'Nombre': 'ana maria ruiz', 'Fecha': '05/11/2024', 'Gas': '26815', 'credito': '0',
+         'Total': '1234567', 'Consumo_m3': '45'},
+    ),
+    'montos_sueltos_sin_linea_de_cargos': (
+        ['1025335', 'JOSE LUIS\xa0GOMEZ', 'Fecha de pago 15/11/2024', '$ 12.000', 'Gas', '$ 3.500',
+         '7', '0.67'],
+        {'Nombre': 'JOSE LUIS GOMEZ', 'Fecha': '15/11/2024', 'Gas': '12000', 'credito': '3500',
+         'Total': '12000', 'Consumo_m3': '7'},
+    ),
+    'sin_nombre_valido_y_consumo_desde_el_final': (
+        ['CLIENTE RESIDENCIAL', 'KR 5 # 10-20', 'ESTRATO 2 20/11/2024', '$1 $2 $3', 'Importe $ 99',
+         '99', '5001', '8'],
+        {'Nombre': 'CLIENTE RESIDENCIAL', 'Fecha': '20/11/2024', 'Gas': '1', 'credito': '2',
+         'Total': '99', 'Consumo_m3': '99'},
+    ),
+}
+
+
+def campos_anteriores(entrada):
+    """Solo las columnas que ya existían antes de agregar la clave de la factura."""
+    return {k: entrada[k] for k in ('filename', 'Nombre', 'Fecha', 'Gas', 'credito', 'Total', 'Consumo_m3')}
+
+
+@pytest.mark.parametrize('caso', sorted(BLOQUES))
+def test_mismos_campos_que_el_parser_anterior(caso):
+    lineas, esperado = BLOQUES[caso]
+    entrada = extraer_campos_generales('a.pdf', '\n'.join(lineas))
+    assert campos_anteriores(entrada) == {'filename': 'a.pdf', **esperado}
+
+
+def test_factura_sintetica():
+    entrada = extraer_campos_generales('f.pdf', texto_factura(0, random.Random(7)))
+    assert campos_anteriores(entrada) == {
+        'filename': 'f.pdf', 'Nombre': 'ANA MARIA DIAZ', 'Fecha': '11/01/2024', 'Gas': '55810',
+        'credito': '73248', 'Total': '661026', 'Consumo_m3': '48'}
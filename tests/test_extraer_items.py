@@ -0,0 +1,61 @@
+"""Ítems de una factura (`analisis_especifico.extraer_items`).
+
+Los valores esperados son los que producía el parser anterior basado en
+expresiones regulares: el tokenizador debe dar exactamente el mismo resultado.
+"""
+
+import random
+
+import pytest
+
+from analisis_especifico import extraer_items
+from benchmark_etl import texto_factura
+
+
+BLOQUES = {
+    'subsidio_negativo_id_n_y_un_solo_monto': (
+        ['encabezado',
+         '1 0031 CONSUMO DE GAS NATURAL 26,815 26,815 0      Unidad 1.00',
+         '2 0196 SUBSIDIO AL CONSUMO -36,156 0      Unidad 1.00',
+         '3 N AJUSTE AL PESO 1,000 1,000',
+         '4 0884 CREDITO MOTO 12',
+         '5 0177 SEGURO FNB',
+         '2005 - 20050000 -  RIB S - ACT'],
+        [('0031', 'CONSUMO DE GAS NATURAL', '26815'),
+         ('0196', 'SUBSIDIO AL CONSUMO', '36156'),
+         ('N', 'AJUSTE AL PESO', '1000')],
+    ),
+    'sin_item_1_e_indice_de_tres_digitos': (
+        ['2 0031 CONSUMO 5,000 5,000 0',
+         '7 12 34 CARGO FIJO 1,00 2,00 3 4',
+         '100 0031 NO ES ITEM 1 2',
+         '3 0177 SEGURO 1 2'],
+        [('0031', 'CONSUMO', '5000'),
+         ('12', '', '34')],
+    ),
+}
+
+
+def items_anteriores(rows):
+    """Solo las columnas que ya existían antes de agregar la clave de la factura."""
+    return [(r['ID'], r['Concepto'], r['ValorPagar']) for r in rows]
+
+
+@pytest.mark.parametrize('caso', sorted(BLOQUES))
+def test_mismos_items_que_el_parser_anterior(caso):
+    lineas, esperado = BLOQUES[caso]
+    rows = extraer_items('a.pdf', '\n'.join(lineas))
+    assert items_anteriores(rows) == esperado
+    assert {r['filename'] for r in rows} == {'a.pdf'}
+
+
+def test_factura_sintetica():
+    rows = extraer_items('f.pdf', texto_factura(0, random.Random(7)))
+    assert items_anteriores(rows) == [
+        ('0031', 'CONSUMO DE GAS NATURAL', '31408'),
+        ('0455', 'REVISION PERIODICA', '267042'),
+        ('0884', 'CREDITO MOTO', '113563'),
+        ('0120', 'CARGO FIJO', '20658'),
+        ('0196', 'SUBSIDIO AL CONSUMO', '46061'),
+        ('0793', 'SEGURO DE VIDA', '228355'),
+    ]
@@ -0,0 +1,47 @@
+"""Índice de offsets de `resultado.txt` (`indice_resultado`)."""
+
+import os
+import csv
+
+from analisis_general import parse_resultado_y_guardar_csv, parse_factura_general
+from analisis_especifico import parse_resultado_y_guardar_especifico, parse_factura_especifica
+from benchmark_etl import escribir_resultado_sintetico, nombre_archivo
+from indice_resultado import leer_bloque, listar_facturas, ruta_indice
+
+N_FACTURAS = 20
+
+
+def leer(ruta):
+    with open(ruta, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_una_factura_igual_que_el_archivo_completo(tmp_path):
+    escribir_resultado_sintetico(str(tmp_path), N_FACTURAS)
+    generales = leer(parse_resultado_y_guardar_csv(str(tmp_path)))
+    especificos = leer(parse_resultado_y_guardar_especifico(str(tmp_path)))
+
+    nombre = nombre_archivo(7)
+    assert parse_factura_general(str(tmp_path), nombre) == next(g for g in generales if g['filename'] == nombre)
+    assert parse_factura_especifica(str(tmp_path), nombre) == [e for e in especificos if e['filename'] == nombre]
+    assert parse_factura_general(str(tmp_path), 'no_existe.pdf') is None
+    assert listar_facturas(str(tmp_path)) == [nombre_archivo(i) for i in range(N_FACTURAS)]
+
+
+def test_indice_desactualizado_se_reconstruye(tmp_path):
+    ruta = escribir_resultado_sintetico(str(tmp_path), 3)
+    assert 'Kit34' in leer_bloque(str(tmp_path), nombre_archivo(1))
+    st = os.stat(ruta)
+
+    # Mismo tamaño y mtime, contenido distinto: lo detecta el CRC del bloque
+    with open(ruta, 'r+b') as f:
+        datos = f.read().replace(b'Kit34', b'Kit99')
+        f.seek(0)
+        f.write(datos)
+    os.utime(ruta, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert 'Kit99' in leer_bloque(str(tmp_path), nombre_archivo(1))
+
+    # Texto regenerado con otras facturas
+    escribir_resultado_sintetico(str(tmp_path), 2)
+    assert leer_bloque(str(tmp_path), nombre_archivo(2)) is None
+    assert os.path.isfile(ruta_indice(ruta))
@@ -0,0 +1,75 @@
+"""Manifiesto de PDFs procesados (`manifiesto`): el hash solo se calcula si cambia la firma."""
+
+import os
+
+import pytest
+
+import manifiesto
+from manifiesto import abrir_manifiesto, pendientes, registrar, resumen
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_manifiesto(str(tmp_path))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """Archivos cuyo hash se calculó."""
+    calculados = []
+    original = manifiesto.hash_archivo
+
+    def contar(ruta):
+        calculados.append(os.path.basename(ruta))
+        return original(ruta)
+
+    monkeypatch.setattr(manifiesto, 'hash_archivo', contar)
+    return calculados
+
+
+def pdf(tmp_path, nombre, contenido):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(contenido)
+    os.utime(ruta, ns=(1_000_000_000, 1_000_000_000))
+    return ruta
+
+
+def test_firma_sin_cambios_no_calcula_el_hash(tmp_path, conn, hashes):
+    pdf(tmp_path, 'a.pdf', b'%PDF a')
+    registrar(conn, str(tmp_path), ['a.pdf'], 'ok', 'ok')
+    hashes.clear()
+
+    assert pendientes(conn, str(tmp_path), ['a.pdf', 'nuevo.pdf', 'borrado.pdf'],
+                      {'nuevo.pdf': (1, 1)}) == ['nuevo.pdf']
+    assert hashes == []
+    assert resumen(conn) == {('ok', 'ok'): 1}
+
+
+def test_solo_cambio_el_mtime(tmp_path, conn, hashes):
+    ruta = pdf(tmp_path, 'a.pdf', b'%PDF a')
+    registrar(conn, str(tmp_path), ['a.pdf'], 'ok', 'ok')
+    os.utime(ruta, ns=(2_000_000_000, 2_000_000_000))
+    hashes.clear()
+
+    # Mismo contenido: no se reprocesa y el manifiesto guarda el mtime nuevo
+    assert pendientes(conn, str(tmp_path), ['a.pdf']) == []
+    assert hashes == ['a.pdf']
+    assert pendientes(conn, str(tmp_path), ['a.pdf']) == []
+    assert hashes == ['a.pdf']
+
+
+def test_contenido_distinto_se_reprocesa(tmp_path, conn, hashes):
+    pdf(tmp_path, 'mismo_tamano.pdf', b'%PDF a')
+    pdf(tmp_path, 'otro_tamano.pdf', b'%PDF a')
+    registrar(conn, str(tmp_path), ['mismo_tamano.pdf', 'otro_tamano.pdf'], 'ok', 'ok')
+    pdf(tmp_path, 'mismo_tamano.pdf', b'%PDF b')
+    os.utime(tmp_path / 'mismo_tamano.pdf', ns=(2, 2))
+    pdf(tmp_path, 'otro_tamano.pdf', b'%PDF corregido')
+    hashes.clear()
+
+    assert pendientes(conn, str(tmp_path), ['mismo_tamano.pdf', 'otro_tamano.pdf']) == [
+        'mismo_tamano.pdf', 'otro_tamano.pdf']
+    # Con otro tamaño no hace falta el hash
+    assert hashes == ['mismo_tamano.pdf']
@@ -0,0 +1,93 @@
+"""Métricas del ETL (`metricas`): contadores, histogramas, formato Prometheus y resumen de la corrida."""
+
+import json
+
+import pytest
+
+import metricas
+from metricas import cronometro, formato_prometheus, incrementar, observar, resumen
+
+
+@pytest.fixture(autouse=True)
+def limpias():
+    metricas.reiniciar()
+    yield
+    metricas.reiniciar()
+
+
+def test_metrica_no_declarada():
+    with pytest.raises(KeyError, match='etl_inventada'):
+        incrementar('etl_inventada')
+
+
+def test_cronometro_cuenta_los_errores_de_la_etapa():
+    with cronometro('carga'):
+        pass
+    with pytest.raises(ValueError):
+        with cronometro('carga'):
+            raise ValueError('falla')
+
+    datos = resumen()
+    assert datos['etapas']['carga']['ejecuciones'] == 2
+    assert datos['contadores'] == {'etl_errores_total': {'etapa=carga': 1}}
+
+
+def test_formato_prometheus():
+    incrementar('etl_filas_insertadas_total', 3, tabla='facturas')
+    incrementar('etl_filas_insertadas_total', 2, tabla='facturas')
+    incrementar('web_solicitudes_total', endpoint='/api/"x"', estado=200)
+    observar('etl_pdf_extraccion_segundos', 0.02)
+    observar('etl_pdf_extraccion_segundos', 7.0)
+
+    lineas = formato_prometheus().splitlines()
+    assert '# TYPE etl_filas_insertadas_total counter' in lineas
+    assert 'etl_filas_insertadas_total{tabla="facturas"} 5' in lineas
+    assert 'web_solicitudes_total{endpoint="/api/\\"x\\"",estado="200"} 1' in lineas
+    # Los buckets son acumulados
+    assert '# TYPE etl_pdf_extraccion_segundos histogram' in lineas
+    assert 'etl_pdf_extraccion_segundos_bucket{le="0.01"} 0' in lineas
+    assert 'etl_pdf_extraccion_segundos_bucket{le="0.025"} 1' in lineas
+    assert 'etl_pdf_extraccion_segundos_bucket{le="10"} 2' in lineas
+    assert 'etl_pdf_extraccion_segundos_bucket{le="+Inf"} 2' in lineas
+    assert 'etl_pdf_extraccion_segundos_sum 7.02' in lineas
+    assert 'etl_pdf_extraccion_segundos_count 2' in lineas
+    # Las métricas sin series no aparecen
+    assert 'etl_errores_total' not in formato_prometheus()
+
+
+def test_resumen_json_de_la_corrida(tmp_path):
+    import main
+
+    observar('etl_etapa_segundos', 0.5, etapa='extraccion')
+    observar('etl_etapa_segundos', 0.25, etapa='extraccion')
+    observar('etl_pdf_extraccion_segundos', 0.1)
+    observar('etl_pdf_extraccion_segundos', 0.3)
+    incrementar('etl_pdfs_total', 2, resultado='ok')
+    incrementar('etl_filas_saltadas_total', tabla='detalles', motivo='sin_factura')
+
+    ruta = tmp_path / 'resumen.json'
+    main.escribir_resumen(str(ruta))
+    datos = json.loads(ruta.read_text(encoding='utf-8'))
+    assert datos['etapas'] == {'extraccion': {'segundos': 0.75, 'ejecuciones': 2}}
+    assert datos['contadores'] == {
+        'etl_pdfs_total': {'resultado=ok': 2},
+        'etl_filas_saltadas_total': {'motivo=sin_factura,tabla=detalles': 1},
+    }
+    assert datos['histogramas'] == {'etl_pdf_extraccion_segundos': {
+        '': {'cuenta': 2, 'suma_seg': 0.4, 'promedio_seg': 0.2, 'max_seg': 0.3}}}
+    assert not (tmp_path / 'resumen.json.tmp').exists()
+
+
+def test_extraccion_cuenta_los_pdfs(tmp_path):
+    pytest.importorskip('pypdf')
+    from analisis_general import leer_pdfs_y_guardar_txt
+    from benchmark_etl import escribir_pdfs_sinteticos
+
+    escribir_pdfs_sinteticos(str(tmp_path), 3)
+    leer_pdfs_y_guardar_txt(str(tmp_path))
+    leer_pdfs_y_guardar_txt(str(tmp_path))
+
+    datos = resumen()
+    assert datos['contadores']['etl_pdfs_total'] == {'resultado=cache': 3, 'resultado=ok': 3}
+    assert datos['etapas']['extraccion']['ejecuciones'] == 2
+    assert datos['histogramas']['etl_pdf_extraccion_segundos']['']['cuenta'] == 3
@@ -0,0 +1,102 @@
+"""Migración 5: clave (contrato, período) sobre una base creada antes de existir."""
+
+import sqlite3
+
+import pytest
+
+import migraciones
+from conexion_sqlite import conectar_sqlite
+from corregir_cargar import create_tables, init_tables, get_all_claves, cargar_generales_por_lotes
+
+LEGADAS = [
+    # filename tal como lo guardaba la versión anterior (normalizado o completo)
+    ('NOV2024', 'ANA DIAZ', '2024-11-20', 1000, 0, 462291, 30),
+    ('DIC2024', 'ANA DIAZ', '2024-12-19', 1000, 0, 447502, 28),
+    ('2112804537_1025335_ENE2025.pdf', 'ANA DIAZ', '2025-01-21', 1000, 0, 439876, 25),
+]
+
+
+@pytest.fixture
+def bd_version_4(tmp_path, monkeypatch):
+    """Base SQLite en la versión 4 del esquema con facturas cargadas por la versión anterior."""
+    conn = conectar_sqlite(str(tmp_path / 'legada.sqlite3'))
+    with monkeypatch.context() as m:
+        m.setattr(migraciones, 'MIGRACIONES', [v for v in migraciones.MIGRACIONES if v[0] <= 4])
+        init_tables(conn)
+    cursor = conn.cursor()
+    cursor.executemany("""INSERT INTO Facturas (filename, nombre, fecha, gas, credito, total, consumo_m3)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)""", LEGADAS)
+    conn.commit()
+    cursor.close()
+    yield conn
+    conn.close()
+
+
+def claves(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename, contrato, periodo FROM Facturas ORDER BY id")
+    filas = cursor.fetchall()
+    cursor.close()
+    return filas
+
+
+def test_backfill_de_la_clave(bd_version_4):
+    assert migraciones.version_actual(bd_version_4) == 4
+    init_tables(bd_version_4)
+    assert migraciones.version_actual(bd_version_4) == migraciones.MIGRACIONES[-1][0]
+
+    assert claves(bd_version_4) == [
+        ('NOV2024', '', '2024-11'),
+        ('DIC2024', '', '2024-12'),
+        ('2112804537_1025335_ENE2025.pdf', '1025335', '2025-01'),
+    ]
+    cursor = bd_version_4.cursor()
+    assert not migraciones._indice_existe(cursor, 'Facturas', 'ux_facturas_filename')
+    assert migraciones._indice_existe(cursor, 'Facturas', 'ux_facturas_contrato_periodo')
+    cursor.close()
+
+
+def test_indice_unico_por_contrato_y_periodo(bd_version_4):
+    init_tables(bd_version_4)
+    cursor = bd_version_4.cursor()
+    # Mismo mes de otro contrato: ya no colisiona con 'NOV2024'
+    cursor.execute("INSERT INTO Facturas (filename, contrato, periodo) VALUES ('x_999_NOV2024.pdf', '999', '2024-11')")
+    with pytest.raises(sqlite3.IntegrityError):
+        cursor.execute("INSERT INTO Facturas (filename, contrato, periodo) VALUES ('otra.pdf', '1025335', '2025-01')")
+    bd_version_4.rollback()
+    cursor.close()
+
+
+def test_migracion_reejecutable(bd_version_4):
+    init_tables(bd_version_4)
+    cursor = bd_version_4.cursor()
+    migraciones._m005_clave_contrato_periodo(cursor)
+    bd_version_4.commit()
+    cursor.close()
+    assert len(claves(bd_version_4)) == len(LEGADAS)
+
+
+def test_carga_adopta_las_facturas_legadas(bd_version_4):
+    init_tables(bd_version_4)
+    fila = {'filename': '2110376038_1025335_NOV2024.pdf', 'Nombre': 'ANA DIAZ', 'Fecha': '20/11/2024',
+            'Gas': '1000', 'credito': '0', 'Total': '462291', 'Consumo_m3': '30',
+            'Contrato': '1025335', 'Periodo': '2024-11', 'NumeroFactura': '2110376038'}
+    nueva = dict(fila, filename='2115148239_1025335_MAR2025.pdf', Fecha='20/03/2025', Periodo='2025-03',
+                 NumeroFactura='2115148239')
+
+    insertadas = cargar_generales_por_lotes(bd_version_4, [fila, nueva], batch_size=10)
+
+    assert list(insertadas) == [('1025335', '2025-03')]
+    assert ('1025335', '2024-11') in get_all_claves(bd_version_4)
+    assert ('', '2024-11') not in get_all_claves(bd_version_4)
+    assert len(claves(bd_version_4)) == len(LEGADAS) + 1
+
+
+def test_base_nueva_crea_el_esquema_completo(tmp_path):
+    conn = conectar_sqlite(str(tmp_path / 'nueva.sqlite3'))
+    try:
+        create_tables(conn)
+        assert migraciones.aplicar_migraciones(conn) == migraciones.MIGRACIONES[-1][0]
+        assert migraciones.aplicar_migraciones(conn) == migraciones.MIGRACIONES[-1][0]
+    finally:
+        conn.close()
@@ -0,0 +1,109 @@
+"""Pipeline solapado (`pipeline_async`) contra el modo clásico: mismos CSVs y misma BD."""
+
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('pypdf')
+
+import main
+import pipeline_async
+from benchmark_etl import escribir_pdfs_sinteticos, nombre_archivo
+from conexion_sqlite import conectar_sqlite
+from corregir_cargar import init_tables, leer_csv, cargar_generales_por_lotes, cargar_especificos_por_lotes
+from procesamiento_streaming import procesar_streaming
+from manifiesto import abrir_manifiesto, resumen
+
+N_PDFS = 6
+
+
+@pytest.fixture
+def carpeta(tmp_path):
+    """PDFs sintéticos con dos claves repetidas: el preferido (nombre más
+    largo) llega antes que el otro en una y después en la otra."""
+    carpeta = tmp_path / 'Facturas'
+    carpeta.mkdir()
+    escribir_pdfs_sinteticos(str(carpeta), N_PDFS)
+    numero, clave = nombre_archivo(0).split('_', 1)
+    shutil.copy(carpeta / nombre_archivo(3), carpeta / f"3{numero}_{clave}")
+    numero, clave = nombre_archivo(1).split('_', 1)
+    shutil.copy(carpeta / nombre_archivo(4), carpeta / f"{numero}0_{clave}")
+    return carpeta
+
+
+def contenido_bd(conn):
+    cursor = conn.cursor()
+    cursor.execute("""SELECT filename, nombre, fecha, gas, credito, total, consumo_m3, contrato, periodo,
+        numero_factura FROM Facturas ORDER BY contrato, periodo""")
+    facturas = cursor.fetchall()
+    cursor.execute("""SELECT f.contrato, f.periodo, d.concepto, d.valor_pagar FROM Detalles d
+        JOIN Facturas f ON f.id = d.factura_id ORDER BY 1, 2, 3, 4""")
+    detalles = cursor.fetchall()
+    cursor.close()
+    return facturas, detalles
+
+
+def leer(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return f.read()
+
+
+def clasico(carpeta, ruta_bd):
+    csv_g, csv_e = procesar_streaming(str(carpeta), usar_cache=False)
+    conn = conectar_sqlite(ruta_bd)
+    try:
+        init_tables(conn)
+        cargar_generales_por_lotes(conn, leer_csv(csv_g))
+        cargar_especificos_por_lotes(conn, leer_csv(csv_e))
+        return leer(csv_g), leer(csv_e), contenido_bd(conn)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('tamano_tanda', [1, 2, 500])
+def test_pipeline_equivale_al_modo_clasico(carpeta, tmp_path, bd_sqlite, tamano_tanda):
+    copia = tmp_path / 'copia'
+    shutil.copytree(carpeta, copia)
+    esperado = clasico(copia, str(tmp_path / 'clasico.sqlite3'))
+
+    totales = pipeline_async.ejecutar_pipeline(str(carpeta), workers=1, batch_size=500,
+                                               tamano_tanda=tamano_tanda, usar_cache=False)
+
+    assert totales['error'] is None
+    conn = conectar_sqlite(bd_sqlite)
+    try:
+        obtenido = (leer(carpeta / 'datos_generales.csv'), leer(carpeta / 'datos_especificos.csv'),
+                    contenido_bd(conn))
+    finally:
+        conn.close()
+    assert obtenido == esperado
+    facturas = esperado[2][0]
+    assert len(facturas) == N_PDFS
+    assert {f[0] for f in facturas} >= {f"3{nombre_archivo(0)}", nombre_archivo(1).replace('_', '0_', 1)}
+
+
+def test_carga_fallida_queda_registrada_como_error(carpeta, bd_sqlite, monkeypatch):
+    llamadas = []
+    original = pipeline_async.insertar_detalles_nuevos
+
+    def falla_en_la_segunda(*args, **kwargs):
+        llamadas.append(1)
+        if len(llamadas) == 2:
+            raise RuntimeError('conexión perdida')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline_async, 'insertar_detalles_nuevos', falla_en_la_segunda)
+    monkeypatch.setattr(main, 'CARPETA_FACTURAS', str(carpeta))
+    archivos = sorted(os.listdir(carpeta))
+
+    main.procesar_y_actualizar(archivos, pipeline=True, batch_size=2, workers=1)
+
+    # Las tandas restantes no se cargan, pero los CSVs quedan completos
+    assert len(llamadas) == 2
+    assert len(leer_csv(carpeta / 'datos_generales.csv')) == N_PDFS
+    manifiesto = abrir_manifiesto(str(carpeta))
+    try:
+        assert resumen(manifiesto) == {('ok', 'error'): len(archivos)}
+    finally:
+        manifiesto.close()
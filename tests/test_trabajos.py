@@ -0,0 +1,58 @@
+"""Cola de trabajos en segundo plano de la aplicación web (`web_app/trabajos.py`)."""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_app'))
+
+from trabajos import ColaTrabajos
+
+
+def esperar(cola, trabajo_id, timeout=5):
+    """Espera a que el trabajo termine y retorna su estado."""
+    fin = threading.Event()
+    cola.encolar('esperar', lambda progreso: fin.set())
+    assert fin.wait(timeout)
+    return cola.estado(trabajo_id)
+
+
+def test_etapas_y_resultado_en_orden():
+    cola = ColaTrabajos()
+    liberar = threading.Event()
+    orden = []
+
+    def trabajo(nombre, progreso):
+        liberar.wait(5)
+        progreso('extrayendo')
+        orden.append(nombre)
+        return nombre.upper()
+
+    primero = cola.encolar('primero', trabajo, 'a')
+    segundo = cola.encolar('segundo', trabajo, 'b')
+    assert cola.estado(segundo)['estado'] == 'en_cola'
+    liberar.set()
+
+    assert esperar(cola, segundo)['resultado'] == 'B'
+    assert cola.estado(primero)['estado'] == 'completado' and orden == ['a', 'b']
+    assert cola.estado('no_existe') is None
+
+
+def test_error_queda_en_el_estado():
+    cola = ColaTrabajos()
+
+    def falla(progreso):
+        progreso('cargando')
+        raise RuntimeError('BD caída')
+
+    trabajo = esperar(cola, cola.encolar('falla', falla))
+    assert (trabajo['estado'], trabajo['error']) == ('error', 'BD caída')
+
+
+def test_conserva_los_ultimos_terminados():
+    cola = ColaTrabajos(max_terminados=2)
+    ids = [cola.encolar(str(i), lambda progreso: None) for i in range(4)]
+    esperar(cola, ids[-1])
+    # Terminados: los 4 y el de `esperar`; al encolar otro se conservan los 2 últimos
+    cola.encolar('otro', lambda progreso: None)
+    assert [cola.estado(i) is not None for i in ids] == [False, False, False, True]
@@ -0,0 +1,149 @@
+"""Aplicación web: endpoint de detalles por lote (`/api/detalles`) y caché de respuestas con ETag."""
+
+import io
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+
+# app.py importa sus módulos vecinos (cache_respuestas, trabajos) como en `cd web_app && python app.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_app'))
+
+from corregir_cargar import conexion_bd, init_tables, insert_factura, insert_detalles, incrementar_generacion
+
+
+@pytest.fixture
+def cliente(bd_sqlite):
+    import app as modulo
+
+    with conexion_bd() as conn:
+        init_tables(conn)
+        for contrato in ('1000', '2000'):
+            factura_id = insert_factura(conn, f'{contrato}.pdf', 'ANA DIAZ', '2024-01-15', 1000, 0, 5000, 10,
+                                        contrato=contrato, periodo='2024-01')
+            insert_detalles(conn, factura_id, 'CONSUMO DE GAS NATURAL', 5000)
+    modulo.cache.limpiar()
+    return modulo.app.test_client()
+
+
+@pytest.fixture
+def cache(cliente, monkeypatch):
+    import app as modulo
+
+    # Releer la generación en cada solicitud
+    monkeypatch.setattr(modulo.cache, 'intervalo_generacion', 0)
+    return modulo.cache
+
+
+@pytest.mark.parametrize('ids', ['', ' ', ',', '1,,2', 'a', '1;2', '-1', '1.5'])
+def test_ids_vacio_o_invalido_es_400(cliente, ids):
+    r = cliente.get('/api/detalles', query_string={'ids': ids})
+    assert r.status_code == 400
+    assert r.get_json()['success'] is False
+
+
+def test_ids_validos(cliente):
+    r = cliente.get('/api/detalles?ids=1, 2,99')
+    assert r.status_code == 200
+    detalles = r.get_json()['detalles']
+    assert [d['concepto'] for d in detalles['1']] == ['CONSUMO DE GAS NATURAL']
+    assert len(detalles['2']) == 1 and detalles['99'] == []
+    assert 'siguiente_cursor' not in r.get_json()
+
+
+def test_sin_ids_usa_la_pagina(cliente):
+    r = cliente.get('/api/detalles?limit=1')
+    assert r.status_code == 200
+    assert len(r.get_json()['detalles']) == 1
+    assert r.get_json()['siguiente_cursor']
+
+
+def test_etag_y_no_modificado(cliente, cache):
+    r = cliente.get('/api/detalles?ids=1')
+    etag = r.headers['ETag']
+    assert r.status_code == 200 and r.headers['Cache-Control'] == 'no-cache'
+
+    r = cliente.get('/api/detalles?ids=1', headers={'If-None-Match': etag})
+    assert r.status_code == 304 and r.data == b'' and r.headers['ETag'] == etag
+    # Otra consulta es otra entrada de la caché
+    assert cliente.get('/api/detalles?ids=2').headers['ETag'] != etag
+
+
+def test_carga_del_etl_invalida_la_cache(cliente, cache):
+    etag = cliente.get('/api/detalles?ids=1').headers['ETag']
+    with conexion_bd() as conn:
+        insert_detalles(conn, 1, 'SEGURO FNB', 700)
+
+    # Sin una carga registrada la respuesta sale de la caché
+    r = cliente.get('/api/detalles?ids=1', headers={'If-None-Match': etag})
+    assert r.status_code == 304
+
+    with conexion_bd() as conn:
+        incrementar_generacion(conn)
+    r = cliente.get('/api/detalles?ids=1', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+    assert len(r.get_json()['detalles']['1']) == 2
+
+
+def test_cache_vence_y_descarta_la_menos_usada():
+    from cache_respuestas import CacheRespuestas
+
+    cache = CacheRespuestas(lambda: 1, tamano=2, ttl=60)
+    for clave in ('a', 'b'):
+        cache.guardar(clave, clave.encode())
+    cache.obtener('a')
+    cache.guardar('c', b'c')
+    assert cache.obtener('b') is None and cache.obtener('a')[0] == b'a'
+
+    cache.ttl = -1
+    cache.guardar('d', b'd')
+    assert cache.obtener('d') is None
+
+
+def test_subida_se_ingiere_en_segundo_plano(cliente, tmp_path, monkeypatch):
+    import app as modulo
+
+    ingeridos = []
+
+    def ingerir(filenames, carpeta, progreso):
+        progreso('extrayendo')
+        ingeridos.append((filenames, os.path.isfile(os.path.join(carpeta, filenames[0]))))
+        return {'facturas': 1}
+
+    monkeypatch.setattr(modulo, 'FACTURAS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(modulo, 'ingerir_archivos', ingerir)
+
+    def subir():
+        return cliente.post('/api/upload', data={'file': (io.BytesIO(b'%PDF-1.4'), 'nueva factura.pdf')})
+
+    r = subir()
+    assert r.status_code == 202
+    job_id = r.get_json()['job_id']
+    for _ in range(100):
+        trabajo = cliente.get(f'/api/jobs/{job_id}').get_json()['job']
+        if trabajo['estado'] == 'completado':
+            break
+        time.sleep(0.02)
+    assert trabajo['resultado'] == {'facturas': 1}
+    assert ingeridos == [(['nueva_factura.pdf'], True)]
+
+    assert subir().status_code == 400
+    assert cliente.get('/api/jobs/no_existe').status_code == 404
+
+
+def test_metrics_cuenta_las_solicitudes(cliente):
+    import metricas
+
+    metricas.reiniciar()
+    cliente.get('/api/detalles?ids=1')
+    cliente.get('/api/detalles?ids=a')
+    r = cliente.get('/metrics')
+    assert r.status_code == 200
+    assert r.mimetype == 'text/plain'
+    texto = r.get_data(as_text=True)
+    assert 'web_solicitudes_total{endpoint="/api/detalles",estado="200"} 1' in texto
+    assert 'web_solicitudes_total{endpoint="/api/detalles",estado="400"} 1' in texto
+    assert 'web_solicitud_segundos_count{endpoint="/api/detalles"} 2' in texto
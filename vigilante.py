@@ -0,0 +1,238 @@
+"""Vigilancia de la carpeta `Facturas` por eventos (inotify) con polling de respaldo.
+
+`vigilar_carpeta` es un generador que entrega lotes de nombres de PDF listos
+para procesar:
+
+- Con inotify (Linux) el proceso duerme hasta que el kernel avisa que un
+  archivo se terminó de escribir (`IN_CLOSE_WRITE`) o se movió a la carpeta
+  (`IN_MOVED_TO`), así que no hay escaneos periódicos ni espera de `intervalo`.
+  Los eventos que llegan con menos de `espera` segundos de diferencia se
+  agrupan en un único lote (p.ej. al copiar varias facturas juntas).
+- Sin inotify (otros sistemas o si falla la inicialización) se lista la
+  carpeta cada `intervalo` segundos; un PDF se entrega recién cuando su tamaño
+  y `mtime` no cambian entre dos revisiones separadas por `espera` segundos.
+
+El primer lote siempre contiene los PDFs que ya estaban en la carpeta, para
+que quien consume el generador decida cuáles faltan por procesar.
+
+Se vigilan también las subcarpetas (p.ej. `Facturas/<año>/<mes>/`) y los PDFs
+se entregan con su ruta relativa (ver `escaneo`). Con inotify cada carpeta
+tiene su propio watch y las carpetas nuevas se agregan al crearse; con
+polling solo se vuelven a listar las carpetas cuyo `mtime` cambió.
+
+Se usa inotify mediante ctypes para no agregar dependencias.
+"""
+
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+
+from escaneo import es_pdf, escanear_pdfs, ESCANEOS_POR_REVISION_COMPLETA
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_EVENTO = struct.Struct('iIII')   # wd, mask, cookie, len
+
+
+def _libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+def inotify_disponible() -> bool:
+    return _libc() is not None
+
+
+def _abrir_inotify() -> int:
+    """Crea la instancia de inotify. Retorna el descriptor."""
+    libc = _libc()
+    if libc is None:
+        raise OSError(errno.ENOSYS, "inotify no disponible en este sistema")
+    fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    if fd < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+    return fd
+
+
+def _agregar_watch(fd: int, ruta: str) -> int:
+    """Vigila `ruta` (archivos terminados de escribir o movidos y subcarpetas nuevas)."""
+    wd = _libc().inotify_add_watch(fd, os.fsencode(ruta), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+    if wd < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+    return wd
+
+
+def _vigilar_arbol(fd: int, carpeta: str, carpetas: dict, watches: dict) -> list:
+    """Agrega un watch a cada carpeta de `carpetas` que aún no tenga uno.
+
+    `watches` es `{wd: ruta_relativa}`. Retorna las carpetas agregadas.
+    """
+    vigiladas = set(watches.values())
+    agregadas = []
+    for rel in sorted(carpetas):
+        if rel in vigiladas:
+            continue
+        try:
+            wd = _agregar_watch(fd, os.path.join(carpeta, rel) if rel else carpeta)
+        except FileNotFoundError:
+            continue
+        watches[wd] = rel
+        agregadas.append(rel)
+    return agregadas
+
+
+def _leer_eventos(fd: int, watches: dict) -> tuple:
+    """Lee los eventos pendientes.
+
+    Retorna `(nombres, desbordado, carpetas_nuevas)` con rutas relativas a la
+    carpeta vigilada.
+    """
+    nombres = []
+    carpetas_nuevas = False
+    desbordado = False
+    while True:
+        try:
+            datos = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            break
+        pos = 0
+        while pos + _EVENTO.size <= len(datos):
+            wd, mask, _, longitud = _EVENTO.unpack_from(datos, pos)
+            pos += _EVENTO.size
+            nombre = datos[pos:pos + longitud].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            pos += longitud
+            if mask & IN_Q_OVERFLOW:
+                desbordado = True
+            elif mask & IN_IGNORED:
+                rel = watches.pop(wd, None)
+                if rel == '':
+                    # La carpeta raíz se eliminó o se desmontó
+                    raise OSError(errno.ENOENT, "La carpeta vigilada ya no existe")
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not nombre.startswith('.'):
+                    carpetas_nuevas = True
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and es_pdf(nombre) and wd in watches:
+                rel = watches[wd]
+                nombres.append(f"{rel}/{nombre}" if rel else nombre)
+    return nombres, desbordado, carpetas_nuevas
+
+
+def vigilar_inotify(carpeta: str, espera: float = 1.0):
+    """Generador de lotes de PDFs usando inotify (ver docstring del módulo)."""
+    fd = _abrir_inotify()
+    try:
+        watches = {}
+        carpetas = {}
+        # La raíz primero: si no se puede vigilar, se usa polling
+        watches[_agregar_watch(fd, carpeta)] = ''
+        firmas, _ = escanear_pdfs(carpeta, carpetas)
+        _vigilar_arbol(fd, carpeta, carpetas, watches)
+        yield sorted(firmas)
+        while True:
+            select.select([fd], [], [])
+            lote = set()
+            desbordado = carpetas_nuevas = False
+            # Agrupar la ráfaga: seguir leyendo mientras lleguen eventos
+            while True:
+                nombres, overflow, nuevas = _leer_eventos(fd, watches)
+                lote.update(nombres)
+                desbordado = desbordado or overflow
+                carpetas_nuevas = carpetas_nuevas or nuevas
+                listos, _, _ = select.select([fd], [], [], espera)
+                if not listos:
+                    break
+            if desbordado or carpetas_nuevas:
+                # Carpetas nuevas (sus PDFs pudieron llegar antes del watch) o
+                # eventos perdidos: volver a escanear, solo los shards que cambiaron
+                firmas, rescaneadas = escanear_pdfs(carpeta, carpetas)
+                _vigilar_arbol(fd, carpeta, carpetas, watches)
+                if desbordado:
+                    lote.update(firmas)
+                else:
+                    lote.update(n for n in firmas if n.rpartition('/')[0] in rescaneadas)
+            lote = {n for n in lote if os.path.isfile(os.path.join(carpeta, n))}
+            if lote:
+                yield sorted(lote)
+    finally:
+        os.close(fd)
+
+
+def _firma(ruta: str):
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def vigilar_polling(carpeta: str, intervalo: float = 30, espera: float = 1.0):
+    """Generador de lotes de PDFs listando la carpeta cada `intervalo` segundos.
+
+    Un archivo se entrega una sola vez por firma (tamaño, mtime): si se
+    reemplaza por otro con distinta firma se vuelve a entregar. Las firmas
+    salen del escaneo por shards, así que en cada revisión solo se listan
+    las carpetas que cambiaron; los PDFs recientes (pendientes o recién
+    entregados) se siguen verificando con `stat`, así que uno que se siguió
+    escribiendo después de entregarse se vuelve a entregar. Cada
+    `ESCANEOS_POR_REVISION_COMPLETA` revisiones se verifican todos (PDFs
+    sobrescritos en el lugar).
+    """
+    vistos = {}
+    carpetas = {}
+    primero = True
+    vueltas = 0
+    while True:
+        vueltas += 1
+        firmas, _ = escanear_pdfs(carpeta, carpetas,
+                                  completo=vueltas % ESCANEOS_POR_REVISION_COMPLETA == 0)
+        candidatos = {n: f for n, f in firmas.items() if vistos.get(n) != f}
+
+        if candidatos and not primero:
+            # Debounce: solo los archivos cuyo tamaño y mtime no cambiaron
+            time.sleep(espera)
+            # Los que se siguen escribiendo quedan para la próxima revisión
+            candidatos = {n: f for n, f in candidatos.items()
+                          if _firma(os.path.join(carpeta, n)) == f}
+
+        vistos.update(candidatos)
+        if primero:
+            primero = False
+            yield sorted(candidatos)
+        elif candidatos:
+            yield sorted(candidatos)
+        time.sleep(intervalo)
+
+
+def vigilar_carpeta(carpeta: str, intervalo: float = 30, espera: float = 1.0, forzar_polling: bool = False):
+    """Lotes de PDFs nuevos o terminados de escribir en `carpeta`.
+
+    Usa inotify si está disponible y, si no (o con `forzar_polling`), el
+    polling cada `intervalo` segundos.
+    """
+    if not forzar_polling:
+        try:
+            yield from vigilar_inotify(carpeta, espera=espera)
+            return
+        except OSError as e:
+            print(f"[{time.ctime()}] inotify no disponible ({e}), usando polling cada {intervalo}s")
+    yield from vigilar_polling(carpeta, intervalo=intervalo, espera=espera)
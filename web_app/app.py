@@ -3,80 +3,326 @@ Aplicación Web para Gestión de Facturas
 Servidor Flask simple con Bootstrap
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
 import os
 import sys
+import time
+import datetime
+import functools
+from decimal import Decimal, InvalidOperation
 from werkzeug.utils import secure_filename
 
 # Agregar el directorio padre al path para importar módulos del proyecto
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from conexion import create_connection
+from conexion import conexion_bd, get_generacion
+from ingesta import ingerir_archivos
+from metricas import incrementar, observar, formato_prometheus, configurar_logging
+from cache_respuestas import CacheRespuestas
+from trabajos import ColaTrabajos
 
 app = Flask(__name__)
+configurar_logging()
 
 # Configuración
 FACTURAS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Facturas')
 ALLOWED_EXTENSIONS = {'pdf'}
+LIMITE_POR_DEFECTO = 50   # facturas por página en /api/facturas
+LIMITE_MAXIMO = 500
+
+
+def leer_generacion():
+    """Generación de los datos en la BD (la incrementa el ETL en cada carga)."""
+    with conexion_bd() as conn:
+        return get_generacion(conn)
+
+
+# Caché de respuestas de la API, invalidada por la generación de los datos
+cache = CacheRespuestas(
+    leer_generacion,
+    tamano=int(os.getenv('WEB_CACHE_SIZE', '256')),
+    ttl=int(os.getenv('WEB_CACHE_TTL', '300')),
+    intervalo_generacion=float(os.getenv('WEB_CACHE_GENERACION_SEG', '2')),
+)
+
+# Trabajos de ingesta de las facturas subidas (un worker: se procesan de a una)
+cola = ColaTrabajos(workers=int(os.getenv('WEB_JOB_WORKERS', '1')))
 
 def allowed_file(filename):
     """Verificar si el archivo tiene extensión PDF"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.before_request
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+
+
+@app.after_request
+def registrar_solicitud(respuesta):
+    """Cuenta cada solicitud y su duración por endpoint (la ruta sin parámetros)."""
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'otro'
+    incrementar('web_solicitudes_total', endpoint=endpoint, estado=respuesta.status_code)
+    inicio = getattr(g, 'inicio_solicitud', None)
+    if inicio is not None:
+        observar('web_solicitud_segundos', time.perf_counter() - inicio, endpoint=endpoint)
+    return respuesta
+
+
+def respuesta_cacheada(vista):
+    """Sirve la respuesta JSON de `vista` desde la caché y responde 304 si el
+    navegador ya tiene la misma versión (`If-None-Match`).
+    
+    Solo se cachean respuestas 200; la clave es la generación de los datos
+    más la ruta con su query string.
+    """
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        try:
+            clave = (cache.generacion(), request.full_path)
+        except Exception:
+            # Sin acceso a la generación no se puede validar la caché
+            return vista(*args, **kwargs)
+        entrada = cache.obtener(clave)
+        if entrada is None:
+            incrementar('web_cache_total', resultado='miss')
+            respuesta = app.make_response(vista(*args, **kwargs))
+            if respuesta.status_code != 200:
+                return respuesta
+            cuerpo = respuesta.get_data()
+            entrada = (cuerpo, cache.guardar(clave, cuerpo))
+        else:
+            incrementar('web_cache_total', resultado='hit')
+        
+        cuerpo, etag = entrada
+        if request.if_none_match.contains(etag):
+            incrementar('web_cache_total', resultado='no_modificado')
+            respuesta = app.response_class(status=304)
+        else:
+            respuesta = app.response_class(cuerpo, mimetype='application/json')
+        respuesta.set_etag(etag)
+        # El navegador puede guardar la respuesta pero debe revalidarla siempre
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        return respuesta
+    return envoltura
+
+
 @app.route('/')
 def index():
     """Página principal"""
     return render_template('index.html')
 
 
+def leer_filtros_facturas(args):
+    """Valida los parámetros de `/api/facturas` y los convierte a sus tipos.
+    
+    Lanza ValueError con un mensaje para el cliente si alguno es inválido.
+    """
+    try:
+        limite = int(args.get('limit', LIMITE_POR_DEFECTO))
+    except ValueError:
+        raise ValueError("'limit' debe ser un entero")
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise ValueError(f"'limit' debe estar entre 1 y {LIMITE_MAXIMO}")
+    
+    orden = args.get('orden', 'desc').lower()
+    if orden not in ('asc', 'desc'):
+        raise ValueError("'orden' debe ser 'asc' o 'desc'")
+    
+    filtros = {'limite': limite, 'orden': orden}
+    for campo in ('desde', 'hasta'):
+        if args.get(campo):
+            try:
+                filtros[campo] = datetime.date.fromisoformat(args[campo])
+            except ValueError:
+                raise ValueError(f"'{campo}' debe tener formato AAAA-MM-DD")
+    for campo in ('total_min', 'total_max'):
+        if args.get(campo):
+            try:
+                filtros[campo] = Decimal(args[campo])
+            except InvalidOperation:
+                raise ValueError(f"'{campo}' debe ser numérico")
+    if args.get('nombre', '').strip():
+        filtros['nombre'] = args['nombre'].strip()
+    if args.get('cursor'):
+        filtros['cursor'] = decodificar_cursor(args['cursor'])
+    return filtros
+
+
+def codificar_cursor(factura):
+    """Cursor opaco de la última fila de una página: `AAAA-MM-DD_id`."""
+    return f"{factura['fecha']}_{factura['id']}"
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, factura_id = cursor.split('_', 1)
+        return datetime.date.fromisoformat(fecha), int(factura_id)
+    except ValueError:
+        raise ValueError("'cursor' inválido")
+
+
+def consulta_facturas(filtros):
+    """Arma el SELECT paginado por keyset sobre `(fecha, id)` con los filtros en SQL.
+    
+    Se pide una fila de más para saber si existe una página siguiente.
+    Retorna `(sql, parametros)`.
+    """
+    condiciones = []
+    parametros = []
+    if 'desde' in filtros:
+        condiciones.append("fecha >= %s")
+        parametros.append(filtros['desde'])
+    if 'hasta' in filtros:
+        condiciones.append("fecha <= %s")
+        parametros.append(filtros['hasta'])
+    if 'total_min' in filtros:
+        condiciones.append("total >= %s")
+        parametros.append(filtros['total_min'])
+    if 'total_max' in filtros:
+        condiciones.append("total <= %s")
+        parametros.append(filtros['total_max'])
+    if 'nombre' in filtros:
+        # Escape explícito con '!': MySQL y SQLite difieren en el escape por defecto
+        patron = filtros['nombre'].replace('!', '!!').replace('%', '!%').replace('_', '!_')
+        condiciones.append("nombre LIKE %s ESCAPE '!'")
+        parametros.append(f"%{patron}%")
+    
+    comparador = '<' if filtros['orden'] == 'desc' else '>'
+    if 'cursor' in filtros:
+        fecha, factura_id = filtros['cursor']
+        # Equivale a (fecha, id) < (cursor) pero usando el índice de fecha
+        condiciones.append(f"(fecha {comparador} %s OR (fecha = %s AND id {comparador} %s))")
+        parametros.extend([fecha, fecha, factura_id])
+    
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    direccion = filtros['orden'].upper()
+    sql = f"""
+        SELECT id, filename, contrato, periodo, nombre, fecha, gas, credito, total, consumo_m3 
+        FROM Facturas 
+        {where}
+        ORDER BY fecha {direccion}, id {direccion}
+        LIMIT %s
+    """
+    parametros.append(filtros['limite'] + 1)
+    return sql, parametros
+
+
+def pagina_facturas(conn, filtros):
+    """Ejecuta la consulta paginada. Retorna `(facturas, siguiente_cursor)`."""
+    sql, parametros = consulta_facturas(filtros)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute(sql, tuple(parametros))
+    facturas = cursor.fetchall()
+    cursor.close()
+    
+    hay_mas = len(facturas) > filtros['limite']
+    facturas = facturas[:filtros['limite']]
+    siguiente_cursor = codificar_cursor(facturas[-1]) if hay_mas else None
+    return facturas, siguiente_cursor
+
+
+def detalles_por_factura(conn, factura_ids):
+    """Detalles de varias facturas con una sola consulta `WHERE factura_id IN (...)`.
+    
+    Retorna `{factura_id: [detalles...]}` con una lista (posiblemente vacía)
+    por cada id pedido.
+    """
+    factura_ids = list(dict.fromkeys(factura_ids))
+    agrupados = {factura_id: [] for factura_id in factura_ids}
+    if not factura_ids:
+        return agrupados
+    
+    placeholders = ', '.join(['%s'] * len(factura_ids))
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute(f"""
+        SELECT factura_id, id, concepto, valor_pagar 
+        FROM Detalles 
+        WHERE factura_id IN ({placeholders})
+        ORDER BY factura_id, id
+    """, tuple(factura_ids))
+    for detalle in cursor.fetchall():
+        agrupados[detalle.pop('factura_id')].append(detalle)
+    cursor.close()
+    return agrupados
+
+
+def leer_ids_facturas(valor):
+    """Convierte `ids=1,2,3` en una lista de enteros (a lo sumo LIMITE_MAXIMO).
+    
+    Lanza ValueError con un mensaje para el cliente si es inválido.
+    """
+    if not valor.strip():
+        raise ValueError("'ids' no puede estar vacío")
+    partes = [parte.strip() for parte in valor.split(',')]
+    # Solo enteros positivos; sin partes vacías (`1,,2`) ni signos
+    if not all(parte.isdecimal() for parte in partes):
+        raise ValueError("'ids' debe ser una lista de enteros separados por comas")
+    ids = [int(parte) for parte in partes]
+    if len(ids) > LIMITE_MAXIMO:
+        raise ValueError(f"'ids' admite a lo sumo {LIMITE_MAXIMO} facturas")
+    return ids
+
+
 @app.route('/api/facturas', methods=['GET'])
+@respuesta_cacheada
 def get_facturas():
-    """Obtener todas las facturas de la base de datos"""
+    """Obtener una página de facturas de la base de datos.
+    
+    Parámetros (query string), todos opcionales:
+      limit              tamaño de página (1..LIMITE_MAXIMO, por defecto LIMITE_POR_DEFECTO)
+      cursor             `siguiente_cursor` de la página anterior
+      orden              'desc' (más recientes primero, por defecto) o 'asc'
+      desde, hasta       rango de fechas AAAA-MM-DD (inclusive)
+      nombre             texto contenido en el nombre del titular
+      total_min, total_max  rango del total
+      include            'detalles' para agregar a cada factura su lista de detalles
+    """
     try:
-        conn = create_connection()
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        
-        # Consultar todas las facturas
-        cursor.execute("""
-            SELECT id, filename, nombre, fecha, gas, credito, total, consumo_m3 
-            FROM Facturas 
-            ORDER BY fecha DESC
-        """)
-        
-        facturas = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        filtros = leer_filtros_facturas(request.args)
+        incluir = {parte.strip() for parte in request.args.get('include', '').split(',') if parte.strip()}
+        if not incluir <= {'detalles'}:
+            raise ValueError("'include' solo admite 'detalles'")
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        with conexion_bd() as conn:
+            facturas, siguiente_cursor = pagina_facturas(conn, filtros)
+            if 'detalles' in incluir:
+                detalles = detalles_por_factura(conn, [f['id'] for f in facturas])
+                for factura in facturas:
+                    factura['detalles'] = detalles[factura['id']]
         
         # Convertir fecha a string para JSON
         for factura in facturas:
             if factura['fecha']:
                 factura['fecha'] = factura['fecha'].strftime('%Y-%m-%d')
         
-        return jsonify({'success': True, 'facturas': facturas})
+        return jsonify({'success': True, 'facturas': facturas, 'siguiente_cursor': siguiente_cursor})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/facturas/<int:factura_id>/detalles', methods=['GET'])
+@respuesta_cacheada
 def get_detalles(factura_id):
     """Obtener detalles específicos de una factura"""
     try:
-        conn = create_connection()
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        
-        # Consultar detalles de la factura
-        cursor.execute("""
-            SELECT id, concepto, valor_pagar 
-            FROM Detalles 
-            WHERE factura_id = %s
-            ORDER BY id
-        """, (factura_id,))
-        
-        detalles = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with conexion_bd() as conn:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            
+            # Consultar detalles de la factura
+            cursor.execute("""
+                SELECT id, concepto, valor_pagar 
+                FROM Detalles 
+                WHERE factura_id = %s
+                ORDER BY id
+            """, (factura_id,))
+            
+            detalles = cursor.fetchall()
+            cursor.close()
         
         return jsonify({'success': True, 'detalles': detalles})
     
@@ -84,6 +330,43 @@ def get_detalles(factura_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/detalles', methods=['GET'])
+@respuesta_cacheada
+def get_detalles_lote():
+    """Detalles de varias facturas en una sola consulta, agrupados por factura.
+    
+    Parámetros (query string):
+      ids                ids de factura separados por comas (hasta LIMITE_MAXIMO), o bien
+      los mismos de `/api/facturas` (limit, cursor, filtros) para los detalles de esa página
+    
+    Responde `{'detalles': {factura_id: [...]}}` (lista vacía si la factura no tiene).
+    """
+    try:
+        # `ids=` vacío es un error, no un pedido de la primera página
+        if 'ids' in request.args:
+            ids, filtros = leer_ids_facturas(request.args['ids']), None
+        else:
+            ids, filtros = None, leer_filtros_facturas(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        siguiente_cursor = None
+        with conexion_bd() as conn:
+            if ids is None:
+                facturas, siguiente_cursor = pagina_facturas(conn, filtros)
+                ids = [f['id'] for f in facturas]
+            detalles = detalles_por_factura(conn, ids)
+        
+        respuesta = {'success': True, 'detalles': {str(k): v for k, v in detalles.items()}}
+        if filtros is not None:
+            respuesta['siguiente_cursor'] = siguiente_cursor
+        return jsonify(respuesta)
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_factura():
     """Subir una factura PDF a la carpeta Facturas"""
@@ -112,16 +395,36 @@ def upload_factura():
         
         file.save(filepath)
         
+        # Extraer, parsear y cargar solo esta factura en segundo plano
+        job_id = cola.encolar(f'Ingesta de {filename}', ingerir_archivos, [filename], FACTURAS_FOLDER)
+        
         return jsonify({
             'success': True, 
-            'message': f'Factura {filename} subida correctamente. Ejecuta el procesador ETL para cargarla a la BD.',
-            'filename': filename
-        })
+            'message': f'Factura {filename} subida correctamente. Procesándola...',
+            'filename': filename,
+            'job_id': job_id
+        }), 202
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Estado de un trabajo de ingesta ('en_cola', 'iniciado', 'extrayendo', 'cargando', 'completado' o 'error')"""
+    trabajo = cola.estado(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, 'job': trabajo})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en formato Prometheus (ver `metricas`): solicitudes,
+    caché y las etapas del ETL de las facturas ingeridas desde la web."""
+    return app.response_class(formato_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🚀 Aplicación Web de Gestión de Facturas")
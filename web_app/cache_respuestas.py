@@ -0,0 +1,71 @@
+"""Caché en memoria de respuestas de la API con ETag.
+
+Los datos de la BD solo cambian cuando el ETL carga facturas, y cada carga
+incrementa el contador `generacion` de la tabla `Metadatos`
+(`conexion.incrementar_generacion`). Las respuestas se guardan con la
+generación en la clave; cuando la generación cambia, la caché se vacía.
+
+Para no consultar la generación en cada request, se relee como mucho cada
+`intervalo_generacion` segundos. Además cada entrada vence a los `ttl`
+segundos y, si se supera `tamano`, se descarta la menos usada (LRU).
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CacheRespuestas:
+    """Caché LRU + TTL de `clave -> (cuerpo, etag)`, segura entre hilos."""
+
+    def __init__(self, leer_generacion, tamano=256, ttl=300, intervalo_generacion=2):
+        self._leer_generacion = leer_generacion
+        self.tamano = tamano
+        self.ttl = ttl
+        self.intervalo_generacion = intervalo_generacion
+        self._entradas = OrderedDict()   # clave -> (cuerpo, etag, vence_en)
+        self._lock = threading.Lock()
+        self._generacion = None
+        self._generacion_leida_en = 0.0
+
+    def generacion(self):
+        """Generación actual de los datos (releída como mucho cada `intervalo_generacion`)."""
+        ahora = time.monotonic()
+        with self._lock:
+            if self._generacion is not None and ahora - self._generacion_leida_en < self.intervalo_generacion:
+                return self._generacion
+        generacion = self._leer_generacion()
+        with self._lock:
+            if generacion != self._generacion:
+                self._entradas.clear()
+            self._generacion = generacion
+            self._generacion_leida_en = ahora
+        return generacion
+
+    def obtener(self, clave):
+        """Retorna `(cuerpo, etag)` o None si no está o venció."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            cuerpo, etag, vence_en = entrada
+            if time.monotonic() >= vence_en:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return cuerpo, etag
+
+    def guardar(self, clave, cuerpo):
+        """Guarda `cuerpo` (bytes) y retorna su ETag."""
+        etag = hashlib.sha1(cuerpo).hexdigest()
+        with self._lock:
+            self._entradas[clave] = (cuerpo, etag, time.monotonic() + self.ttl)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+        return etag
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
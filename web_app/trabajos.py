@@ -0,0 +1,79 @@
+"""Cola de trabajos en segundo plano para la aplicación web.
+
+Cada trabajo es una función que se ejecuta en un hilo del pool; su estado
+('en_cola', etapas intermedias, 'completado' o 'error') se consulta con
+`ColaTrabajos.estado`. Con un solo worker (por defecto) los trabajos se
+ejecutan de a uno, en el orden en que llegaron.
+
+Los estados viven en memoria: se pierden al reiniciar el servidor y solo se
+conservan los últimos `max_terminados` trabajos finalizados.
+"""
+
+import time
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+ESTADOS_FINALES = ('completado', 'error')
+
+
+class ColaTrabajos:
+
+    def __init__(self, workers=1, max_terminados=200):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='trabajo')
+        self._trabajos = OrderedDict()   # id -> dict de estado
+        self._lock = threading.Lock()
+        self.max_terminados = max_terminados
+
+    def _actualizar(self, trabajo_id, **cambios):
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is not None:
+                trabajo.update(cambios, actualizado_en=time.time())
+
+    def _podar(self):
+        terminados = [k for k, t in self._trabajos.items() if t['estado'] in ESTADOS_FINALES]
+        for k in terminados[:max(0, len(terminados) - self.max_terminados)]:
+            del self._trabajos[k]
+
+    def encolar(self, descripcion, funcion, *args, **kwargs):
+        """Encola `funcion(*args, progreso=..., **kwargs)` y retorna el id del trabajo.
+
+        `funcion` recibe `progreso(etapa)` para informar su avance; su valor
+        de retorno queda en `resultado`.
+        """
+        trabajo_id = uuid.uuid4().hex
+        ahora = time.time()
+        with self._lock:
+            self._podar()
+            self._trabajos[trabajo_id] = {
+                'id': trabajo_id,
+                'descripcion': descripcion,
+                'estado': 'en_cola',
+                'creado_en': ahora,
+                'actualizado_en': ahora,
+                'resultado': None,
+                'error': None,
+            }
+
+        def ejecutar():
+            progreso = lambda etapa: self._actualizar(trabajo_id, estado=etapa)
+            progreso('iniciado')
+            try:
+                resultado = funcion(*args, progreso=progreso, **kwargs)
+                self._actualizar(trabajo_id, estado='completado', resultado=resultado)
+            except Exception as e:
+                traceback.print_exc()
+                self._actualizar(trabajo_id, estado='error', error=str(e))
+
+        self._executor.submit(ejecutar)
+        return trabajo_id
+
+    def estado(self, trabajo_id):
+        """Copia del estado del trabajo, o None si no existe."""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            return dict(trabajo) if trabajo is not None else None